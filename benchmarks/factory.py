@@ -0,0 +1,67 @@
+"""Cost of hook creation by alias with many registered aliases.
+
+Thousands of hook classes are registered in HookAndProviderFactory, then hooks are created
+by alias. Creation through the read-only view of the registry is compared with copying the
+whole registry before every lookup, shallow as get_hooks() does and deep as create_hook did
+before.
+
+Usage:
+    python -m benchmarks.factory [--aliases 100 1000 10000] [--creations 10000]
+        [--deepcopy-creations 100]
+"""
+import argparse
+import copy
+import time
+
+from phf.abstracthook import AbstractHook
+from phf.factory import HookAndProviderFactory
+
+
+def _make_factory(aliases_amount: int) -> HookAndProviderFactory:
+    """Create factory with aliases_amount hook classes, each with one extra alias."""
+    factory = HookAndProviderFactory()
+    analyser = factory._hook_analyser
+    for i in range(aliases_amount // 2):
+        cls = type(f"Hook{i}", (AbstractHook,), {"_alias": [f"hook{i}"]})
+        analyser._add_class_to_dict(cls.__name__, cls)
+        analyser._add_class_to_dict(f"hook{i}", cls)
+    return factory
+
+
+def _measure(create, aliases_amount: int, creations: int) -> float:
+    """Return mean time of one creation in microseconds."""
+    aliases = [f"hook{i % (aliases_amount // 2)}" for i in range(creations)]
+    start = time.perf_counter()
+    for alias in aliases:
+        create(alias)
+    return (time.perf_counter() - start) / creations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--aliases", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--creations", type=int, default=10000)
+    parser.add_argument("--deepcopy-creations", type=int, default=100)
+    args = parser.parse_args()
+
+    for aliases_amount in args.aliases:
+        factory = _make_factory(aliases_amount)
+        analyser = factory._hook_analyser
+
+        def _create_with_copy(alias):
+            return analyser.get_hooks()[alias]()
+
+        def _create_with_deepcopy(alias):
+            return copy.deepcopy(analyser._classes)[alias]()
+
+        view_time = _measure(factory.create_hook, aliases_amount, args.creations)
+        copy_time = _measure(_create_with_copy, aliases_amount, args.creations)
+        deepcopy_time = _measure(_create_with_deepcopy, aliases_amount, args.deepcopy_creations)
+        print(f"{aliases_amount} aliases: create_hook {view_time:.2f} us, "
+              f"with registry copy {copy_time:.2f} us, "
+              f"with registry deepcopy {deepcopy_time:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
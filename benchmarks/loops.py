@@ -0,0 +1,81 @@
+"""Comparison of PHFSystem throughput on default asyncio loop and uvloop.
+
+A PeriodicContentProvider with period 0 pushes integers through several hooks, the
+amount of finished ticks per second is printed for every available loop.
+
+Usage:
+    python -m benchmarks.loops [--hooks 10] [--duration 3]
+"""
+import argparse
+import asyncio
+import time
+
+from phf.abstracthook import AbstractHook
+from phf.phfsystem import uvloop
+from phf.provider import PeriodicContentProvider
+
+
+class CountingProvider(PeriodicContentProvider):
+    """Provider that counts finished ticks."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(period=0, *args, **kwargs)
+        self.ticks = 0
+
+    async def get_content(self):
+        return self.ticks
+
+    async def result_callback(self, results):
+        self.ticks += 1
+
+
+class EchoHook(AbstractHook):
+    """Hook that just returns received data."""
+
+    async def hook_action(self, data):
+        return data
+
+
+async def _measure(hooks_amount: int, duration: float) -> float:
+    provider = CountingProvider()
+    for _ in range(hooks_amount):
+        provider.add_hook(EchoHook())
+    provider.start()
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    ticks = provider.ticks
+    elapsed = time.perf_counter() - start
+    provider.stop()
+    await asyncio.sleep(0)
+    return ticks / elapsed
+
+
+def run(loop_factory, hooks_amount: int, duration: float) -> float:
+    """Measure ticks per second on a loop created by loop_factory."""
+    loop = loop_factory()
+    try:
+        return loop.run_until_complete(_measure(hooks_amount, duration))
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hooks", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=3)
+    args = parser.parse_args()
+
+    loops = {"asyncio": asyncio.new_event_loop}
+    if uvloop is not None:
+        loops["uvloop"] = uvloop.new_event_loop
+    else:
+        print("uvloop is not installed, only asyncio loop is measured")
+
+    for name, loop_factory in loops.items():
+        ticks_per_second = run(loop_factory, args.hooks, args.duration)
+        print(f"{name}: {ticks_per_second:.0f} ticks/s with {args.hooks} hooks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""Throughput, latency and memory of standard provider/hook topologies.
+
+Every scenario runs a topology for a while and records latency of every item: from
+get_content of a provider to it's result_callback, or a round trip of a MessageSystem
+message. Scenarios:
+
+- periodic_1x1: PeriodicContentProvider with period 0 and 1 hook;
+- periodic_1x100: PeriodicContentProvider with 100 hooks;
+- broadcast_1x100: the same with a broadcast channel instead of a queue per hook;
+- periodic_1000x1: 1000 PeriodicContentProviders with 1 hook each;
+- blocking_1x1: BlockingContentProvider with 1 hook, get_content runs in it's thread;
+- message_system_async: ComplexContentProvider with 1 hook, send_wait_answer_async is
+  called in the system's loop;
+- message_system_threads: ComplexContentProvider with 1 hook, PHFSystem runs in other thread
+  and send_wait_answer is called from the main thread.
+
+Memory is measured in a separate shorter run of every scenario with tracemalloc, as tracing
+slows everything down. Results are printed as JSON or written to a file, so runs of different
+releases can be compared. Nothing is sent over network.
+
+Usage:
+    python -m benchmarks.runtime [--scenarios periodic_1x1 ...] [--duration 3]
+        [--memory-duration 0.5] [--loop asyncio|uvloop] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import typing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from phf.abstracthook import AbstractHook
+from phf.phfsystem import PHFSystem, uvloop
+from phf.provider import BlockingContentProvider, ComplexContentProvider, \
+    PeriodicContentProvider
+
+
+class EchoHook(AbstractHook):
+    """Hook that just returns received data."""
+
+    async def hook_action(self, data):
+        return data
+
+
+class TimingPeriodicProvider(PeriodicContentProvider):
+    """Provider, that sends creation time of data and records latencies of results."""
+
+    def __init__(self, latencies: typing.List[float], *args, **kwargs):
+        super().__init__(period=0, *args, **kwargs)
+        self.latencies = latencies
+
+    async def get_content(self):
+        return time.perf_counter()
+
+    async def result_callback(self, results):
+        self.latencies.append(time.perf_counter() - results[0])
+
+
+class TimingBlockingProvider(BlockingContentProvider):
+    """Blocking provider, that sends creation time of data and records latencies of results."""
+
+    def __init__(self, latencies: typing.List[float], *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = latencies
+
+    async def get_content(self):
+        return time.perf_counter()
+
+    async def result_callback(self, results):
+        self.latencies.append(time.perf_counter() - results[0])
+
+
+def _new_system(loop_factory) -> PHFSystem:
+    return PHFSystem(loop_factory=loop_factory)
+
+
+async def _run_periodic(loop_factory, duration: float, providers_amount: int,
+                        hooks_amount: int, broadcast: bool = False) -> typing.List[float]:
+    latencies = []
+    phfsys = _new_system(loop_factory)
+    for _ in range(providers_amount):
+        provider = TimingPeriodicProvider(latencies)
+        if broadcast:
+            provider.set_broadcast()
+        provider.add_hooks([EchoHook() for _ in range(hooks_amount)])
+        phfsys.add_provider(provider)
+    await phfsys.start_async()
+    await asyncio.sleep(duration)
+    measured = latencies[:]
+    await phfsys.stop_async(drain=False)
+    return measured
+
+
+async def _run_blocking(loop_factory, duration: float) -> typing.List[float]:
+    latencies = []
+    phfsys = _new_system(loop_factory)
+    provider = TimingBlockingProvider(latencies)
+    provider.add_hook(EchoHook())
+    phfsys.add_provider(provider)
+    await phfsys.start_async()
+    await asyncio.sleep(duration)
+    measured = latencies[:]
+    await phfsys.stop_async(drain=False)
+    return measured
+
+
+async def _run_message_system_async(loop_factory, duration: float) -> typing.List[float]:
+    phfsys = _new_system(loop_factory)
+    provider = ComplexContentProvider()
+    provider.add_hook(EchoHook())
+    phfsys.add_provider(provider)
+    message_system = provider.get_message_system()
+    await phfsys.start_async()
+    latencies = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        await message_system.send_wait_answer_async(start)
+        latencies.append(time.perf_counter() - start)
+    await phfsys.stop_async()
+    return latencies
+
+
+def _run_message_system_threads(loop_factory, duration: float) -> typing.List[float]:
+    phfsys = _new_system(loop_factory)
+    provider = ComplexContentProvider()
+    provider.add_hook(EchoHook())
+    phfsys.add_provider(provider)
+    message_system = provider.get_message_system()
+    thread = threading.Thread(target=phfsys.start)
+    thread.start()
+    # The first message waits till the system is started
+    message_system.send_wait_answer(None)
+    latencies = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        message_system.send_wait_answer(start)
+        latencies.append(time.perf_counter() - start)
+    phfsys.stop()
+    thread.join()
+    return latencies
+
+
+def _in_new_loop(coroutine_function):
+    """Make a scenario, that runs coroutine_function in a new loop, from it."""
+    def _scenario(loop_factory, duration: float) -> typing.List[float]:
+        loop = loop_factory()
+        try:
+            return loop.run_until_complete(coroutine_function(loop_factory, duration))
+        finally:
+            loop.close()
+    return _scenario
+
+
+SCENARIOS = {
+    "periodic_1x1": _in_new_loop(lambda loop_factory, duration:
+                                 _run_periodic(loop_factory, duration, 1, 1)),
+    "periodic_1x100": _in_new_loop(lambda loop_factory, duration:
+                                   _run_periodic(loop_factory, duration, 1, 100)),
+    "broadcast_1x100": _in_new_loop(lambda loop_factory, duration:
+                                    _run_periodic(loop_factory, duration, 1, 100, True)),
+    "periodic_1000x1": _in_new_loop(lambda loop_factory, duration:
+                                    _run_periodic(loop_factory, duration, 1000, 1)),
+    "blocking_1x1": _in_new_loop(_run_blocking),
+    "message_system_async": _in_new_loop(_run_message_system_async),
+    "message_system_threads": _run_message_system_threads,
+}
+
+
+def _percentile(sorted_values: typing.List[float], fraction: float) -> typing.Optional[float]:
+    """Return nearest-rank percentile of sorted values or None if there are none."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(name: str, loop_factory, duration: float,
+                 memory_duration: float) -> typing.Dict[str, typing.Any]:
+    """Run scenario twice, for timings and for memory, and return it's results.
+
+    Returns:
+        Dict with amount of items, throughput in items per second, latencies in seconds and
+        peak memory traced by tracemalloc in bytes.
+    """
+    scenario = SCENARIOS[name]
+    start = time.perf_counter()
+    latencies = scenario(loop_factory, duration)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    peak_memory = None
+    if memory_duration > 0:
+        tracemalloc.start()
+        try:
+            scenario(loop_factory, memory_duration)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "items": len(latencies),
+        "duration": duration,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / duration,
+        "latency_mean": statistics.fmean(latencies) if latencies else None,
+        "latency_p50": _percentile(latencies, 0.5),
+        "latency_p99": _percentile(latencies, 0.99),
+        "latency_max": latencies[-1] if latencies else None,
+        "peak_memory": peak_memory,
+    }
+
+
+def _environment(loop_name: str) -> typing.Dict[str, typing.Any]:
+    """Return description of the environment for the results."""
+    environment = {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "loop": loop_name,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    if resource is not None:
+        environment["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return environment
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument("--memory-duration", type=float, default=0.5,
+                        help="duration of the memory run, 0 to skip it")
+    parser.add_argument("--loop", choices=["asyncio", "uvloop"], default="asyncio")
+    parser.add_argument("--output", help="file to write JSON to, stdout if not set")
+    args = parser.parse_args()
+
+    if args.loop == "uvloop":
+        if uvloop is None:
+            parser.error("uvloop is not installed")
+        loop_factory = uvloop.new_event_loop
+    else:
+        loop_factory = asyncio.new_event_loop
+
+    results = []
+    for name in args.scenarios:
+        print(f"Running {name}...", file=sys.stderr)
+        results.append(run_scenario(name, loop_factory, args.duration, args.memory_duration))
+    report = {"environment": _environment(args.loop), "results": results}
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
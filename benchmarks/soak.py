@@ -0,0 +1,66 @@
+"""Soak test of hooks under synthetic load, see phf.loadgen.
+
+Hooks are created by their aliases from given paths and attached to a LoadGeneratorProvider.
+Samples of throughput, latency percentiles, queue depths and RSS over time and a summary are
+printed as JSON or written to a file. Nothing is sent over network.
+
+Usage:
+    python -m benchmarks.soak --hook-paths hooks --hooks DivisionCheckHook '["MyHook", [2], {}]'
+        [--duration 60] [--rate 1000] [--payload-size 1024 | --payload-size lognormal 4096 1]
+        [--burst 1] [--sample-interval 1] [--seed 0] [--output report.json]
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from phf.loadgen import run_soak
+
+
+def _payload_size(values):
+    """Make payload size argument of run_soak from command line values."""
+    if len(values) == 1:
+        return int(values[0])
+    kind, *params = values
+    if kind == "choice":
+        return kind, [int(value) for value in params]
+    return (kind,) + tuple(float(value) if kind == "lognormal" and i else int(value)
+                           for i, value in enumerate(params))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hooks", nargs="+", required=True,
+                        help='aliases of hooks or JSON lists like \'["MyHook", [1], {}]\'')
+    parser.add_argument("--hook-paths", nargs="+", default=[])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--rate", type=float, default=100, help="items per second")
+    parser.add_argument("--payload-size", nargs="+", default=["1024"],
+                        help="bytes or distribution: fixed N, uniform MIN MAX, "
+                             "lognormal MEDIAN SIGMA, choice N ...")
+    parser.add_argument("--burst", type=int, default=1, help="items sent at once")
+    parser.add_argument("--sample-interval", type=float, default=1)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="file to write JSON to, stdout if not set")
+    args = parser.parse_args()
+
+    try:
+        payload_size = _payload_size(args.payload_size)
+    except ValueError as error:
+        parser.error(f"wrong --payload-size: {error}")
+
+    hooks = [json.loads(hook) if hook.startswith("[") else hook for hook in args.hooks]
+    report = asyncio.run(run_soak(hooks, args.hook_paths, duration=args.duration,
+                                  rate=args.rate, payload_size=payload_size, burst=args.burst,
+                                  sample_interval=args.sample_interval, seed=args.seed))
+    if args.output is None:
+        json.dump(report.to_dict(), sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report.to_dict(), file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from . import abstracthook
 from . import commandinput
 from . import provider
+from . import sharding
+from . import supervisor
 from . import utils
 from .phfsystem import PHFSystem
 
-__all__ = ["abstracthook", "commandinput", "provider", "utils", "PHFSystem"]
+__all__ = ["abstracthook", "commandinput", "provider", "sharding", "supervisor", "utils", "PHFSystem"]
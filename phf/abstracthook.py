@@ -2,8 +2,15 @@ from __future__ import annotations
 
 import asyncio
 import copy
+import itertools
+import time
 import typing
 
+from .codec import Codec, EncodedPayload
+from .tracing import TracedItem
+
+_hook_ids = itertools.count()
+
 
 class AbstractHook:
     """Base hook class for all other hooks.
@@ -16,11 +23,17 @@ class AbstractHook:
 
     Class attributes:
         _alias: List of strings, alases for the class.
+        _accepts_encoded: bool, whether hook_action gets codec.EncodedPayload from providers
+            with codecs as is, otherwise it's decoded before hook_action.
 
     Attributes:
         _asyncio_queue: asyncio.Queue obj to transport data from provider to hook.
         _callback_queue: asyncio.Queue obj to transport data from hook to provider.
         _provider: provider.AbstractContentProvider obj, hooks target.
+        _id: int, unique id of the hook, never changes.
+        _name: str or None, optional unique name of the hook in PHFSystem.
+        _stats: metrics.HookStats or None, counters of the hook when metrics are enabled.
+        _codec: codec.Codec or None, codec to send data to other processes with.
 
     Example:
         Creating a simple MyHook class with some aliases that prints "MyHook!" every
@@ -34,6 +47,7 @@ class AbstractHook:
                 return "MyHook!
     """
     _alias = []
+    _accepts_encoded = False
 
     def __new__(cls, *args, **kwargs):
         obj = object.__new__(cls)
@@ -41,11 +55,60 @@ class AbstractHook:
         obj._callback_queue = None
         obj._provider = None
         obj._running = False
+        obj._id = next(_hook_ids)
+        obj._name = None
+        obj._stats = None
+        obj._codec = None
         return obj
 
     def __init__(self, *args, **kwargs):
         pass
 
+    def get_id(self) -> int:
+        """Return unique id of the hook."""
+        return self._id
+
+    def get_name(self) -> typing.Optional[str]:
+        """Return name of the hook or None if it has no name."""
+        return self._name
+
+    def set_name(self, name: str) -> None:
+        """Set name of the hook, it has to be done before hook is added to PHFSystem.
+
+        Args:
+            name: name, unique in PHFSystem.
+        """
+        self._name = name
+
+    def set_codec(self, codec: typing.Optional[Codec]) -> None:
+        """Set codec to send data to other processes with, see codec module.
+
+        It's used only by hooks, that send data to other processes, when their provider
+        doesn't encode data itself.
+        """
+        self._codec = codec
+
+    def get_codec(self) -> typing.Optional[Codec]:
+        """Return codec of the hook or of it's provider if the hook has none."""
+        if self._codec is None and self._provider is not None:
+            return self._provider.get_codec()
+        return self._codec
+
+    def _copy_with_class(self, cls: typing.Type[AbstractHook]) -> AbstractHook:
+        """Create an object of cls with the same state, used to reload hook's class.
+
+        __init__ isn't called, all attributes(including id and queues) are copied.
+
+        Args:
+            cls: new class of the hook.
+
+        Returns:
+            The new hook.
+        """
+        hook = cls.__new__(cls)
+        hook.__dict__.update(self.__dict__)
+        return hook
+
     def get_straight_queue(self) -> asyncio.Queue:
         """Create if not created and return provider -> hook queue.
 
@@ -71,26 +134,83 @@ class AbstractHook:
         return self._running
 
     # TODO better stop
-    def stop(self) -> None:
-        """Stops the hook."""
-        self._running = False
+    def stop(self, drain: bool = False) -> None:
+        """Stops the hook.
+
+        Args:
+            drain: if True, hook stops only after processing all data that is already
+                in it's queue.
+        """
+        if not drain:
+            self._running = False
         self.get_straight_queue().put_nowait(asyncio.CancelledError())
 
     async def cycle_call(self) -> None:
         """Make hook start doing its work.
 
         In a cycle hook gets data from provider, executes hook_action and sends it's result
-        to provider.
+        to provider. If hook_action raises an exception, the exception object itself is sent
+        to provider as the result, so the provider never waits for a result that won't come.
         Can be stopped.
         """
         self._running = True
         while self._is_running():
             target = await self.get_straight_queue().get()
             if isinstance(target, asyncio.CancelledError):
+                self._running = False
                 break
-            result = await self.hook_action(target)
+            if self._stats is not None or isinstance(target, (TracedItem, EncodedPayload)):
+                result = await self._call_hook_action(target)
+            else:
+                try:
+                    result = await self.hook_action(target)
+                except Exception as exception:
+                    result = exception
             self.get_callback_queue().put_nowait(result)
 
+    async def _call_hook_action(self, target: typing.Any) -> typing.Any:
+        """Run hook_action on data from provider, exception is returned as the result.
+
+        Traced and encoded data is unwrapped and duration of hook_action is counted if metrics
+        are enabled.
+        """
+        stats = self._stats
+        start = time.perf_counter() if stats is not None else None
+        if isinstance(target, TracedItem):
+            result = await self._call_traced_hook_action(target)
+        else:
+            try:
+                result = await self.hook_action(self._decode(target))
+            except Exception as exception:
+                result = exception
+        if stats is not None:
+            stats.observe(time.perf_counter() - start, isinstance(result, Exception))
+        return result
+
+    def _decode(self, data: typing.Any) -> typing.Any:
+        """Decode data, encoded by provider's codec, if the hook doesn't accept it encoded."""
+        if isinstance(data, EncodedPayload) and not self._accepts_encoded:
+            return data.decode()
+        return data
+
+    async def _call_traced_hook_action(self, target: TracedItem) -> typing.Any:
+        """Unwrap data of a traced tick and run hook_action on it.
+
+        Time the data waited in the queue and hook_action are recorded as spans on the hook's
+        track.
+        """
+        tick = target.tick
+        tid = self._id + 1
+        if (tick.pid, tid) not in tick.tracer._track_names:
+            tick.tracer.name_track(tick.pid, tid, f"{type(self).__name__} #{self._id}")
+        tick.tracer.add_span("queued", target.enqueued, time.perf_counter(), tick.pid, tid,
+                             {"hook": self._id, "sequence": tick.sequence})
+        try:
+            with tick.span("hook_action", tid=tid, hook=self._id):
+                return await self.hook_action(self._decode(target.data))
+        except Exception as exception:
+            return exception
+
     async def hook_action(self, data: typing.Any) -> typing.Any:
         """Do hook action on the data provided by provider.
 
@@ -0,0 +1,215 @@
+"""Broadcast channel from a provider to all it's hooks.
+
+By default a provider puts every data to a separate straight queue of every hook, so with H hooks
+every data costs H queue operations and memory of queues grows as H × backlog. A provider with
+a broadcast channel(see AbstractContentProvider.set_broadcast) stores every data once in a
+bounded ring buffer, and every hook reads it with it's own cursor.
+
+The ring buffer is bounded: when it's full, the provider waits till the slowest hook reads it's
+oldest data, so the slowest hook defines backpressure.
+
+Hooks see their cursor as a usual straight queue(BroadcastReader has get, get_nowait,
+put_nowait, qsize and empty of asyncio.Queue), data put to a reader directly goes only to it's
+hook, after all data already in the channel.
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import typing
+
+
+class BroadcastChannel:
+    """Bounded ring buffer with a cursor per reader.
+
+    Data number n is stored in _ring[n % capacity] till all readers read it.
+
+    Attributes:
+        _capacity: int, maximum amount of data, that isn't read by all readers.
+        _ring: list of stored data.
+        _head: int, number of the oldest stored data.
+        _tail: int, number of the next data to put.
+        _cursors: collections.Counter {cursor: amount of readers at it}.
+        _readers_amount: int, amount of attached readers.
+        _data_waiter: asyncio.Future or None, readers wait it for new data.
+        _space_waiter: asyncio.Future or None, a writer waits it for free space.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """Create the channel.
+
+        Args:
+            capacity: maximum amount of data, that isn't read by all readers.
+
+        Raises:
+            ValueError: if capacity is less than 1.
+        """
+        if capacity < 1:
+            raise ValueError(f"Capacity has to be at least 1, got {capacity}")
+        self._capacity = capacity
+        self._ring = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self._cursors = collections.Counter()
+        self._readers_amount = 0
+        self._data_waiter = None
+        self._space_waiter = None
+
+    def get_capacity(self) -> int:
+        """Return maximum amount of data, that isn't read by all readers."""
+        return self._capacity
+
+    def get_readers_amount(self) -> int:
+        """Return amount of attached readers."""
+        return self._readers_amount
+
+    def qsize(self) -> int:
+        """Return amount of data, that isn't read by all readers."""
+        return self._tail - self._head
+
+    def full(self) -> bool:
+        """Return whether put has to wait for the slowest reader."""
+        return self._tail - self._head >= self._capacity
+
+    def add_reader(self) -> BroadcastReader:
+        """Create a reader, that reads data put after it's creation."""
+        self._attach(self._tail)
+        return BroadcastReader(self, self._tail)
+
+    async def put(self, data: typing.Any) -> None:
+        """Put data for all readers, wait while the ring buffer is full."""
+        while self.full():
+            if self._space_waiter is None:
+                self._space_waiter = asyncio.get_running_loop().create_future()
+            await self._space_waiter
+        self.put_nowait(data)
+
+    def put_nowait(self, data: typing.Any) -> None:
+        """Put data for all readers.
+
+        Raises:
+            asyncio.QueueFull: if the ring buffer is full.
+        """
+        if self.full():
+            raise asyncio.QueueFull
+        if self._readers_amount:
+            self._ring[self._tail % self._capacity] = data
+            self._tail += 1
+        else:
+            # Nobody would read it
+            self._head = self._tail = self._tail + 1
+        self._wake_readers()
+
+    def _wake_readers(self) -> None:
+        """Wake all readers waiting for data, every waiting hook is woken by one future."""
+        waiter, self._data_waiter = self._data_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _attach(self, cursor: int) -> None:
+        """Count a new reader at cursor, it can't be before the head."""
+        self._cursors[cursor] += 1
+        self._readers_amount += 1
+
+    def _move(self, cursor: int, new_cursor: typing.Optional[int]) -> None:
+        """Move a reader from cursor to new_cursor, None detaches it."""
+        self._cursors[cursor] -= 1
+        if not self._cursors[cursor]:
+            del self._cursors[cursor]
+        if new_cursor is None:
+            self._readers_amount -= 1
+        else:
+            self._cursors[new_cursor] += 1
+        if cursor == self._head:
+            self._advance_head()
+
+    def _advance_head(self) -> None:
+        """Forget data, that is read by all readers, and wake a waiting writer."""
+        while self._head < self._tail and self._head not in self._cursors:
+            self._ring[self._head % self._capacity] = None
+            self._head += 1
+        if self._space_waiter is not None and not self.full():
+            waiter, self._space_waiter = self._space_waiter, None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _wait_data(self) -> None:
+        """Wait till new data is put."""
+        if self._data_waiter is None:
+            self._data_waiter = asyncio.get_running_loop().create_future()
+        await self._data_waiter
+
+
+class BroadcastReader:
+    """Cursor of a hook in BroadcastChannel, used as hook's straight queue.
+
+    Attributes:
+        _channel: BroadcastChannel or None if the reader is closed.
+        _cursor: int, number of the next data to read.
+        _private: collections.deque of (position, data), data put to this reader only, it's
+            read when the cursor reaches position.
+    """
+
+    def __init__(self, channel: BroadcastChannel, cursor: int):
+        self._channel = channel
+        self._cursor = cursor
+        self._private = collections.deque()
+
+    def close(self) -> None:
+        """Detach from the channel, the reader gets only it's private data after it."""
+        if self._channel is not None:
+            self._channel._move(self._cursor, None)
+            self._channel = None
+
+    def transfer(self) -> BroadcastReader:
+        """Create a reader at the same place, that takes all unread data of this one.
+
+        This reader is closed, so it gets only data put to it after the transfer.
+        """
+        self._channel._attach(self._cursor)
+        reader = BroadcastReader(self._channel, self._cursor)
+        reader._private, self._private = self._private, collections.deque()
+        self.close()
+        return reader
+
+    def qsize(self) -> int:
+        """Return amount of data, that isn't read yet."""
+        shared = self._channel._tail - self._cursor if self._channel is not None else 0
+        return shared + len(self._private)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def put_nowait(self, data: typing.Any) -> None:
+        """Put data for this reader only, after all data already put to the channel."""
+        position = self._channel._tail if self._channel is not None else self._cursor
+        self._private.append((position, data))
+        if self._channel is not None:
+            self._channel._wake_readers()
+
+    def get_nowait(self) -> typing.Any:
+        """Return the next data.
+
+        Raises:
+            asyncio.QueueEmpty: if there is no data.
+        """
+        channel = self._channel
+        if self._private and (channel is None or self._private[0][0] <= self._cursor):
+            return self._private.popleft()[1]
+        if channel is None or self._cursor == channel._tail:
+            raise asyncio.QueueEmpty
+        cursor = self._cursor
+        data = channel._ring[cursor % channel._capacity]
+        self._cursor += 1
+        channel._move(cursor, self._cursor)
+        return data
+
+    async def get(self) -> typing.Any:
+        """Wait for the next data and return it."""
+        while True:
+            try:
+                return self.get_nowait()
+            except asyncio.QueueEmpty:
+                if self._channel is None:
+                    raise
+            await self._channel._wait_data()
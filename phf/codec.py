@@ -0,0 +1,350 @@
+"""Payload codecs and zero-copy transport of payloads between processes.
+
+Inside one process data goes from providers to hooks as live objects. When it has to cross
+a process boundary(see processhook.ProcessHook), it's serialized by a codec into an
+EncodedPayload: a small header and a list of big buffers. Buffers are never copied by the
+codec, they are memoryviews of the original objects, so a multi-MB blob is copied only by the
+transport itself.
+
+Codecs:
+
+- PickleCodec - pickle protocol 5, bytes-like objects and buffers of objects supporting
+  pickle.PickleBuffer(like numpy arrays) bigger than min_buffer_size are sent out-of-band.
+  Big bytes and bytearray objects and all memoryviews are decoded as read-only memoryviews.
+- MsgpackCodec - msgpack, only for simple types, needs msgpack package.
+- RawCodec - only bytes-like objects, they are sent as a single buffer and decoded as
+  memoryviews.
+
+A codec is chosen per provider with AbstractContentProvider.set_codec: then data is encoded
+once in the provider and all it's hooks get the same EncodedPayload. Hooks in the same process
+decode it themselves, so they get it's copy, that shares big buffers with the original. A codec
+can also be chosen per hook with AbstractHook.set_codec, it's used by hooks, that send data
+to other processes, if the provider doesn't encode data.
+
+send_payload and recv_payload move payloads through multiprocessing connections. Buffers
+bigger than shared_memory_threshold are put to multiprocessing.shared_memory, the receiver
+maps them without copying.
+"""
+from __future__ import annotations
+
+import io
+import pickle
+import typing
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class EncodedPayload:
+    """Serialized data.
+
+    Attributes:
+        codec: Codec, that encoded the data.
+        header: bytes, serialized data without big buffers.
+        buffers: list of memoryview, big buffers of the data.
+    """
+
+    __slots__ = ("codec", "header", "buffers")
+
+    def __init__(self, codec: Codec, header: bytes, buffers: typing.List[memoryview] = ()):
+        self.codec = codec
+        self.header = header
+        self.buffers = list(buffers)
+
+    def decode(self) -> typing.Any:
+        """Return deserialized data, big buffers are shared with the original data."""
+        return self.codec.decode(self.header, self.buffers)
+
+    def get_size(self) -> int:
+        """Return size of the header and all buffers in bytes."""
+        return len(self.header) + sum(buffer.nbytes for buffer in self.buffers)
+
+
+class Codec:
+    """Basic class for codecs.
+
+    To make a codec, inherit this class, set name and override encode and decode.
+    Codecs are registered by their names with register_codec, so a receiving process can
+    find the codec by name.
+
+    Class attributes:
+        name: str, unique name of the codec.
+    """
+    name = None
+
+    def encode(self, data: typing.Any) -> EncodedPayload:
+        """Serialize data, not implemented.
+
+        Raises:
+            TypeError: if the data can't be encoded by the codec.
+        """
+        raise NotImplementedError(f"encode of {self.__class__} not overridden")
+
+    def decode(self, header: bytes, buffers: typing.List[memoryview]) -> typing.Any:
+        """Deserialize data, not implemented."""
+        raise NotImplementedError(f"decode of {self.__class__} not overridden")
+
+
+class _OutOfBandPickler(pickle.Pickler):
+    """Pickler, that takes big buffers out of the pickle.
+
+    Big bytes, bytearray and memoryview objects and pickle.PickleBuffer objects, made by
+    types supporting protocol 5, are replaced by their numbers in the list of buffers.
+
+    Attributes:
+        buffers: list of memoryview, taken buffers.
+        _min_buffer_size: int, smaller objects are pickled in-band.
+    """
+
+    def __init__(self, file, min_buffer_size: int):
+        super().__init__(file, protocol=5)
+        self.buffers = []
+        self._min_buffer_size = min_buffer_size
+
+    def persistent_id(self, obj):
+        if type(obj) not in (bytes, bytearray, memoryview, pickle.PickleBuffer):
+            return None
+        view = obj.raw() if type(obj) is pickle.PickleBuffer else memoryview(obj)
+        if view.nbytes < self._min_buffer_size or not view.c_contiguous:
+            if type(obj) is memoryview:
+                # memoryview can't be pickled, small ones are sent as bytes
+                return "bytes", view.tobytes()
+            return None
+        self.buffers.append(view.cast("B"))
+        return "buffer", len(self.buffers) - 1
+
+
+class _OutOfBandUnpickler(pickle.Unpickler):
+    """Unpickler, that puts buffers taken by _OutOfBandPickler back as read-only memoryviews.
+
+    Attributes:
+        _buffers: list of memoryview.
+    """
+
+    def __init__(self, file, buffers: typing.List[memoryview]):
+        super().__init__(file)
+        self._buffers = buffers
+
+    def persistent_load(self, pid):
+        kind, value = pid
+        if kind == "bytes":
+            return memoryview(value).toreadonly()
+        return self._buffers[value].toreadonly()
+
+
+class PickleCodec(Codec):
+    """Pickle protocol 5 with out-of-band buffers.
+
+    Attributes:
+        min_buffer_size: int, buffers of at least this size are sent out-of-band.
+    """
+    name = "pickle"
+
+    def __init__(self, min_buffer_size: int = 64 * 1024):
+        self.min_buffer_size = min_buffer_size
+
+    def encode(self, data: typing.Any) -> EncodedPayload:
+        file = io.BytesIO()
+        pickler = _OutOfBandPickler(file, self.min_buffer_size)
+        try:
+            pickler.dump(data)
+        except (pickle.PicklingError, AttributeError) as exception:
+            raise TypeError(f"Data can't be pickled: {exception}") from exception
+        return EncodedPayload(self, file.getvalue(), pickler.buffers)
+
+    def decode(self, header: bytes, buffers: typing.List[memoryview]) -> typing.Any:
+        return _OutOfBandUnpickler(io.BytesIO(header), buffers).load()
+
+
+class MsgpackCodec(Codec):
+    """Msgpack codec, data can have only simple types like dicts, lists, str and bytes."""
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("MsgpackCodec needs msgpack package")
+
+    def encode(self, data: typing.Any) -> EncodedPayload:
+        return EncodedPayload(self, msgpack.packb(data, use_bin_type=True))
+
+    def decode(self, header: bytes, buffers: typing.List[memoryview]) -> typing.Any:
+        return msgpack.unpackb(header, raw=False)
+
+
+class RawCodec(Codec):
+    """Codec for bytes-like data, that is sent as is."""
+    name = "raw"
+
+    def encode(self, data: typing.Any) -> EncodedPayload:
+        try:
+            view = memoryview(data)
+        except TypeError:
+            raise TypeError(f"RawCodec encodes only bytes-like objects, "
+                            f"got {type(data).__name__}") from None
+        return EncodedPayload(self, b"", [view.cast("B") if view.c_contiguous
+                                          else memoryview(view.tobytes())])
+
+    def decode(self, header: bytes, buffers: typing.List[memoryview]) -> typing.Any:
+        return buffers[0].toreadonly()
+
+
+_codecs = {}
+
+
+def register_codec(codec_class: typing.Type[Codec]) -> typing.Type[Codec]:
+    """Register codec class by it's name, can be used as a decorator."""
+    _codecs[codec_class.name] = codec_class
+    return codec_class
+
+
+def get_codec(name: str) -> Codec:
+    """Create codec by it's name with default arguments.
+
+    Raises:
+        KeyError: if there is no such codec.
+    """
+    try:
+        return _codecs[name]()
+    except KeyError:
+        raise KeyError(f"No codec {name!r}") from None
+
+
+for _codec_class in (PickleCodec, MsgpackCodec, RawCodec):
+    register_codec(_codec_class)
+
+
+class SharedMemoryLease:
+    """Shared memory segments of a received payload.
+
+    Segments are already unlinked, so they are freed when the last memoryview of them is
+    released, even if the process crashes.
+
+    Attributes:
+        _segments: list of shared_memory.SharedMemory.
+    """
+
+    def __init__(self, segments: typing.List[shared_memory.SharedMemory] = ()):
+        self._segments = list(segments)
+
+    def is_empty(self) -> bool:
+        """Return whether there are no segments."""
+        return not self._segments
+
+    def release(self) -> None:
+        """Close segments, call it when the payload and data decoded from it are not used.
+
+        Segments, whose buffers are still used, are closed by later calls.
+        """
+        segments, self._segments = self._segments + _unreleased_segments, []
+        _unreleased_segments.clear()
+        for segment in segments:
+            try:
+                segment.close()
+            except BufferError:
+                _unreleased_segments.append(segment)
+
+
+_unreleased_segments = []
+
+
+class ReceivedPayload:
+    """Payload received by recv_payload.
+
+    Attributes:
+        codec_name: str, name of the codec, that encoded the payload.
+        header: bytes.
+        buffers: list of memoryview.
+        error: bool, whether the payload is an exception.
+        lease: SharedMemoryLease of buffers in shared memory.
+    """
+
+    def __init__(self, codec_name: str, header: bytes, buffers: typing.List[memoryview],
+                 error: bool, lease: SharedMemoryLease):
+        self.codec_name = codec_name
+        self.header = header
+        self.buffers = buffers
+        self.error = error
+        self.lease = lease
+
+    def decode(self) -> typing.Any:
+        """Return deserialized data."""
+        return get_codec(self.codec_name).decode(self.header, self.buffers)
+
+
+def send_payload(connection,
+                 payload: EncodedPayload,
+                 error: bool = False,
+                 shared_memory_threshold: int = None) -> None:
+    """Send payload through multiprocessing connection without copying it's buffers.
+
+    Args:
+        connection: multiprocessing.connection.Connection.
+        payload: payload to send.
+        error: whether the payload is an exception.
+        shared_memory_threshold: buffers of at least this size are put to shared memory,
+            None not to use shared memory.
+    """
+    segments = []
+    buffer_infos = []
+    try:
+        for buffer in payload.buffers:
+            if shared_memory_threshold is not None and buffer.nbytes >= shared_memory_threshold:
+                segment = _create_segment(buffer)
+                segments.append(segment)
+                buffer_infos.append((buffer.nbytes, segment.name))
+            else:
+                buffer_infos.append((buffer.nbytes, None))
+        connection.send_bytes(pickle.dumps((payload.codec.name, error, buffer_infos)))
+        connection.send_bytes(payload.header)
+        for buffer, (_, segment_name) in zip(payload.buffers, buffer_infos):
+            if segment_name is None:
+                connection.send_bytes(buffer)
+    except BaseException:
+        for segment in segments:
+            resource_tracker.register(segment._name, "shared_memory")
+            segment.unlink()
+        raise
+    finally:
+        for segment in segments:
+            segment.close()
+
+
+def recv_payload(connection) -> typing.Optional[ReceivedPayload]:
+    """Receive payload sent by send_payload.
+
+    Returns:
+        The payload or None if the other side sent stop_payloads.
+    """
+    meta = connection.recv_bytes()
+    if not meta:
+        return None
+    codec_name, error, buffer_infos = pickle.loads(meta)
+    header = connection.recv_bytes()
+    buffers = []
+    segments = []
+    for size, segment_name in buffer_infos:
+        if segment_name is None:
+            buffers.append(memoryview(connection.recv_bytes()))
+        else:
+            segment = shared_memory.SharedMemory(segment_name)
+            segment.unlink()
+            segments.append(segment)
+            buffers.append(segment.buf[:size])
+    return ReceivedPayload(codec_name, header, buffers, error, SharedMemoryLease(segments))
+
+
+def stop_payloads(connection) -> None:
+    """Tell the other side, that no payloads will be sent."""
+    connection.send_bytes(b"")
+
+
+def _create_segment(buffer: memoryview) -> shared_memory.SharedMemory:
+    """Create shared memory segment with a copy of buffer, the receiver unlinks it."""
+    segment = shared_memory.SharedMemory(create=True, size=max(buffer.nbytes, 1))
+    # The receiver unlinks the segment, so the sender must not track it
+    resource_tracker.unregister(segment._name, "shared_memory")
+    segment.buf[:buffer.nbytes] = buffer.cast("B")
+    return segment
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import datetime
+import inspect
 import typing
 from abc import ABC
 from typing import TYPE_CHECKING
@@ -87,6 +88,11 @@ class AbstractCommandInput:
         self._asyncio_result_queue = result_queue
         self._command_input_task = asyncio.create_task(self._cycle())
 
+    def stop(self) -> None:
+        """Stop receiving commands."""
+        if self._command_input_task is not None:
+            self._command_input_task.cancel()
+
 
 class ConsoleDebugInput(AbstractCommandInput, ABC):
     """Class for getting inputs from console command line.
@@ -114,15 +120,25 @@ class Command:
 
     To implement a command one should override it's _apply method.
     Apply method takes a single argument - PHFsystem, somehow modifies it
-    and returns result of executing the operation.
+    and returns result of executing the operation. _apply can also be a coroutine
+    function, PHFSystem awaits it.
     Execute_command should be used for running the command on PHFSystem.
 
+    PHFSystem executes commands concurrently. Commands, that add or remove providers
+    or hooks, should set class attribute _changes_topology to True, such commands are
+    executed one by one.
+
+    Class attributes:
+        _changes_topology: bool, whether the command adds or removes providers or hooks.
+
     Attributes:
         _cur_time: datetime, time when the command was created.
         _source: AbstractCommandInput, at which the command has been created.
         _executed: bool flag whether the command was executed.
     """
 
+    _changes_topology = False
+
     def __init__(self, source: AbstractCommandInput = None):
         """Create a Command.
 
@@ -139,6 +155,19 @@ class Command:
         self._executed = True
         return result
 
+    async def execute_command_async(self, phfsys: PHFSystem):
+        """Execute a command, awaiting it's result if _apply is a coroutine function."""
+        result = self._apply(phfsys)
+        if inspect.isawaitable(result):
+            result = await result
+        self._executed = True
+        return result
+
+    @classmethod
+    def changes_topology(cls) -> bool:
+        """Return whether the command adds or removes providers or hooks."""
+        return cls._changes_topology
+
     def _apply(self, phfsys: PHFSystem):
         """What exactly the command does.
 
@@ -179,23 +208,21 @@ class ListProvidersCommand(Command):
 
 
 class ListHooksCommand(Command):
-    """Command to retrieve all hooks list of a provider by it's number.
+    """Command to retrieve all hooks list of a provider by it's id or name.
 
     Attributes:
         _provider: AbstractContentProvider, whose hooks to get.
         _hooks: List[AbstractHook], list of hooks.
-        _target_provider_num: int, targeted provider's number in phfsys's
-            providers list.
+        _target_provider_num: int id or str name of targeted provider in phfsys.
     """
 
     def __init__(self,
-                 target_provider_num: int,
+                 target_provider_num: typing.Union[int, str],
                  source: AbstractCommandInput = None):
         """Create the command.
 
        Args:
-           target_provider_num: targeted provider's number in phfsys's
-                providers list.
+           target_provider_num: int id or str name of targeted provider in phfsys.
            source: what created the command.
        """
         super().__init__(source)
@@ -210,7 +237,7 @@ class ListHooksCommand(Command):
         Args:
             phfsys: on which PHFSystem to execute the command.
         """
-        self._provider = phfsys.get_providers()[self._target_provider_num]
+        self._provider = phfsys.get_provider(self._target_provider_num)
         self._hooks = self._provider.get_hooks()[:]
         return self._hooks
 
@@ -222,14 +249,17 @@ class NewProviderCommand(Command):
         _class_name: str, name/alias of provider class to create.
         _args: list, positional arguments for constructor.
         _kwargs: dict, keyword arguments for constructor.
+        _name: str or None, unique name of the provider.
         _provider: AbstractContentProvider, resulting provider.
     """
+    _changes_topology = True
 
     def __init__(self,
                  class_name: str,
                  args: list = None,
                  kwargs: dict = None,
-                 source: AbstractCommandInput = None):
+                 source: AbstractCommandInput = None,
+                 name: str = None):
         """Create the command.
 
         Args:
@@ -237,12 +267,14 @@ class NewProviderCommand(Command):
             args: positional arguments for constructor.
             kwargs: keyword arguments for constructor.
             source: what created the command.
+            name: unique name of the provider.
         """
         super().__init__(source)
 
         self._class_name = class_name
         self._args = args
         self._kwargs = kwargs
+        self._name = name
         self._provider = None
 
     def _apply(self, phfsys: PHFSystem):
@@ -254,7 +286,7 @@ class NewProviderCommand(Command):
         self._provider = phfsys.create_provider(self._class_name,
                                                 self._args,
                                                 self._kwargs)
-        phfsys.add_provider(self._provider)
+        phfsys.add_provider(self._provider, name=self._name)
         return self._provider
 
 
@@ -263,29 +295,31 @@ class NewHookCommand(Command):
 
     Attributes:
         _class_name: str, name/alias of hook class to create.
-        _provider_num: int, targeted provider's number in phfsys's
-            providers list.
+        _provider_num: int id or str name of targeted provider in phfsys.
         _args: list, positional arguments for constructor.
         _kwargs: dict, keyword arguments for constructor.
+        _name: str or None, unique name of the hook.
         _provider: AbstractContentProvider, to which hook is added.
         _hook: AbstractHook, the created hook.
         """
+    _changes_topology = True
 
     def __init__(self,
                  class_name: str,
-                 provider_num: int,
+                 provider_num: typing.Union[int, str],
                  args: list = None,
                  kwargs: dict = None,
-                 source: AbstractCommandInput = None):
+                 source: AbstractCommandInput = None,
+                 name: str = None):
         """Create the command.
 
         Args:
             class_name: name/alias of hook class to create.
-            provider_num: int, targeted provider's number in phfsys's
-                providers list.
+            provider_num: int id or str name of targeted provider in phfsys.
             args: list, positional arguments for constructor.
             kwargs: dict, keyword arguments for constructor.
             source: what created the command.
+            name: unique name of the hook.
         """
         super().__init__(source)
 
@@ -293,6 +327,7 @@ class NewHookCommand(Command):
         self._provider_num = provider_num
         self._args = args
         self._kwargs = kwargs
+        self._name = name
         self._provider = None
         self._hook = None
 
@@ -302,14 +337,117 @@ class NewHookCommand(Command):
         Args:
             phfsys: on which PHFSystem to execute the command.
         """
-        self._provider = phfsys.get_providers()[self._provider_num]
+        self._provider = phfsys.get_provider(self._provider_num)
         self._hook = phfsys.create_hook(self._class_name,
                                         self._args,
                                         self._kwargs)
+        if self._name is not None:
+            self._hook.set_name(self._name)
         self._provider.add_hook(self._hook)
         return self._hook
 
 
+class RemoveProviderCommand(Command):
+    """Remove provider with it's hooks from phfsys and stop it.
+
+    Attributes:
+        _target: int id or str name of the provider.
+        _provider: AbstractContentProvider, removed provider.
+    """
+    _changes_topology = True
+
+    def __init__(self,
+                 target: typing.Union[int, str],
+                 source: AbstractCommandInput = None):
+        """Create the command.
+
+        Args:
+            target: int id or str name of the provider.
+            source: what created the command.
+        """
+        super().__init__(source)
+
+        self._target = target
+        self._provider = None
+
+    def _apply(self, phfsys: PHFSystem):
+        """Remove the provider.
+
+        Args:
+            phfsys: on which PHFSystem to execute the command.
+        """
+        self._provider = phfsys.remove_provider(self._target)
+        return self._provider
+
+
+class RemoveHookCommand(Command):
+    """Unlink hook from it's provider and stop it.
+
+    Attributes:
+        _target: int id or str name of the hook.
+        _hook: AbstractHook, removed hook.
+    """
+    _changes_topology = True
+
+    def __init__(self,
+                 target: typing.Union[int, str],
+                 source: AbstractCommandInput = None):
+        """Create the command.
+
+        Args:
+            target: int id or str name of the hook.
+            source: what created the command.
+        """
+        super().__init__(source)
+
+        self._target = target
+        self._hook = None
+
+    def _apply(self, phfsys: PHFSystem):
+        """Remove the hook.
+
+        Args:
+            phfsys: on which PHFSystem to execute the command.
+        """
+        self._hook = phfsys.remove_hook(self._target)
+        return self._hook
+
+
+class BatchCommand(Command):
+    """Create many providers and hooks in one pass.
+
+    See PHFSystem.add_batch for the format of specs.
+
+    Attributes:
+        _specs: list of (alias, args, kwargs, target) tuples.
+        _created: list of created providers and hooks.
+    """
+    _changes_topology = True
+
+    def __init__(self,
+                 specs: typing.List[typing.Tuple[str, list, dict, typing.Any]],
+                 source: AbstractCommandInput = None):
+        """Create the command.
+
+        Args:
+            specs: list of (alias, args, kwargs, target) tuples.
+            source: what created the command.
+        """
+        super().__init__(source)
+
+        self._specs = specs
+        self._created = None
+
+    def _apply(self, phfsys: PHFSystem):
+        """Create all providers and hooks and add them to phfsys.
+
+        Args:
+            phfsys: on which PHFSystem to execute the command.
+        """
+        self._created = phfsys.add_batch(self._specs)
+        return self._created
+
+
 def get_arguments(input_array):
     positional_arguments = []
     keyword_arguments = {}
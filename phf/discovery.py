@@ -0,0 +1,484 @@
+"""Static discovery of hook and provider classes without importing their modules.
+
+Used by HookAndProviderFactory with discovery="static". Every module is parsed with ast
+and only it's top-level statements are used: imports, class definitions, simple assignments
+and deletions. A class is found if one of it's bases can be followed to a class from phf
+package(phf modules are imported, they are already loaded anyway) through classes and
+imports of the scanned tree. Aliases are taken from a literal _alias list in class body or
+inherited from bases.
+
+Found classes are registered as ClassReference objects, module of the class is imported
+only when the class is needed for the first time.
+
+Parsed facts of every file can be cached in a manifest, a JSON file where every file is
+stored with it's mtime and sha256 hash. If mtime is changed, but hash isn't, the file isn't
+parsed again.
+
+Not everything can be found statically:
+    - classes with bases from third-party modules are not found;
+    - statements inside if/try blocks are ignored;
+    - if _alias of a found class isn't a literal, the module is imported as usual.
+"""
+from __future__ import annotations
+
+import ast
+import hashlib
+import importlib
+import json
+import os
+import threading
+import typing
+
+_MANIFEST_VERSION = 1
+_UNKNOWN_ALIASES = False
+
+
+class StaticDiscoveryError(Exception):
+    """Raised when classes of a module can't be found statically."""
+
+
+class ClassReference:
+    """Reference to a class, that is not imported yet.
+
+    It's compared equal to the class it references, so it's alias conflicts are checked as
+    for usual classes.
+
+    Attributes:
+        __module__: str, name of the module where the class is defined.
+        __name__: str, name of the class.
+    """
+
+    def __init__(self, module_name: str, name: str):
+        self.__module__ = module_name
+        self.__name__ = name
+
+    def load(self) -> type:
+        """Import the module and return the class."""
+        module = importlib.import_module(self.__module__)
+        return getattr(module, self.__name__)
+
+    def _key(self) -> typing.Tuple[str, str]:
+        return self.__module__, self.__name__
+
+    def __eq__(self, other):
+        if isinstance(other, ClassReference):
+            return self._key() == other._key()
+        if isinstance(other, type):
+            return self._key() == (other.__module__, other.__qualname__)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"<ClassReference {self.__module__}.{self.__name__}>"
+
+
+class _StaticClass:
+    """Class, found by static analysis.
+
+    Attributes:
+        reference: ClassReference to the class.
+        real_ancestors: list of ancestor classes, that are really imported(from phf).
+        aliases: list of str aliases, _UNKNOWN_ALIASES if they can't be found statically or
+            None if the class has no _alias at all.
+    """
+
+    def __init__(self, reference: ClassReference,
+                 real_ancestors: typing.List[type],
+                 aliases: typing.Optional[typing.List[str]]):
+        self.reference = reference
+        self.real_ancestors = real_ancestors
+        self.aliases = aliases
+
+
+class _StaticModule:
+    """Module of the scanned tree, bound to a name.
+
+    Attributes:
+        name: str, full name of the module.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+def _dotted_name(node: ast.AST) -> typing.Optional[str]:
+    """Return "a.b.c" for Name/Attribute chain node or None for other nodes."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+def _class_aliases(node: ast.ClassDef):
+    """Return literal _alias of class body, None if not set, _UNKNOWN_ALIASES if not literal."""
+    aliases = None
+    for statement in node.body:
+        if isinstance(statement, ast.Assign):
+            targets = statement.targets
+        elif isinstance(statement, ast.AnnAssign) and statement.value is not None:
+            targets = [statement.target]
+        else:
+            continue
+        if not any(isinstance(target, ast.Name) and target.id == "_alias" for target in targets):
+            continue
+        try:
+            value = ast.literal_eval(statement.value)
+        except (ValueError, TypeError, SyntaxError):
+            aliases = _UNKNOWN_ALIASES
+            continue
+        if isinstance(value, (list, tuple)) and all(isinstance(alias, str) for alias in value):
+            aliases = list(value)
+        else:
+            aliases = _UNKNOWN_ALIASES
+    return aliases
+
+
+def _unbind_targets(target: ast.AST) -> typing.List[list]:
+    """Return unbind facts for all names in assignment/deletion target."""
+    if isinstance(target, ast.Name):
+        return [["unbind", target.id]]
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return [fact for element in target.elts for fact in _unbind_targets(element)]
+    return []
+
+
+def parse_facts(source: typing.Union[str, bytes], file_path: str) -> typing.List[list]:
+    """Parse module source and return list of facts about it's top-level statements.
+
+    Facts are JSON serializable lists:
+        ["import", bound name, module name]
+        ["from", module name, level, imported name, bound name]
+        ["star", module name, level]
+        ["class", name, list of dotted bases(None for not supported), aliases]
+        ["bind", name, dotted name of bound object]
+        ["unbind", name]
+
+    Args:
+        source: source code of the module.
+        file_path: path to the module, for error messages.
+
+    Returns:
+        List of facts in order of statements.
+    """
+    tree = ast.parse(source, file_path)
+    facts = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname is not None:
+                    facts.append(["import", alias.asname, alias.name])
+                else:
+                    first_part = alias.name.split(".")[0]
+                    facts.append(["import", first_part, first_part])
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name == "*":
+                    facts.append(["star", node.module or "", node.level])
+                else:
+                    facts.append(["from", node.module or "", node.level,
+                                  alias.name, alias.asname or alias.name])
+        elif isinstance(node, ast.ClassDef):
+            facts.append(["class", node.name,
+                          [_dotted_name(base) for base in node.bases],
+                          _class_aliases(node)])
+        elif isinstance(node, ast.AnnAssign) and node.value is None:
+            continue
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            value = _dotted_name(node.value) if node.value is not None else None
+            for target in targets:
+                if isinstance(target, ast.Name) and value is not None:
+                    facts.append(["bind", target.id, value])
+                else:
+                    facts.extend(_unbind_targets(target))
+        elif isinstance(node, ast.Delete):
+            for target in node.targets:
+                facts.extend(_unbind_targets(target))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            facts.append(["unbind", node.name])
+    return facts
+
+
+class DiscoveryManifest:
+    """Cache of parsed facts of files, optionally stored in a JSON file.
+
+    Attributes:
+        _path: str or None, path to the manifest file, nothing is stored if None.
+        _files: dict {absolute file path: {"mtime": float, "sha256": str, "facts": list}}.
+        _changed: bool, whether there are changes not saved to the file.
+        _lock: threading.Lock, guards _files as files may be parsed by several threads.
+    """
+
+    def __init__(self, path: str = None):
+        """Create manifest and load it from path if the file exists.
+
+        Args:
+            path: path to the manifest file.
+        """
+        self._path = path
+        self._files = {}
+        self._changed = False
+        self._lock = threading.Lock()
+        if path is not None and os.path.isfile(path):
+            with open(path) as file:
+                data = json.load(file)
+            if data.get("version") == _MANIFEST_VERSION:
+                self._files = data["files"]
+
+    def get_facts(self, file_path: str) -> typing.List[list]:
+        """Return facts of the file, parsing it only if it's changed.
+
+        Args:
+            file_path: path to .py file.
+
+        Returns:
+            List of facts, see parse_facts.
+        """
+        key = os.path.abspath(file_path)
+        mtime = os.stat(file_path).st_mtime
+        entry = self._files.get(key)
+        if entry is not None and entry["mtime"] == mtime:
+            return entry["facts"]
+
+        with open(file_path, "rb") as file:
+            source = file.read()
+        digest = hashlib.sha256(source).hexdigest()
+        if entry is None or entry["sha256"] != digest:
+            entry = {"sha256": digest, "facts": parse_facts(source, file_path)}
+        entry["mtime"] = mtime
+        with self._lock:
+            self._files[key] = entry
+            self._changed = True
+        return entry["facts"]
+
+    def save(self) -> None:
+        """Write manifest to it's file if there are unsaved changes."""
+        if self._path is None or not self._changed:
+            return
+        tmp_path = f"{self._path}.tmp"
+        with self._lock:
+            with open(tmp_path, "w") as file:
+                json.dump({"version": _MANIFEST_VERSION, "files": self._files}, file)
+            os.replace(tmp_path, self._path)
+            self._changed = False
+
+
+def find_module_file(module_name: str) -> typing.Optional[typing.Tuple[str, bool]]:
+    """Find file of a module of the scanned tree, relative to the current directory.
+
+    Args:
+        module_name: full name of the module.
+
+    Returns:
+        Tuple (file path, whether it's a package) or None if there is no such module.
+    """
+    base = module_name.replace(".", os.sep)
+    if os.path.isfile(base + ".py"):
+        return base + ".py", False
+    init_path = os.path.join(base, "__init__.py")
+    if os.path.isfile(init_path):
+        return init_path, True
+    return None
+
+
+def _is_phf_module(module_name: str) -> bool:
+    return module_name == "phf" or module_name.startswith("phf.")
+
+
+class StaticResolver:
+    """Resolves names of modules to found classes, modules are parsed only once.
+
+    Attributes:
+        _manifest: DiscoveryManifest, source of facts.
+        _symbols: dict {module name: dict {name: bound object}}.
+    """
+
+    def __init__(self, manifest: DiscoveryManifest):
+        self._manifest = manifest
+        self._symbols = {}
+
+    def get_module_symbols(self, module_name: str) -> typing.Dict[str, typing.Any]:
+        """Return dict of objects bound to top-level names of a module.
+
+        Objects are _StaticClass, _StaticModule, real objects from phf or None if the
+        object is unknown.
+
+        Args:
+            module_name: full name of the module.
+
+        Raises:
+            StaticDiscoveryError: if the module file is not found.
+        """
+        if module_name in self._symbols:
+            return self._symbols[module_name]
+        if _is_phf_module(module_name):
+            module = importlib.import_module(module_name)
+            self._symbols[module_name] = dict(vars(module))
+            return self._symbols[module_name]
+
+        found = find_module_file(module_name)
+        if found is None:
+            raise StaticDiscoveryError(f"Module {module_name} is not found")
+        file_path, is_package = found
+
+        # Set before resolving to stop on import cycles.
+        symbols = self._symbols[module_name] = {}
+        package = module_name if is_package else module_name.rpartition(".")[0]
+        for fact in self._manifest.get_facts(file_path):
+            self._apply_fact(fact, symbols, module_name, package)
+        return symbols
+
+    def _apply_fact(self, fact: list, symbols: dict, module_name: str, package: str) -> None:
+        """Change module's symbols according to one fact."""
+        kind = fact[0]
+        if kind == "import":
+            _, bound_name, target = fact
+            symbols[bound_name] = self._module_object(target)
+        elif kind == "from":
+            _, target, level, name, bound_name = fact
+            target = _absolute_module_name(target, level, package)
+            symbols[bound_name] = self._import_from(target, name)
+        elif kind == "star":
+            _, target, level = fact
+            target = _absolute_module_name(target, level, package)
+            try:
+                target_symbols = self.get_module_symbols(target)
+            except StaticDiscoveryError:
+                return
+            symbols.update({name: value for name, value in target_symbols.items()
+                            if not name.startswith("_")})
+        elif kind == "class":
+            _, name, bases, aliases = fact
+            symbols[name] = self._make_class(ClassReference(module_name, name),
+                                             [_resolve_dotted(self, symbols, base)
+                                              for base in bases],
+                                             aliases)
+        elif kind == "bind":
+            _, name, value = fact
+            symbols[name] = _resolve_dotted(self, symbols, value)
+        elif kind == "unbind":
+            symbols.pop(fact[1], None)
+
+    @staticmethod
+    def _module_object(module_name: str):
+        """Return object to bind for imported module or None if it's unknown."""
+        if _is_phf_module(module_name):
+            try:
+                return importlib.import_module(module_name)
+            except ImportError:
+                return None
+        if find_module_file(module_name) is not None:
+            return _StaticModule(module_name)
+        return None
+
+    def _import_from(self, module_name: str, name: str):
+        """Return object to bind for "from module_name import name".
+
+        For modules of the scanned tree submodules are checked first, so that a package
+        isn't parsed only to find it's submodule.
+        """
+        if _is_phf_module(module_name):
+            module = self._module_object(module_name)
+            if module is not None and hasattr(module, name):
+                return getattr(module, name)
+            return self._module_object(f"{module_name}.{name}")
+
+        submodule = self._module_object(f"{module_name}.{name}")
+        if submodule is not None:
+            return submodule
+        try:
+            return self.get_module_symbols(module_name).get(name)
+        except StaticDiscoveryError:
+            return None
+
+    def get_attribute(self, obj, name: str):
+        """Return attribute of module object or None if it's unknown."""
+        if isinstance(obj, _StaticModule):
+            return self._import_from(obj.name, name)
+        if obj is not None and not isinstance(obj, _StaticClass):
+            return getattr(obj, name, None)
+        return None
+
+    @staticmethod
+    def _make_class(reference: ClassReference,
+                    bases: list,
+                    aliases) -> _StaticClass:
+        """Create _StaticClass from resolved bases, aliases are inherited if not set."""
+        real_ancestors = []
+        for base in bases:
+            if isinstance(base, _StaticClass):
+                real_ancestors.extend(base.real_ancestors)
+            elif isinstance(base, type):
+                real_ancestors.append(base)
+
+        if aliases is None:
+            for base in bases:
+                if isinstance(base, _StaticClass) and base.aliases is not None:
+                    aliases = base.aliases
+                    break
+                if isinstance(base, type) and hasattr(base, "_alias"):
+                    aliases = list(base._alias)
+                    break
+        return _StaticClass(reference, real_ancestors, aliases)
+
+
+def _absolute_module_name(module_name: str, level: int, package: str) -> str:
+    """Turn name from relative import to full module name."""
+    if level == 0:
+        return module_name
+    parts = package.split(".")
+    if level > 1:
+        parts = parts[:-(level - 1)]
+    base = ".".join(parts)
+    return f"{base}.{module_name}" if module_name else base
+
+
+def _resolve_dotted(resolver: StaticResolver, symbols: dict, dotted: typing.Optional[str]):
+    """Return object bound to "a.b.c" in module symbols or None if it's unknown."""
+    if dotted is None:
+        return None
+    first, *attributes = dotted.split(".")
+    obj = symbols.get(first)
+    for attribute in attributes:
+        obj = resolver.get_attribute(obj, attribute)
+    return obj
+
+
+def find_classes(resolver: StaticResolver,
+                 module_name: str,
+                 right_class_type: typing.Callable[[type], bool]
+                 ) -> typing.List[typing.Tuple[str, typing.Any]]:
+    """Find classes of needed type in a module as inspect.getmembers would.
+
+    Args:
+        resolver: StaticResolver to use.
+        module_name: full name of the module.
+        right_class_type: function that checks if a real class is of needed type.
+
+    Returns:
+        List of (alias, class or ClassReference) in order of registration.
+
+    Raises:
+        StaticDiscoveryError: if the module has to be imported to find it's classes.
+    """
+    found = []
+    symbols = resolver.get_module_symbols(module_name)
+    for name in sorted(symbols):
+        obj = symbols[name]
+        if isinstance(obj, _StaticClass):
+            if not any(right_class_type(ancestor) for ancestor in obj.real_ancestors):
+                continue
+            if obj.aliases is _UNKNOWN_ALIASES:
+                raise StaticDiscoveryError(f"Aliases of {obj.reference} are not literal")
+            found.append((obj.reference.__name__, obj.reference))
+            found.extend((alias, obj.reference) for alias in obj.aliases or [])
+        elif isinstance(obj, type) and right_class_type(obj):
+            found.append((obj.__name__, obj))
+            found.extend((alias, obj) for alias in obj.get_aliases())
+    return found
@@ -4,15 +4,22 @@ Only HookAndProviderFactory class from this module should be used directly.
 """
 from __future__ import annotations
 
-import copy
+import concurrent.futures
 import importlib
 import inspect
+import logging
 import os
+import time
+import types
 import typing
 
 from .abstracthook import AbstractHook
+from .discovery import ClassReference, DiscoveryManifest, StaticDiscoveryError, StaticResolver
+from .discovery import find_classes
 from .provider import AbstractContentProvider
 
+logger = logging.getLogger(__name__)
+
 
 class HookAndProviderFactory:
     """Factory to create hooks and providers.
@@ -32,6 +39,10 @@ class HookAndProviderFactory:
 
     Navigate to _BasicAnalyser for further information about reading classes from paths.
 
+    With discovery="static" modules aren't imported while reading, classes are found by
+    parsing the sources and a module is imported when a class from it is created for the
+    first time. See discovery module for details.
+
     Attributes:
         _hook_analyser: Instance of _HookAnalyser class, most of hook-related actions is
             delegated to it.
@@ -41,7 +52,10 @@ class HookAndProviderFactory:
 
     def __init__(self,
                  provider_paths: typing.List[str] = None,
-                 hook_paths: typing.List[str] = None):
+                 hook_paths: typing.List[str] = None,
+                 discovery: str = "import",
+                 manifest_path: str = None,
+                 scan_workers: int = 0):
         """Create factory with possibility to remember hooks and providers.
 
         Args:
@@ -49,16 +63,28 @@ class HookAndProviderFactory:
                 and directories).
             hook_paths: list of strings to search for hooks(modules, packages
                 and directories).
+            discovery: "import" to import all modules while reading them or "static" to
+                find classes without importing.
+            manifest_path: path to JSON file to cache parsed sources in, used only with
+                static discovery.
+            scan_workers: amount of threads to walk directories and load modules with, if 0
+                everything is done in the calling thread.
             """
         if provider_paths is None:
             provider_paths = []
         if hook_paths is None:
             hook_paths = []
 
-        self._hook_analyser = _HookAnalyser()
+        manifest = None
+        if discovery == "static":
+            manifest = DiscoveryManifest(manifest_path)
+        elif discovery != "import":
+            raise ValueError(f'Unknown discovery "{discovery}"')
+
+        self._hook_analyser = _HookAnalyser(manifest, scan_workers)
         self._hook_analyser.analyse(*hook_paths)
 
-        self._provider_analyser = _ProviderAnalyser()
+        self._provider_analyser = _ProviderAnalyser(manifest, scan_workers)
         self._provider_analyser.analyse(*provider_paths)
 
     def import_hook_classes(self, *args) -> None:
@@ -81,6 +107,27 @@ class HookAndProviderFactory:
         """
         self._provider_analyser.analyse(*args)
 
+    def get_module_files(self) -> typing.Dict[str, str]:
+        """Return {module name: file path} of all modules in paths hooks and providers are
+        read from, see _BasicAnalyser.get_module_files."""
+        module_files = self._hook_analyser.get_module_files()
+        module_files.update(self._provider_analyser.get_module_files())
+        return module_files
+
+    def rebuild(self) -> None:
+        """Read all hooks and providers again from the same paths, used after reloading."""
+        self._hook_analyser.rebuild()
+        self._provider_analyser.rebuild()
+
+    def get_scan_timings(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        """Return durations of phases of the last reading of hooks and providers.
+
+        Returns:
+            Dict {"hooks": timings, "providers": timings}, see _BasicAnalyser.get_scan_timings.
+        """
+        return {"hooks": self._hook_analyser.get_scan_timings(),
+                "providers": self._provider_analyser.get_scan_timings()}
+
     def create_hook(self, hook_alias: str,
                     args: typing.List = None,
                     kwargs: typing.Dict[str, typing.Any] = None) -> AbstractHook:
@@ -99,11 +146,10 @@ class HookAndProviderFactory:
         if kwargs is None:
             kwargs = {}
 
-        all_hooks = self._hook_analyser.get_hooks()
-        if hook_alias not in all_hooks:
+        if hook_alias not in self._hook_analyser.get_classes_view():
             raise KeyError(f'No hook named "{hook_alias}"')
 
-        return all_hooks[hook_alias](*args, **kwargs)
+        return self._hook_analyser.get_class(hook_alias)(*args, **kwargs)
 
     def create_provider(self, provider_alias: str,
                         args: typing.List = None,
@@ -123,11 +169,80 @@ class HookAndProviderFactory:
         if kwargs is None:
             kwargs = {}
 
-        all_providers = self._provider_analyser.get_providers()
-        if provider_alias not in all_providers:
+        if provider_alias not in self._provider_analyser.get_classes_view():
             raise KeyError(f'No provider named "{provider_alias}"')
 
-        return all_providers[provider_alias](*args, **kwargs)
+        return self._provider_analyser.get_class(provider_alias)(*args, **kwargs)
+
+    def get_hooks_view(self) -> typing.Mapping[str, typing.Type[AbstractHook]]:
+        """Return read-only view of all hook classes by aliases.
+
+        The view isn't copied, so it's cheap and always shows the current classes. With
+        static discovery classes, that weren't created yet, are ClassReference objects.
+        """
+        return self._hook_analyser.get_classes_view()
+
+    def get_providers_view(self) -> typing.Mapping[str, typing.Type[AbstractContentProvider]]:
+        """Return read-only view of all provider classes by aliases.
+
+        The view isn't copied, so it's cheap and always shows the current classes. With
+        static discovery classes, that weren't created yet, are ClassReference objects.
+        """
+        return self._provider_analyser.get_classes_view()
+
+    def create_hooks(self, specs: typing.List[typing.Tuple[str, typing.List, typing.Dict]]
+                     ) -> typing.List[AbstractHook]:
+        """Create many hooks at once.
+
+        Aliases are resolved only once for the whole list and before creating any hook, so
+        if some alias doesn't exist no hook is created.
+
+        Args:
+            specs: list of (alias, args, kwargs) tuples, args and kwargs can be None.
+
+        Returns:
+            List of created hooks in the order of specs.
+        """
+        return _create_objects(self._hook_analyser, specs, "hook")
+
+    def create_providers(self, specs: typing.List[typing.Tuple[str, typing.List, typing.Dict]]
+                         ) -> typing.List[AbstractContentProvider]:
+        """Create many providers at once.
+
+        Aliases are resolved only once for the whole list and before creating any provider,
+        so if some alias doesn't exist no provider is created.
+
+        Args:
+            specs: list of (alias, args, kwargs) tuples, args and kwargs can be None.
+
+        Returns:
+            List of created providers in the order of specs.
+        """
+        return _create_objects(self._provider_analyser, specs, "provider")
+
+
+def _create_objects(analyser: _BasicAnalyser,
+                    specs: typing.List[typing.Tuple[str, typing.List, typing.Dict]],
+                    obj_type_name: str) -> typing.List:
+    """Create objects from specs by aliases.
+
+    Args:
+        analyser: analyser to take classes from.
+        specs: list of (alias, args, kwargs) tuples.
+        obj_type_name: "hook" or "provider", for error message.
+
+    Returns:
+        List of created objects.
+
+    Raises:
+        KeyError if some alias doesn't exist.
+    """
+    classes = analyser.get_classes_view()
+    for alias, _, _ in specs:
+        if alias not in classes:
+            raise KeyError(f'No {obj_type_name} named "{alias}"')
+    return [analyser.get_class(alias)(*(args or []), **(kwargs or {}))
+            for alias, args, kwargs in specs]
 
 
 class _BasicAnalyser:
@@ -135,13 +250,71 @@ class _BasicAnalyser:
 
     The decision whether concrete class it is saved is determined in function right_class_type.
 
+    If manifest is given, classes are found statically without importing modules(modules,
+    that can't be analysed statically, are still imported). Such classes are stored as
+    discovery.ClassReference objects till they are needed in get_class.
+
+    Paths are analysed in 3 phases: walk finds all modules in directories, load imports
+    modules(or parses them with static discovery) and register remembers their classes.
+    With scan_workers > 0 walk and load are done by a thread pool. Register is always done
+    in one thread in the order of sequential walk, so alias conflicts are the same.
+
     Attributes:
         _classes: a dict of classes in format {alias: class}.
+        _classes_view: types.MappingProxyType, read-only view of _classes.
+        _manifest: discovery.DiscoveryManifest or None, source of parsed modules for
+            static discovery, if None modules are imported.
+        _resolver: discovery.StaticResolver or None, resolver of current analyse call.
+        _references: dict {ClassReference: list of it's aliases}, classes not imported yet.
+        _scan_workers: int, amount of threads for walk and load phases, 0 for no threads.
+        _scan_timings: dict {phase: duration in seconds} of the last analyse call.
+        _analysed_paths: list of tuples of paths of all successful analyse calls.
     """
 
-    def __init__(self):
-        """Simple initiation."""
+    def __init__(self, manifest: DiscoveryManifest = None, scan_workers: int = 0):
+        """Simple initiation.
+
+        Args:
+            manifest: manifest for static discovery, modules are imported if not set.
+            scan_workers: amount of threads for walk and load phases, 0 for no threads.
+        """
         self._classes = {}
+        self._classes_view = types.MappingProxyType(self._classes)
+        self._manifest = manifest
+        self._resolver = None
+        self._references = {}
+        self._scan_workers = scan_workers
+        self._scan_timings = {}
+        self._analysed_paths = []
+
+    def get_classes_view(self) -> typing.Mapping[str, type]:
+        """Return read-only view of dict of classes, it isn't copied.
+
+        Returns:
+            types.MappingProxyType of {alias: class}.
+        """
+        return self._classes_view
+
+    def get_class(self, alias: str) -> type:
+        """Return class by alias, importing it's module if it's not imported yet.
+
+        Args:
+            alias: alias of the class.
+
+        Raises:
+            KeyError if there is no such alias.
+        """
+        cls = self._classes[alias]
+        if isinstance(cls, ClassReference):
+            reference = cls
+            cls = reference.load()
+            self._set_loaded(reference, cls)
+        return cls
+
+    def _set_loaded(self, reference: ClassReference, cls: type) -> None:
+        """Replace reference with the imported class for all it's aliases."""
+        for alias in self._references.pop(reference, []):
+            self._classes[alias] = cls
 
     def analyse_module(self, file_path: str) -> None:
         """Get all classes from file/ at path.
@@ -168,14 +341,17 @@ class _BasicAnalyser:
         Args:
             file_path: path to file/directory/package.
         """
+        file_path = _module_name(file_path)
         # Works only with packages and .py files
-        if file_path[~2:] != ".py" and not (os.path.isfile(os.path.join(file_path, "__init__.py"))):
+        if file_path is None:
             return
 
-        file_path = file_path.replace("/", ".")
-        file_path = file_path.replace("\\", ".")
-        if file_path[~2:] == ".py":
-            file_path = file_path[:~2]
+        if self._manifest is not None:
+            try:
+                self._analyse_module_static(file_path)
+                return
+            except StaticDiscoveryError:
+                pass
 
         module = importlib.import_module(file_path)
         for name, obj in inspect.getmembers(module):
@@ -185,23 +361,45 @@ class _BasicAnalyser:
                 for alias in obj.get_aliases():
                     self._add_class_to_dict(alias, obj)
 
+    def _analyse_module_static(self, module_name: str) -> None:
+        """Get all classes from module without importing it.
+
+        Args:
+            module_name: full name of the module.
+
+        Raises:
+            StaticDiscoveryError: if the module has to be imported.
+        """
+        resolver = self._resolver
+        if resolver is None:
+            resolver = StaticResolver(self._manifest)
+        for alias, cls in find_classes(resolver, module_name, self.right_class_type):
+            self._add_class_to_dict(alias, cls)
+
     def _add_class_to_dict(self, alias: str, cls) -> None:
         """Remember alias: cls mapping.
 
-        Also checks for alias conflicts.
+        Also checks for alias conflicts. ClassReference is equal to the class it references,
+        so they don't conflict.
 
         Args:
             alias: string alias for the class.
-            cls: class that needs to be added.
+            cls: class or ClassReference that needs to be added.
 
         Raises:
             HookAliasDoublingError
             ProviderAliasDoublingError
         """
-        if alias in self._classes and cls is not self._classes[alias]:
-            raise HookAliasDoublingError(alias, self._classes[alias], cls)
+        if alias in self._classes:
+            old_cls = self._classes[alias]
+            if cls != old_cls:
+                raise HookAliasDoublingError(alias, old_cls, cls)
+            if isinstance(old_cls, ClassReference) and not isinstance(cls, ClassReference):
+                self._set_loaded(old_cls, cls)
         else:
             self._classes[alias] = cls
+            if isinstance(cls, ClassReference):
+                self._references.setdefault(cls, []).append(alias)
 
     def right_class_type(self, obj) -> bool:
         """Check if obj is remembered by the method.
@@ -226,18 +424,174 @@ class _BasicAnalyser:
             package "package"
             analyser.analyse("module1.py", "directory/subdir", "package")
         """
-        for file in args:
-            if os.path.isdir(file):
-                # If package
-                if os.path.isfile(os.path.join(file, "__init__.py")):
-                    self.analyse_module(file)
-                # Otherwise is a directory
-                else:
-                    strings = os.listdir(file)
-                    strings = [os.path.join(file, string) for string in strings]
-                    self.analyse(*strings)
+        start = time.perf_counter()
+        load_errors = {}
+        if self._scan_workers:
+            with concurrent.futures.ThreadPoolExecutor(self._scan_workers) as executor:
+                modules = _walk(args, executor.map)
+                walked = time.perf_counter()
+                load_errors = dict(zip(modules, executor.map(self._load_module, modules)))
+        else:
+            modules = _walk(args, map)
+            walked = time.perf_counter()
+        loaded = time.perf_counter()
+
+        if self._manifest is not None:
+            self._resolver = StaticResolver(self._manifest)
+        try:
+            for module in modules:
+                error = load_errors.get(module)
+                if error is not None:
+                    # The module isn't imported again, it's code would be executed twice
+                    raise error
+                self.analyse_module(module)
+        finally:
+            self._resolver = None
+        if self._manifest is not None:
+            self._manifest.save()
+        registered = time.perf_counter()
+        self._analysed_paths.append(args)
+
+        self._scan_timings = {"walk": walked - start,
+                              "load": loaded - walked,
+                              "register": registered - loaded,
+                              "total": registered - start}
+        logger.debug("%s analysed %d modules in %.3fs: walk %.3fs, load %.3fs, register %.3fs",
+                     self.__class__.__name__, len(modules), self._scan_timings["total"],
+                     self._scan_timings["walk"], self._scan_timings["load"],
+                     self._scan_timings["register"])
+
+    def get_module_files(self) -> typing.Dict[str, str]:
+        """Return files of all modules in analysed paths.
+
+        Directories are walked again, so new modules are returned too.
+
+        Returns:
+            Dict {module name: path to .py file}, __init__.py file for packages.
+        """
+        module_files = {}
+        for paths in self._analysed_paths:
+            for path in _walk(paths, map):
+                module_name = _module_name(path)
+                if module_name is None:
+                    continue
+                if os.path.isdir(path):
+                    path = os.path.join(path, "__init__.py")
+                module_files[module_name] = path
+        return module_files
+
+    def rebuild(self) -> None:
+        """Forget all classes and analyse all analysed paths again in the same order.
+
+        Used after modules are reloaded. If analysis fails, old classes are restored and
+        the exception is raised.
+        """
+        old_classes = dict(self._classes)
+        old_references = self._references
+        analysed_paths = self._analysed_paths
+        self._classes.clear()
+        self._references = {}
+        self._analysed_paths = []
+        try:
+            for paths in analysed_paths:
+                self.analyse(*paths)
+        except Exception:
+            self._classes.clear()
+            self._classes.update(old_classes)
+            self._references = old_references
+            self._analysed_paths = analysed_paths
+            raise
+
+    def get_scan_timings(self) -> typing.Dict[str, float]:
+        """Return durations of phases of the last analyse call.
+
+        Returns:
+            Dict {"walk", "load", "register", "total": duration in seconds}, load is 0 if
+            there are no scan workers as modules are loaded while registering.
+        """
+        return dict(self._scan_timings)
+
+    def _load_module(self, file_path: str) -> typing.Optional[Exception]:
+        """Import or parse the module before registering, used by scan workers.
+
+        Errors aren't raised here, import errors are returned and raised in register phase
+        in the same order as without workers. Parse errors are ignored, the module is
+        parsed again in register phase and imported if it can't be parsed.
+
+        Returns:
+            Exception raised by import of the module or None.
+        """
+        module_name = _module_name(file_path)
+        if module_name is None:
+            return None
+        if self._manifest is not None:
+            if os.path.isdir(file_path):
+                file_path = os.path.join(file_path, "__init__.py")
+            try:
+                self._manifest.get_facts(file_path)
+            except Exception:
+                pass
+            return None
+        try:
+            importlib.import_module(module_name)
+        except Exception as exception:
+            return exception
+        return None
+
+
+def _module_name(file_path: str) -> typing.Optional[str]:
+    """Return module name of .py file or package path or None if it's not a module."""
+    if file_path[~2:] != ".py" and not (os.path.isfile(os.path.join(file_path, "__init__.py"))):
+        return None
+
+    file_path = file_path.replace("/", ".")
+    file_path = file_path.replace("\\", ".")
+    if file_path[~2:] == ".py":
+        file_path = file_path[:~2]
+    return file_path
+
+
+def _list_children(path: str) -> typing.Optional[typing.List[str]]:
+    """Return paths inside a directory or None if path is a file or a package."""
+    if os.path.isdir(path) and not os.path.isfile(os.path.join(path, "__init__.py")):
+        return [os.path.join(path, name) for name in os.listdir(path)]
+    return None
+
+
+def _walk(paths: typing.Iterable[str], map_function: typing.Callable) -> typing.List[str]:
+    """Find files and packages in paths in the same order as recursive walk would.
+
+    Directories of every depth level are listed together with map_function, so it may be
+    a thread pool's map.
+
+    Args:
+        paths: paths to files, packages and directories.
+        map_function: function like built-in map.
+
+    Returns:
+        List of paths of files and packages.
+    """
+    # Node is [path, list of child nodes or None for files and packages].
+    roots = [[path, None] for path in paths]
+    level = roots
+    while level:
+        for node, children in zip(level, map_function(_list_children,
+                                                      [node[0] for node in level])):
+            if children is not None:
+                node[1] = [[child, None] for child in children]
+        level = [child for node in level if node[1] is not None for child in node[1]]
+
+    result = []
+
+    def _flatten(nodes):
+        for path, children in nodes:
+            if children is None:
+                result.append(path)
             else:
-                self.analyse_module(file)
+                _flatten(children)
+
+    _flatten(roots)
+    return result
 
 
 class _HookAnalyser(_BasicAnalyser):
@@ -259,12 +613,13 @@ class _HookAnalyser(_BasicAnalyser):
     def hooks(self) -> typing.Dict[str, typing.Type[AbstractHook]]:
         """Return copy of dict of all analysed hook classes.
 
-        Dict is copied to keep it protected from modifying outside of the class.
+        Dict is copied to keep it protected from modifying outside of the class. Classes
+        themselves aren't copied, use get_classes_view to avoid copying at all.
 
         Returns:
             Copy of dict of all analysed hook classes
         """
-        return copy.deepcopy(self._classes)
+        return dict(self._classes)
 
     def get_hooks(self) -> typing.Dict[str, typing.Type[AbstractHook]]:
         """Return all hooks. Delegates to hooks property."""
@@ -290,12 +645,13 @@ class _ProviderAnalyser(_BasicAnalyser):
     def providers(self) -> typing.Dict[str, typing.Type[AbstractContentProvider]]:
         """Return copy of dict of all analysed providers classes.
 
-        Dict is copied to keep it protected from modifying outside of the class.
+        Dict is copied to keep it protected from modifying outside of the class. Classes
+        themselves aren't copied, use get_classes_view to avoid copying at all.
 
         Returns:
             Copy of dict of all analysed provider classes
         """
-        return copy.deepcopy(self._classes)
+        return dict(self._classes)
 
     def get_providers(self) -> typing.Dict[str, typing.Type[AbstractContentProvider]]:
         """Return all hooks. Delegates to providers property."""
@@ -0,0 +1,165 @@
+"""Reloading of changed hook and provider modules while PHFSystem is running.
+
+HotReloader polls mtimes of all modules in paths given to import_hook_sources and
+import_provider_sources. When some of them change, they are reloaded with importlib.reload,
+the factory reads all paths again, so new and changed classes can be created by commands,
+and running objects of changed classes are switched to the new classes:
+
+- providers just get the new __class__, they aren't restarted. Methods, that cycle() calls
+  after that(like get_content and result_callback), run the new code, but the running cycle()
+  coroutine itself keeps the old code till the provider is restarted(removed and added
+  again);
+- hooks are replaced by objects of the new class with the same attributes, data waiting in
+  the old hook's queue is processed by the new one, see AbstractContentProvider.replace_hook.
+
+Modules, that import classes from changed modules(like a package's __init__.py), are
+reloaded too. Objects, whose classes are defined in other modules and only inherit changed
+classes, keep their classes.
+
+Example:
+    phfsys = PHFSystem()
+    phfsys.import_hook_sources("hooks")
+    phfsys.enable_hot_reload(period=1)
+    phfsys.start()
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib
+import inspect
+import logging
+import os
+import sys
+import typing
+
+if typing.TYPE_CHECKING:
+    from .phfsystem import PHFSystem
+
+logger = logging.getLogger(__name__)
+
+
+class HotReloader:
+    """Watcher, that reloads changed modules of PHFSystem's factory.
+
+    Attributes:
+        _phfsys: PHFSystem, whose factory, providers and hooks are reloaded.
+        _period: float, how often files are checked in seconds.
+        _mtimes: dict {module name: (file path, mtime)} of the last check.
+        _task: asyncio.Task of the watching cycle.
+    """
+
+    def __init__(self, phfsys: PHFSystem, period: float = 1):
+        """Create reloader and remember current mtimes.
+
+        Args:
+            phfsys: system to reload.
+            period: how often files are checked in seconds.
+        """
+        self._phfsys = phfsys
+        self._period = period
+        self._mtimes = self._get_mtimes()
+        self._task = None
+
+    def _get_mtimes(self) -> typing.Dict[str, typing.Tuple[str, float]]:
+        """Return {module name: (file path, mtime)} of all modules of the factory."""
+        mtimes = {}
+        for module_name, file_path in self._phfsys._providers_and_hooks_factory.\
+                get_module_files().items():
+            try:
+                mtimes[module_name] = (file_path, os.stat(file_path).st_mtime)
+            except OSError:
+                continue
+        return mtimes
+
+    def find_changes(self) -> typing.List[str]:
+        """Check files and return names of new and changed modules.
+
+        It's blocking, as all files are checked.
+        """
+        mtimes = self._get_mtimes()
+        changed = [module_name for module_name, entry in mtimes.items()
+                   if self._mtimes.get(module_name) != entry]
+        self._mtimes = mtimes
+        return changed
+
+    def start(self) -> None:
+        """Start watching, has to be called in PHFSystem's loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    def stop(self) -> None:
+        """Stop watching."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self) -> None:
+        """Check files every period and reload changed modules."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self._period)
+            try:
+                changed = await loop.run_in_executor(None, self.find_changes)
+                if changed:
+                    await self.reload(changed)
+            except Exception:
+                # The next check has to be done anyway
+                logger.exception("Changed modules can't be reloaded")
+
+    async def reload(self, module_names: typing.List[str]) -> None:
+        """Reload modules, read classes again and switch running objects to new classes.
+
+        Errors of reloading are logged, modules with errors keep their old code.
+
+        Args:
+            module_names: names of changed modules, not imported ones are skipped.
+        """
+        reloaded = [module_name for module_name in module_names if module_name in sys.modules]
+        old_classes = {module_name: _own_classes(sys.modules[module_name])
+                       for module_name in reloaded}
+        for module_name in reloaded:
+            _reload_module(module_name)
+
+        module_files = self._phfsys._providers_and_hooks_factory.get_module_files()
+        for module_name in module_files:
+            if module_name in sys.modules and module_name not in old_classes \
+                    and _has_stale_classes(sys.modules[module_name], old_classes):
+                _reload_module(module_name)
+
+        try:
+            self._phfsys._providers_and_hooks_factory.rebuild()
+        except Exception:
+            logger.exception("Classes of reloaded modules can't be read, old ones are kept")
+
+        new_classes = {}
+        for module_name, classes in old_classes.items():
+            module = sys.modules[module_name]
+            for name, old_class in classes.items():
+                new_class = getattr(module, name, None)
+                if inspect.isclass(new_class) and new_class is not old_class:
+                    new_classes[old_class] = new_class
+        if new_classes:
+            await self._phfsys.replace_classes(new_classes)
+        logger.info("Reloaded modules: %s", ", ".join(module_names))
+
+
+def _own_classes(module) -> typing.Dict[str, type]:
+    """Return {name: class} of classes defined in the module."""
+    return {name: obj for name, obj in vars(module).items()
+            if inspect.isclass(obj) and obj.__module__ == module.__name__}
+
+
+def _has_stale_classes(module, old_classes: typing.Dict[str, typing.Dict[str, type]]) -> bool:
+    """Return whether module has classes from old versions of reloaded modules."""
+    for obj in vars(module).values():
+        if inspect.isclass(obj) and obj in old_classes.get(obj.__module__, {}).values():
+            return True
+    return False
+
+
+def _reload_module(module_name: str) -> None:
+    """Reload module, errors are logged."""
+    try:
+        importlib.reload(sys.modules[module_name])
+    except Exception:
+        logger.exception("Module %s can't be reloaded", module_name)
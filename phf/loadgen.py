@@ -0,0 +1,428 @@
+"""Synthetic load for sizing deployments.
+
+LoadGeneratorProvider pushes generated payloads through it's hooks with a given rate, payload
+size distribution, burstiness and duration. It doesn't wait for hooks before sending the
+next item, so if hooks are slower than the rate, their queues grow like in production.
+Every item is a LoadItem, hooks get it as data, and the provider records latency from
+creation of an item till all it's hook results are gathered.
+
+run_soak creates hooks by their aliases with a PHFSystem, attaches them to a load generator,
+runs for a fixed time and returns a SoakReport with throughput, latency percentiles, queue
+depths and RSS sampled over time. Everything runs in process, no network is used.
+
+Payload sizes are given as a number of bytes or as a tuple:
+
+- ("fixed", size);
+- ("uniform", min size, max size);
+- ("lognormal", median size, sigma) - mostly small payloads with a long tail of big ones;
+- ("choice", [size, ...]).
+
+Example:
+    report = asyncio.run(run_soak(["DivisionCheckHook"], hook_paths=["hooks"], duration=60,
+                                  rate=1000, payload_size=("lognormal", 4096, 1), burst=10))
+    print(report.to_dict()["summary"])
+
+Or from command line: python -m benchmarks.soak --hook-paths hooks --hooks DivisionCheckHook
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import math
+import os
+import random
+import sys
+import time
+import typing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .provider import AbstractContentProvider
+
+if typing.TYPE_CHECKING:
+    from .abstracthook import AbstractHook
+
+
+class LoadItem:
+    """Data, sent to hooks by LoadGeneratorProvider.
+
+    Attributes:
+        sequence: int, number of the item.
+        created: float, time.perf_counter() when the item was created.
+        payload: bytes of the generated size.
+    """
+
+    __slots__ = ("sequence", "created", "payload")
+
+    def __init__(self, sequence: int, created: float, payload: bytes):
+        self.sequence = sequence
+        self.created = created
+        self.payload = payload
+
+
+def make_size_sampler(payload_size: typing.Union[int, tuple],
+                      rng: random.Random) -> typing.Callable[[], int]:
+    """Make function, that returns sizes of payloads by their distribution.
+
+    Args:
+        payload_size: number of bytes or distribution tuple, see module docs.
+        rng: random generator to use.
+
+    Raises:
+        ValueError: if the distribution is unknown.
+    """
+    if isinstance(payload_size, int):
+        payload_size = ("fixed", payload_size)
+    kind, *params = payload_size
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: rng.randint(params[0], params[1])
+    if kind == "lognormal":
+        mu = math.log(max(params[0], 1))
+        return lambda: int(rng.lognormvariate(mu, params[1]))
+    if kind == "choice":
+        sizes = list(params[0])
+        return lambda: rng.choice(sizes)
+    raise ValueError(f'Unknown payload size distribution "{kind}"')
+
+
+class LoadGeneratorProvider(AbstractContentProvider):
+    """Provider, that generates items with a given rate.
+
+    Items are sent in bursts of burst items, bursts are spread evenly, so the average rate
+    stays the same. Results of hooks are gathered by a separate task as the provider's gather
+    strategy says, so sending never waits for hooks.
+
+    Attributes:
+        rate: float, average amount of items per second.
+        burst: int, amount of items sent at once.
+        duration: float or None, how long to generate items in seconds, None is endless.
+        _size_sampler: callable, that returns size of the next payload.
+        _payloads: dict {size: bytes}, payloads are shared between items of the same size.
+        _sent: int, amount of sent items.
+        _completed: int, amount of items, whose results are gathered.
+        _errors: int, amount of exceptions returned by hooks.
+        _latencies: list of latencies in seconds, that are not taken by pop_latencies yet.
+        _created_times: collections.deque of creation times of items without gathered results.
+        _generating: bool, whether items are still being sent.
+        _items_sent: asyncio.Event, set when new items are sent or sending is finished.
+        _finished: asyncio.Event, set when all items are sent and their results are gathered
+            or the provider is stopped.
+    """
+    _alias = ["load_generator"]
+
+    def __new__(cls, *args, **kwargs):
+        obj = AbstractContentProvider.__new__(cls, *args, **kwargs)
+        obj._is_with_callback = True
+        return obj
+
+    def __init__(self,
+                 rate: float = 100,
+                 payload_size: typing.Union[int, tuple] = 1024,
+                 burst: int = 1,
+                 duration: float = None,
+                 seed: int = None,
+                 *args, **kwargs):
+        """Create the provider.
+
+        Args:
+            rate: average amount of items per second.
+            payload_size: number of bytes or distribution tuple, see module docs.
+            burst: amount of items sent at once.
+            duration: how long to generate items in seconds, None is endless.
+            seed: seed of random generator for payload sizes.
+        """
+        super().__init__(*args, **kwargs)
+        if rate <= 0:
+            raise ValueError(f"Rate has to be positive, got {rate}")
+        if burst < 1:
+            raise ValueError(f"Burst has to be positive, got {burst}")
+        self.rate = rate
+        self.burst = burst
+        self.duration = duration
+        self._size_sampler = make_size_sampler(payload_size, random.Random(seed))
+        self._payloads = {}
+        self._sent = 0
+        self._completed = 0
+        self._errors = 0
+        self._latencies = []
+        self._created_times = collections.deque()
+        self._generating = False
+        self._items_sent = None
+        self._finished = None
+
+    def _make_item(self) -> LoadItem:
+        """Create the next item."""
+        size = max(0, self._size_sampler())
+        payload = self._payloads.get(size)
+        if payload is None:
+            payload = self._payloads[size] = os.urandom(size)
+        item = LoadItem(self._sent, time.perf_counter(), payload)
+        self._sent += 1
+        self._created_times.append(item.created)
+        return item
+
+    async def cycle(self) -> None:
+        """Send items till duration ends, wait for their results and idle till stop.
+
+        Can be stopped by self.stop()"""
+        async with self:
+            self._finished = asyncio.Event()
+            self._items_sent = asyncio.Event()
+            self._generating = True
+            collector = asyncio.create_task(self._collect())
+            try:
+                await self._generate()
+                self._generating = False
+                self._items_sent.set()
+                await collector
+                self._finished.set()
+                # Hooks keep running till the provider is stopped, like with any provider
+                await asyncio.get_running_loop().create_future()
+            finally:
+                collector.cancel()
+                self._finished.set()
+
+    async def _generate(self) -> None:
+        """Send bursts of items on schedule."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        end = start + self.duration if self.duration is not None else None
+        burst_period = self.burst / self.rate
+        next_burst = start
+        while self._is_running():
+            now = loop.time()
+            if end is not None and now >= end:
+                break
+            if next_burst > now:
+                await asyncio.sleep(next_burst - now)
+                continue
+            for _ in range(self.burst):
+                await self._notify_all_hooks(self._make_item())
+            self._items_sent.set()
+            next_burst += burst_period
+
+    async def _collect(self) -> None:
+        """Gather results of sent items in order and record their latencies."""
+        while True:
+            if self._completed >= self._sent:
+                if not self._generating:
+                    return
+                self._items_sent.clear()
+                await self._items_sent.wait()
+                continue
+            results = await self._run_result_callback()
+            self._errors += sum(isinstance(result, Exception) for result in results)
+            self._latencies.append(time.perf_counter() - self._created_times.popleft())
+            self._completed += 1
+
+    def get_sent_amount(self) -> int:
+        """Return amount of sent items."""
+        return self._sent
+
+    def get_completed_amount(self) -> int:
+        """Return amount of items, whose results are gathered."""
+        return self._completed
+
+    def get_errors_amount(self) -> int:
+        """Return amount of exceptions returned by hooks."""
+        return self._errors
+
+    def pop_latencies(self) -> typing.List[float]:
+        """Return latencies recorded since the previous call in seconds."""
+        latencies, self._latencies = self._latencies, []
+        return latencies
+
+    async def wait_finished(self) -> None:
+        """Wait till all items are sent and their results are gathered."""
+        while self._finished is None:
+            await asyncio.sleep(0.01)
+        await self._finished.wait()
+
+
+class SoakSample:
+    """State of a soak test at one moment.
+
+    Attributes:
+        elapsed: float, seconds since the start.
+        sent: int, amount of sent items.
+        completed: int, amount of items, whose results are gathered.
+        throughput: float, completed items per second since the previous sample.
+        latency_p50, latency_p90, latency_p99, latency_max: float or None, latencies of items
+            completed since the previous sample in seconds.
+        queue_depth: int, amount of items waiting in all hooks' queues.
+        max_queue_depth: int, the longest queue of a hook.
+        rss: int or None, resident memory of the process in bytes.
+    """
+
+    def __init__(self, elapsed: float, sent: int, completed: int, throughput: float,
+                 latencies: typing.List[float], queue_depths: typing.List[int],
+                 rss: typing.Optional[int]):
+        latencies = sorted(latencies)
+        self.elapsed = elapsed
+        self.sent = sent
+        self.completed = completed
+        self.throughput = throughput
+        self.latency_p50 = percentile(latencies, 0.5)
+        self.latency_p90 = percentile(latencies, 0.9)
+        self.latency_p99 = percentile(latencies, 0.99)
+        self.latency_max = latencies[-1] if latencies else None
+        self.queue_depth = sum(queue_depths)
+        self.max_queue_depth = max(queue_depths, default=0)
+        self.rss = rss
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return dict(vars(self))
+
+
+class SoakReport:
+    """Results of run_soak.
+
+    Attributes:
+        config: dict of parameters of the run.
+        samples: list of SoakSample taken every sample_interval.
+        latencies: sorted list of latencies of all completed items in seconds.
+        sent: int, amount of sent items.
+        completed: int, amount of items, whose results are gathered.
+        errors: int, amount of exceptions returned by hooks.
+        elapsed: float, how long the load was generated in seconds.
+    """
+
+    def __init__(self, config: typing.Dict[str, typing.Any]):
+        self.config = config
+        self.samples = []
+        self.latencies = []
+        self.sent = 0
+        self.completed = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def get_summary(self) -> typing.Dict[str, typing.Any]:
+        """Return totals of the whole run."""
+        rss = [sample.rss for sample in self.samples if sample.rss is not None]
+        return {
+            "sent": self.sent,
+            "completed": self.completed,
+            "errors": self.errors,
+            "elapsed": self.elapsed,
+            "throughput": self.completed / self.elapsed if self.elapsed else 0.0,
+            "latency_p50": percentile(self.latencies, 0.5),
+            "latency_p90": percentile(self.latencies, 0.9),
+            "latency_p99": percentile(self.latencies, 0.99),
+            "latency_max": self.latencies[-1] if self.latencies else None,
+            "max_queue_depth": max((sample.max_queue_depth for sample in self.samples),
+                                   default=0),
+            "max_rss": max(rss, default=None),
+        }
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """Return the report as a JSON-serializable dict."""
+        return {"config": self.config,
+                "summary": self.get_summary(),
+                "samples": [sample.to_dict() for sample in self.samples]}
+
+
+async def run_soak(hooks: typing.List[typing.Union[str, tuple]],
+                   hook_paths: typing.List[str] = (),
+                   duration: float = 10,
+                   rate: float = 100,
+                   payload_size: typing.Union[int, tuple] = 1024,
+                   burst: int = 1,
+                   sample_interval: float = 1,
+                   seed: int = None,
+                   drain_timeout: float = 10) -> SoakReport:
+    """Run hooks under generated load in a new PHFSystem and measure them.
+
+    Has to be awaited in the loop, where the system will run.
+
+    Args:
+        hooks: list of hook aliases or (alias, args, kwargs) tuples, hooks are created by
+            PHFSystem's factory.
+        hook_paths: paths to read hooks from, see PHFSystem.import_hook_sources.
+        duration: how long to generate load in seconds.
+        rate: average amount of items per second.
+        payload_size: number of bytes or distribution tuple, see module docs.
+        burst: amount of items sent at once.
+        sample_interval: how often samples are taken in seconds.
+        seed: seed of random generator for payload sizes.
+        drain_timeout: max time to wait for results of already sent items after duration.
+
+    Returns:
+        SoakReport of the run.
+    """
+    from .phfsystem import PHFSystem
+
+    specs = [(spec, [], {}) if isinstance(spec, str) else tuple(spec) for spec in hooks]
+    phfsys = PHFSystem()
+    if hook_paths:
+        phfsys.import_hook_sources(*hook_paths)
+    load_generator = LoadGeneratorProvider(rate=rate, payload_size=payload_size, burst=burst,
+                                           duration=duration, seed=seed)
+    hook_objects = [phfsys.create_hook(alias, list(args or []), dict(kwargs or {}))
+                    for alias, args, kwargs in specs]
+    load_generator.add_hooks(hook_objects)
+    phfsys.add_provider(load_generator)
+
+    report = SoakReport({"hooks": [list(spec) for spec in specs], "duration": duration,
+                         "rate": rate, "payload_size": payload_size, "burst": burst,
+                         "sample_interval": sample_interval, "seed": seed})
+    await phfsys.start_async()
+    start = time.perf_counter()
+    previous_completed, previous_time = 0, start
+    finished = asyncio.ensure_future(load_generator.wait_finished())
+    deadline = start + duration + drain_timeout
+    try:
+        while not finished.done() and time.perf_counter() < deadline:
+            await asyncio.wait([finished], timeout=sample_interval)
+            now = time.perf_counter()
+            latencies = load_generator.pop_latencies()
+            report.latencies.extend(latencies)
+            completed = load_generator.get_completed_amount()
+            report.samples.append(SoakSample(
+                now - start, load_generator.get_sent_amount(), completed,
+                (completed - previous_completed) / (now - previous_time) if now > previous_time
+                else 0.0,
+                latencies, _queue_depths(hook_objects), _current_rss()))
+            previous_completed, previous_time = completed, now
+    finally:
+        finished.cancel()
+        report.elapsed = min(time.perf_counter() - start, duration)
+        report.sent = load_generator.get_sent_amount()
+        report.completed = load_generator.get_completed_amount()
+        report.errors = load_generator.get_errors_amount()
+        report.latencies.extend(load_generator.pop_latencies())
+        report.latencies.sort()
+        await phfsys.stop_async(drain=False, timeout=drain_timeout)
+    return report
+
+
+def percentile(sorted_values: typing.List[float], fraction: float) -> typing.Optional[float]:
+    """Return nearest-rank percentile of sorted values or None if there are none."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _queue_depths(hooks: typing.List[AbstractHook]) -> typing.List[int]:
+    """Return amounts of items waiting in queues of hooks."""
+    return [hook._asyncio_queue.qsize() if hook._asyncio_queue is not None else 0
+            for hook in hooks]
+
+
+def _current_rss() -> typing.Optional[int]:
+    """Return resident memory of the process in bytes, peak one if current is unknown."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
@@ -0,0 +1,283 @@
+"""Metrics of a running PHFSystem in Prometheus text format.
+
+When metrics are enabled, providers and hooks of the system count their work:
+
+- phf_hook_queue_depth, phf_hook_callback_queue_depth: data waiting for the hook and results
+  waiting for the provider;
+- phf_hook_items_total, phf_hook_errors_total: processed data and exceptions of hook_action;
+- phf_hook_action_seconds: histogram of hook_action durations;
+- phf_provider_ticks_total: ticks of providers or messages of ComplexContentProviders;
+- phf_provider_tick_lag_seconds: how late the last tick of PeriodicContentProvider started;
+- phf_message_system_pending, phf_message_system_stored_results: messages not yet taken by
+  ComplexContentProvider and answers kept by it's MessageSystem;
+- phf_commands_total, phf_command_queue_depth: executed and waiting commands;
+- phf_loop_lag_seconds, phf_slow_steps: lag of loops and steps, that blocked them, per class,
+  when watchdog is enabled, see watchdog module.
+
+MetricsServer serves them over HTTP from PHFSystem's loop, without any dependencies.
+
+Example:
+    phfsys.enable_metrics(port=9100)
+    phfsys.start()
+    # curl http://127.0.0.1:9100/metrics
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from .phfsystem import PHFSystem
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                   5, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Histogram with fixed buckets.
+
+    Attributes:
+        buckets: tuple of upper bounds of buckets.
+        counts: list of amounts of values in every bucket and in +Inf bucket, not cumulative.
+        sum: float, sum of all values.
+        count: int, amount of all values.
+    """
+
+    def __init__(self, buckets: typing.Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Add value to the histogram."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HookStats:
+    """Counters of a hook.
+
+    Attributes:
+        items: int, amount of processed data.
+        errors: int, amount of exceptions raised by hook_action.
+        latency: Histogram of hook_action durations in seconds.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    def observe(self, duration: float, failed: bool) -> None:
+        """Count processed data."""
+        self.items += 1
+        self.errors += failed
+        self.latency.observe(duration)
+
+
+class ProviderStats:
+    """Counters of a provider.
+
+    Attributes:
+        ticks: int, amount of ticks or messages.
+        tick_lag: float, how late the last tick started in seconds.
+        _next_tick: float or None, time.monotonic() when the next tick should start.
+    """
+
+    def __init__(self):
+        self.ticks = 0
+        self.tick_lag = 0.0
+        self._next_tick = None
+
+    def tick_started(self) -> None:
+        """Count tick and it's lag."""
+        self.ticks += 1
+        if self._next_tick is not None:
+            self.tick_lag = max(0.0, time.monotonic() - self._next_tick)
+
+    def tick_finished(self, period: float) -> None:
+        """Remember when the next tick should start."""
+        self._next_tick = time.monotonic() + period
+
+
+def _labels(**labels) -> str:
+    """Return labels in exposition format."""
+    escaped = []
+    for name, value in labels.items():
+        value = "" if value is None else str(value)
+        value = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Family:
+    """Lines of one metric with it's HELP and TYPE."""
+
+    def __init__(self, name: str, metric_type: str, help_text: str):
+        self.name = name
+        self.lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+
+    def add(self, value: float, suffix: str = "", **labels) -> None:
+        self.lines.append(f"{self.name}{suffix}{_labels(**labels) if labels else ''} {value}")
+
+    def add_histogram(self, histogram: Histogram, **labels) -> None:
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += count
+            self.add(cumulative, "_bucket", **labels, le=bound)
+        self.add(histogram.sum, "_sum", **labels)
+        self.add(histogram.count, "_count", **labels)
+
+
+def render(phfsys: PHFSystem) -> str:
+    """Return metrics of the system in Prometheus text format.
+
+    Counters of providers and hooks are present only when metrics are enabled.
+    """
+    providers = phfsys.get_providers()
+    families = {name: _Family(name, metric_type, help_text) for name, metric_type, help_text in [
+        ("phf_providers", "gauge", "Amount of providers."),
+        ("phf_hooks", "gauge", "Amount of hooks."),
+        ("phf_provider_ticks_total", "counter", "Ticks of providers."),
+        ("phf_provider_tick_lag_seconds", "gauge", "How late the last tick started."),
+        ("phf_message_system_pending", "gauge", "Messages not taken by the provider yet."),
+        ("phf_message_system_stored_results", "gauge", "Answers kept by MessageSystem."),
+        ("phf_hook_queue_depth", "gauge", "Data waiting for the hook."),
+        ("phf_hook_callback_queue_depth", "gauge", "Results waiting for the provider."),
+        ("phf_hook_items_total", "counter", "Data processed by the hook."),
+        ("phf_hook_errors_total", "counter", "Exceptions raised by hook_action."),
+        ("phf_hook_action_seconds", "histogram", "Durations of hook_action."),
+        ("phf_commands_total", "counter", "Executed commands."),
+        ("phf_command_queue_depth", "gauge", "Commands waiting for execution."),
+        ("phf_loop_lag_seconds", "gauge", "Lag of the last wake up of the loop."),
+        ("phf_slow_steps", "gauge", "Kept steps, that blocked the loop longer than threshold."),
+    ]}
+
+    hooks_amount = 0
+    for content_provider in providers:
+        provider_labels = {"provider": content_provider.get_id(),
+                           "provider_name": content_provider.get_name(),
+                           "class": type(content_provider).__name__}
+        stats = content_provider._stats
+        if stats is not None:
+            families["phf_provider_ticks_total"].add(stats.ticks, **provider_labels)
+            families["phf_provider_tick_lag_seconds"].add(stats.tick_lag, **provider_labels)
+        if hasattr(content_provider, "get_message_system"):
+            message_system = content_provider.get_message_system()
+            families["phf_message_system_pending"].add(
+                message_system.get_pending_amount(), provider=content_provider.get_id())
+            families["phf_message_system_stored_results"].add(
+                message_system.get_stored_results_amount(), provider=content_provider.get_id())
+
+        for hook in content_provider.get_hooks():
+            hooks_amount += 1
+            hook_labels = {"provider": content_provider.get_id(), "hook": hook.get_id(),
+                           "hook_name": hook.get_name(), "class": type(hook).__name__}
+            for family, queue in [("phf_hook_queue_depth", hook._asyncio_queue),
+                                  ("phf_hook_callback_queue_depth", hook._callback_queue)]:
+                families[family].add(queue.qsize() if queue is not None else 0, **hook_labels)
+            stats = hook._stats
+            if stats is not None:
+                families["phf_hook_items_total"].add(stats.items, **hook_labels)
+                families["phf_hook_errors_total"].add(stats.errors, **hook_labels)
+                families["phf_hook_action_seconds"].add_histogram(stats.latency, **hook_labels)
+
+    families["phf_providers"].add(len(providers))
+    families["phf_hooks"].add(hooks_amount)
+    for command_name, amount in sorted(phfsys.get_command_counts().items()):
+        families["phf_commands_total"].add(amount, command=command_name)
+    command_queue = phfsys._command_queue
+    families["phf_command_queue_depth"].add(command_queue.qsize()
+                                            if command_queue is not None else 0)
+    for loop_name, lag in phfsys.get_loop_lags().items():
+        families["phf_loop_lag_seconds"].add(lag, loop=loop_name)
+    slow_steps = {}
+    for event in phfsys.get_slow_steps():
+        key = (event.loop_name, event.owner_kind, event.owner_class)
+        slow_steps[key] = slow_steps.get(key, 0) + 1
+    for (loop_name, owner_kind, owner_class), amount in sorted(slow_steps.items(), key=str):
+        families["phf_slow_steps"].add(amount, loop=loop_name, kind=owner_kind,
+                                       **{"class": owner_class})
+    return "\n".join(line for family in families.values() for line in family.lines) + "\n"
+
+
+class MetricsServer:
+    """Minimal HTTP server, that answers GET /metrics with render(phfsys).
+
+    Attributes:
+        _phfsys: PHFSystem to render.
+        _host: str, address to listen on.
+        _port: int, port to listen on, 0 for any free port.
+        _server: asyncio.AbstractServer or None if it isn't started.
+    """
+
+    def __init__(self, phfsys: PHFSystem, host: str = "127.0.0.1", port: int = 9100):
+        self._phfsys = phfsys
+        self._host = host
+        self._port = port
+        self._server = None
+
+    def get_port(self) -> int:
+        """Return port, the real one if the server is started."""
+        if self._server is not None and self._server.sockets:
+            return self._server.sockets[0].getsockname()[1]
+        return self._port
+
+    async def start(self) -> None:
+        """Start listening in the running loop."""
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle, self._host, self._port)
+
+    def start_soon(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start listening in loop, can be called from any thread.
+
+        Nobody awaits the start, so errors like a taken port are logged.
+        """
+        def _start():
+            task = asyncio.ensure_future(self.start())
+            task.add_done_callback(self._log_start_error)
+
+        loop.call_soon_threadsafe(_start)
+
+    def _log_start_error(self, task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Metrics server can't listen on %s:%s", self._host, self._port,
+                         exc_info=task.exception())
+
+    async def stop(self) -> None:
+        """Stop listening."""
+        if self._server is not None:
+            server, self._server = self._server, None
+            server.close()
+            await server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer one request and close the connection."""
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] in ("GET", "HEAD") and \
+                    parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", render(self._phfsys).encode()
+            else:
+                status, body = "404 Not Found", b"Not found, try /metrics\n"
+            head = f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n" \
+                   f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+            writer.write(head.encode() + (body if parts and parts[0] != "HEAD" else b""))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception("Metrics request failed")
+        finally:
+            writer.close()
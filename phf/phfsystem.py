@@ -1,6 +1,8 @@
 """Main module of the framework.
 
 Contains PHFSystem class, which is environment of the framework.
+
+If uvloop is installed, PHFSystem runs on uvloop's event loop by default.
 """
 from __future__ import annotations
 
@@ -8,9 +10,19 @@ import asyncio
 import typing
 from typing import TYPE_CHECKING
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from .commandinput import AbstractCommandInput, Command
 from .factory import HookAndProviderFactory
-from .provider import AbstractContentProvider
+from .hotreload import HotReloader
+from .metrics import HookStats, MetricsServer, ProviderStats, render
+from .provider import AbstractContentProvider, _get_running_loop
+from .sharding import PlacementPolicy, RoundRobinPlacement, Shard
+from .tracing import Tracer
+from .watchdog import LoopWatchdog, SlowStepEvent
 
 if TYPE_CHECKING:
     from abstracthook import AbstractHook
@@ -20,24 +32,149 @@ class PHFSystem:
     """PHFSystem is environment and main facade of framework.
 
     Attributes:
-        _providers: list of all providers.
+        _providers: dict {id: provider} of all providers in order of adding.
+        _provider_names: dict {name: provider} of named providers.
+        _hooks: dict {id: (hook, provider)} of hooks of all providers.
+        _hook_names: dict {name: hook} of named hooks.
+        _next_provider_id: int, id for the next added provider.
         _running_state: state, shows if framework is running now.
         _input_sources: list of all input sources.
         _providers_and_hooks_factory: factory for hook and provider creation.
         _asyncio_loop: eventloop, in which the system is running.
         _command_queue: asyncio.Queue, to which the commands go.
+        _loop_factory: callable without arguments that creates the event loop for start().
+        _shards: list of sharding.Shard, event loops in other threads for providers.
+        _placement: sharding.PlacementPolicy, chooses shards for providers.
+        _provider_shards: dict {provider: shard number}, where the provider runs.
+        _main_task: asyncio.Task, executes commands.
+        _stopped_event: asyncio.Event, set when stop_async() is finished.
+        _topology_lock: asyncio.Lock, makes commands that change topology and replacing of
+            classes run one by one.
+        _hot_reloader: hotreload.HotReloader or None, reloads changed hook and provider modules.
+        _tracer: tracing.Tracer or None, tracer of all providers.
+        _command_counts: dict {command class name: amount of executed commands}.
+        _metrics_enabled: bool, whether providers and hooks count their work.
+        _metrics_server: metrics.MetricsServer or None, serves metrics over HTTP.
+        _watchdogs: dict {loop name: watchdog.LoopWatchdog} of the main loop and shards, empty
+            if watchdog isn't enabled.
     """
 
-    def __init__(self):
-        self._providers = []
+    def __init__(self,
+                 loop_factory: typing.Union[typing.Callable[[], asyncio.AbstractEventLoop],
+                                            asyncio.AbstractEventLoopPolicy] = None,
+                 use_uvloop: bool = True,
+                 shards_amount: int = 0,
+                 placement: PlacementPolicy = None,
+                 discovery: str = "import",
+                 manifest_path: str = None,
+                 scan_workers: int = 0,
+                 tracer: Tracer = None):
+        """Create the system.
+
+        Args:
+            loop_factory: callable that returns a new event loop or an event loop policy
+                whose new_event_loop is used. If not set, uvloop is used when it's installed
+                and use_uvloop is True, default asyncio loop otherwise.
+            use_uvloop: whether to use uvloop when no loop_factory is given.
+            shards_amount: amount of event loop threads for providers. If 0, providers run
+                in the main loop.
+            placement: policy to place providers on shards, RoundRobinPlacement by default.
+            discovery: "import" or "static", how the factory reads hook and provider
+                sources, see HookAndProviderFactory.
+            manifest_path: path to manifest file for static discovery.
+            scan_workers: amount of threads to read hook and provider sources with.
+            tracer: Tracer to record ticks of all providers to, see tracing module.
+        """
+        if isinstance(loop_factory, asyncio.AbstractEventLoopPolicy):
+            loop_factory = loop_factory.new_event_loop
+        if loop_factory is None:
+            if use_uvloop and uvloop is not None:
+                loop_factory = uvloop.new_event_loop
+            else:
+                loop_factory = asyncio.new_event_loop
+
+        if placement is None:
+            placement = RoundRobinPlacement()
+
+        self._loop_factory = loop_factory
+        self._shards = [Shard(number, loop_factory) for number in range(shards_amount)]
+        self._placement = placement
+        self._provider_shards = {}
+        self._main_task = None
+        self._stopped_event = None
+        self._topology_lock = None
+        self._providers = {}
+        self._provider_names = {}
+        self._hooks = {}
+        self._hook_names = {}
+        self._next_provider_id = 0
         self._running_state = False
         self._input_sources = []
-        self._providers_and_hooks_factory = HookAndProviderFactory()
+        self._providers_and_hooks_factory = HookAndProviderFactory(discovery=discovery,
+                                                                   manifest_path=manifest_path,
+                                                                   scan_workers=scan_workers)
         self._asyncio_loop = None
         self._command_queue = None
+        self._hot_reloader = None
+        self._tracer = tracer
+        self._command_counts = {}
+        self._metrics_enabled = False
+        self._metrics_server = None
+        self._watchdogs = {}
 
     def get_providers(self) -> typing.List[AbstractContentProvider]:
-        return self._providers[:]
+        return list(self._providers.values())
+
+    def get_provider(self, key: typing.Union[int, str]) -> AbstractContentProvider:
+        """Find provider by it's id or name.
+
+        Args:
+            key: int id or str name of the provider.
+
+        Returns:
+            Found provider.
+
+        Raises:
+            KeyError: if there is no such provider.
+        """
+        if isinstance(key, str):
+            index = self._provider_names
+        else:
+            index = self._providers
+        try:
+            return index[key]
+        except KeyError:
+            raise KeyError(f"No provider {key!r}") from None
+
+    def get_hook(self, key: typing.Union[int, str]) -> AbstractHook:
+        """Find hook of any provider by it's id or name.
+
+        Args:
+            key: int id or str name of the hook.
+
+        Returns:
+            Found hook.
+
+        Raises:
+            KeyError: if there is no such hook.
+        """
+        try:
+            if isinstance(key, str):
+                return self._hook_names[key]
+            return self._hooks[key][0]
+        except KeyError:
+            raise KeyError(f"No hook {key!r}") from None
+
+    def get_hook_provider(self, key: typing.Union[int, str]) -> AbstractContentProvider:
+        """Find provider of the hook with given id or name.
+
+        Args:
+            key: int id or str name of the hook.
+
+        Returns:
+            Provider, to which the hook is linked.
+        """
+        return self._hooks[self.get_hook(key).get_id()][1]
 
     def import_provider_sources(self, *args) -> None:
         """Read providers from paths
@@ -97,16 +234,408 @@ class PHFSystem:
             kwargs
         )
 
+    def enable_hot_reload(self, period: float = 1) -> None:
+        """Start reloading changed hook and provider modules, see hotreload module.
+
+        Only modules from paths, that are already imported with import_hook_sources and
+        import_provider_sources, are watched.
+
+        Args:
+            period: how often files are checked in seconds.
+        """
+        self.disable_hot_reload()
+        self._hot_reloader = HotReloader(self, period)
+        if self._running_state:
+            self._asyncio_loop.call_soon_threadsafe(self._hot_reloader.start)
+
+    def set_tracer(self, tracer: typing.Optional[Tracer]) -> None:
+        """Set tracer of all current and future providers, None turns tracing off.
+
+        If the tracer has a path, the trace is written there when the system stops.
+        """
+        self._tracer = tracer
+        for content_provider in self._providers.values():
+            content_provider.set_tracer(tracer)
+
+    def get_tracer(self) -> typing.Optional[Tracer]:
+        """Return tracer of the system."""
+        return self._tracer
+
+    def enable_metrics(self, port: typing.Optional[int] = 9100, host: str = "127.0.0.1") -> None:
+        """Make all providers and hooks count their work and serve metrics, see metrics module.
+
+        Args:
+            port: port of the HTTP endpoint, 0 for any free port. If None, metrics are
+                only available with get_metrics().
+            host: address of the HTTP endpoint.
+        """
+        self.disable_metrics()
+        self._metrics_enabled = True
+        for content_provider in self._providers.values():
+            content_provider._stats = ProviderStats()
+        for hook, _ in self._hooks.values():
+            hook._stats = HookStats()
+        if port is not None:
+            self._metrics_server = MetricsServer(self, host, port)
+            if self._running_state:
+                self._metrics_server.start_soon(self._asyncio_loop)
+
+    def disable_metrics(self) -> None:
+        """Stop counting and serving metrics, counters are thrown away."""
+        self._metrics_enabled = False
+        for content_provider in self._providers.values():
+            content_provider._stats = None
+        for hook, _ in self._hooks.values():
+            hook._stats = None
+        if self._metrics_server is None:
+            return
+        metrics_server, self._metrics_server = self._metrics_server, None
+        if self._running_state:
+            self._asyncio_loop.call_soon_threadsafe(asyncio.ensure_future, metrics_server.stop())
+
+    def get_metrics(self) -> str:
+        """Return metrics of the system in Prometheus text format."""
+        return render(self)
+
+    def get_metrics_port(self) -> typing.Optional[int]:
+        """Return port of the metrics endpoint or None if it isn't enabled."""
+        if self._metrics_server is None:
+            return None
+        return self._metrics_server.get_port()
+
+    def get_command_counts(self) -> typing.Dict[str, int]:
+        """Return dict {command class name: amount of executed commands}."""
+        return dict(self._command_counts)
+
+    def enable_watchdog(self,
+                        threshold: float = 0.1,
+                        interval: float = None,
+                        max_events: int = 1000) -> None:
+        """Watch lags of the main loop and shards and report blocking steps, see watchdog module.
+
+        Args:
+            threshold: steps of hooks and providers longer than it in seconds are reported.
+            interval: how often loops are checked, threshold / 2 by default.
+            max_events: only the newest max_events events of every loop are kept.
+        """
+        self.disable_watchdog()
+        loop_names = ["main"] + [f"shard-{shard.number}" for shard in self._shards]
+        self._watchdogs = {loop_name: LoopWatchdog(threshold, interval, max_events, loop_name)
+                           for loop_name in loop_names}
+        if self._running_state:
+            self._start_watchdogs()
+
+    def disable_watchdog(self) -> None:
+        """Stop watching loops, events are thrown away."""
+        for watchdog in self._watchdogs.values():
+            watchdog.stop()
+        self._watchdogs = {}
+
+    def _start_watchdogs(self) -> None:
+        """Start watchdogs in their loops, can be called from any thread."""
+        loops = {"main": self._asyncio_loop}
+        for shard in self._shards:
+            loops[f"shard-{shard.number}"] = shard.get_loop()
+        for loop_name, watchdog in self._watchdogs.items():
+            loops[loop_name].call_soon_threadsafe(watchdog.start)
+
+    def get_slow_steps(self) -> typing.List[SlowStepEvent]:
+        """Return steps of hooks and providers, that blocked their loops, the oldest first.
+
+        Returns:
+            List of watchdog.SlowStepEvent of all loops, empty if watchdog isn't enabled.
+        """
+        events = [event for watchdog in self._watchdogs.values()
+                  for event in watchdog.get_events()]
+        return sorted(events, key=lambda event: event.started)
+
+    def get_loop_lags(self) -> typing.Dict[str, float]:
+        """Return dict {loop name: lag of it's last wake up in seconds}.
+
+        Loop names are "main" and "shard-n", the dict is empty if watchdog isn't enabled.
+        """
+        return {loop_name: watchdog.get_lag() for loop_name, watchdog in self._watchdogs.items()}
+
+    def disable_hot_reload(self) -> None:
+        """Stop reloading changed modules."""
+        if self._hot_reloader is None:
+            return
+        hot_reloader, self._hot_reloader = self._hot_reloader, None
+        if self._running_state:
+            self._asyncio_loop.call_soon_threadsafe(hot_reloader.stop)
+
+    async def replace_classes(self, new_classes: typing.Dict[type, type]) -> None:
+        """Switch providers and hooks of old classes to new classes.
+
+        Providers get new __class__ in place, their running cycle() keeps the old code till
+        they are restarted, only methods it calls later run the new code. Hooks are replaced
+        by objects of new classes with the same attributes, see
+        AbstractContentProvider.replace_hook.
+
+        While PHFSystem is running, classes are switched under the topology lock, so commands
+        can't remove providers and hooks meanwhile.
+
+        Args:
+            new_classes: dict {old class: new class}.
+        """
+        if self._topology_lock is None:
+            await self._replace_classes(new_classes)
+            return
+        async with self._topology_lock:
+            await self._replace_classes(new_classes)
+
+    async def _replace_classes(self, new_classes: typing.Dict[type, type]) -> None:
+        """Body of replace_classes."""
+        for content_provider in self._providers.values():
+            new_class = new_classes.get(type(content_provider))
+            if new_class is not None:
+                content_provider.__class__ = new_class
+
+        replaces = []
+        for hook, content_provider in list(self._hooks.values()):
+            new_class = new_classes.get(type(hook))
+            if new_class is not None:
+                replaces.append(self._run_in_provider_loop(
+                    content_provider,
+                    content_provider.replace_hook(hook, hook._copy_with_class(new_class))
+                ))
+        await asyncio.gather(*replaces)
+
+    def get_shards(self) -> typing.List[Shard]:
+        """Return copy of list of all shards."""
+        return self._shards[:]
+
+    def get_provider_shard(self, content_provider: AbstractContentProvider) -> typing.Optional[int]:
+        """Return number of shard where the provider runs.
+
+        Args:
+            content_provider: provider to check.
+
+        Returns:
+            Number of the shard or None if provider runs in the main loop or isn't started.
+        """
+        return self._provider_shards.get(content_provider)
+
     def add_provider(self,
-                     content_provider: AbstractContentProvider) -> None:
+                     content_provider: AbstractContentProvider,
+                     shard: int = None,
+                     name: str = None) -> int:
         """Add a content provider and run it if PHFSystem is running.
 
+        Provider gets an id, that never changes and isn't reused after the provider is
+        removed. Provider's hooks are indexed too, so they can be found by their ids and names.
+
         Args:
             content_provider: provider to add.
+            shard: number of shard to run the provider in. If not set, placement
+                policy chooses the shard.
+            name: unique name of the provider, provider's own name is used if not set.
+
+        Returns:
+            Id of the provider.
+
+        Raises:
+            NameDoublingError: if the provider's or one of it's hooks' names is taken.
+            ValueError: if there is no such shard.
         """
-        self._providers.append(content_provider)
+        if shard is not None and shard not in range(len(self._shards)):
+            raise ValueError(f"No shard {shard}, there are {len(self._shards)} shards")
+        if name is not None:
+            content_provider.set_name(name)
+        name = content_provider.get_name()
+        if name is not None and name in self._provider_names:
+            raise NameDoublingError(f"Provider name {name!r} is already taken")
+        self._check_hook_names(content_provider.get_hooks())
+
+        content_provider._id = self._next_provider_id
+        self._next_provider_id += 1
+        self._providers[content_provider.get_id()] = content_provider
+        if name is not None:
+            self._provider_names[name] = content_provider
+        self._index_hooks(content_provider, content_provider.get_hooks())
+        content_provider._index_listener = self
+        if self._tracer is not None:
+            content_provider.set_tracer(self._tracer)
+        if self._metrics_enabled and content_provider._stats is None:
+            content_provider._stats = ProviderStats()
+        if shard is not None:
+            self._provider_shards[content_provider] = shard
         if self._running_state:
             self._run_content_provider(content_provider)
+        return content_provider.get_id()
+
+    def remove_provider(self, key: typing.Union[int, str]) -> AbstractContentProvider:
+        """Remove provider and it's hooks from the system, it's stopped if it's running.
+
+        Hooks process data, that is already in their queues, before stopping. It's
+        not blocking, the provider finishes stopping in background.
+
+        Args:
+            key: int id or str name of the provider.
+
+        Returns:
+            Removed provider.
+        """
+        content_provider = self.get_provider(key)
+        del self._providers[content_provider.get_id()]
+        if content_provider.get_name() is not None:
+            del self._provider_names[content_provider.get_name()]
+        for hook in content_provider.get_hooks():
+            self._unindex_hook(hook)
+        content_provider._index_listener = None
+
+        shard = self._provider_shards.pop(content_provider, None)
+        if shard is not None:
+            self._shards[shard].remove_provider(content_provider)
+        if self._running_state:
+            asyncio.ensure_future(self._shutdown_provider(content_provider, True),
+                                  loop=self._asyncio_loop)
+        return content_provider
+
+    def remove_hook(self, key: typing.Union[int, str]) -> AbstractHook:
+        """Unlink hook from it's provider and stop it.
+
+        Args:
+            key: int id or str name of the hook.
+
+        Returns:
+            Removed hook.
+        """
+        hook = self.get_hook(key)
+        self._hooks[hook.get_id()][1].remove_hook(hook)
+        return hook
+
+    def _check_hook_names(self, hooks: typing.List[AbstractHook]) -> None:
+        """Raise NameDoublingError if names of the hooks are taken or repeated."""
+        names = set()
+        for hook in hooks:
+            name = hook.get_name()
+            if name is None:
+                continue
+            if name in self._hook_names or name in names:
+                raise NameDoublingError(f"Hook name {name!r} is already taken")
+            names.add(name)
+
+    def _index_hooks(self,
+                     content_provider: AbstractContentProvider,
+                     hooks: typing.List[AbstractHook]) -> None:
+        """Add hooks of the provider to indexes, called by provider when hooks are added.
+
+        Raises:
+            NameDoublingError: if one of the hooks' names is taken, nothing is indexed then.
+        """
+        self._check_hook_names(hooks)
+        for hook in hooks:
+            self._hooks[hook.get_id()] = (hook, content_provider)
+            if self._metrics_enabled and hook._stats is None:
+                hook._stats = HookStats()
+            if hook.get_name() is not None:
+                self._hook_names[hook.get_name()] = hook
+
+    def _unindex_hook(self, hook: AbstractHook) -> None:
+        """Remove the hook from indexes, called by provider when the hook is removed."""
+        self._hooks.pop(hook.get_id(), None)
+        if hook.get_name() is not None:
+            self._hook_names.pop(hook.get_name(), None)
+
+    def _reindex_hook(self,
+                      content_provider: AbstractContentProvider,
+                      hook: AbstractHook,
+                      new_hook: AbstractHook) -> None:
+        """Put new_hook to indexes instead of hook, called by provider when hook is replaced.
+
+        The provider may run in a shard's thread, then indexes are changed in PHFSystem's loop.
+        """
+        def _reindex():
+            self._unindex_hook(hook)
+            self._index_hooks(content_provider, [new_hook])
+
+        loop = self._asyncio_loop
+        if loop is None or not loop.is_running() or loop is _get_running_loop():
+            _reindex()
+        else:
+            loop.call_soon_threadsafe(_reindex)
+
+    def add_batch(self,
+                  specs: typing.List[typing.Tuple[str, list, dict, typing.Any]]
+                  ) -> typing.List[typing.Union[AbstractContentProvider, AbstractHook]]:
+        """Create and add many providers and hooks in one pass.
+
+        Every spec is a tuple (alias, args, kwargs, target). If target is None, a provider
+        is created and added to the system. Otherwise a hook is created and added to target,
+        which may be a provider's id or name, a provider object or BatchReference to a provider
+        created by the same batch.
+
+        All aliases and targets are checked before anything is created and names of created
+        objects are checked before anything is added, so an error leaves the system unchanged.
+        Aliases are resolved once for the whole batch and all new hooks of a provider are
+        started together.
+
+        Args:
+            specs: list of (alias, args, kwargs, target) tuples.
+
+        Returns:
+            List of created providers and hooks in the order of specs.
+
+        Raises:
+            KeyError: if an alias or a target provider isn't found.
+            ValueError: if BatchReference points to no spec or to a hook's spec.
+            NameDoublingError: if a name of a created provider or hook is taken.
+
+        Example:
+            Create a provider with 2 hooks and add one more hook to provider with id 0:
+
+                phfsys.add_batch([("MyProvider", [], {}, None),
+                                  ("MyHook", [2], {}, BatchReference(0)),
+                                  ("MyHook", [3], {}, BatchReference(0)),
+                                  ("MyHook", [5], {}, 0)])
+        """
+        provider_positions = [i for i, spec in enumerate(specs) if spec[3] is None]
+        hook_positions = [i for i, spec in enumerate(specs) if spec[3] is not None]
+
+        for i in hook_positions:
+            target = specs[i][3]
+            if isinstance(target, BatchReference):
+                if not 0 <= target.index < len(specs):
+                    raise ValueError(f"Batch has no spec {target.index}")
+                if specs[target.index][3] is not None:
+                    raise ValueError(f"Spec {target.index} of the batch is not a provider")
+            elif not isinstance(target, AbstractContentProvider):
+                self.get_provider(target)
+
+        created = [None] * len(specs)
+        new_providers = self._providers_and_hooks_factory.create_providers(
+            [specs[i][:3] for i in provider_positions]
+        )
+        new_hooks = self._providers_and_hooks_factory.create_hooks(
+            [specs[i][:3] for i in hook_positions]
+        )
+        for i, provider in zip(provider_positions, new_providers):
+            created[i] = provider
+
+        hooks_by_provider = {}
+        for i, hook in zip(hook_positions, new_hooks):
+            created[i] = hook
+            target = specs[i][3]
+            if isinstance(target, BatchReference):
+                target = created[target.index]
+            elif not isinstance(target, AbstractContentProvider):
+                target = self.get_provider(target)
+            hooks_by_provider.setdefault(target, []).append(hook)
+
+        provider_names = [provider.get_name() for provider in new_providers
+                          if provider.get_name() is not None]
+        for name in provider_names:
+            if name in self._provider_names or provider_names.count(name) > 1:
+                raise NameDoublingError(f"Provider name {name!r} is already taken")
+        self._check_hook_names(new_hooks + [hook for provider in new_providers
+                                            for hook in provider.get_hooks()])
+
+        for provider, hooks in hooks_by_provider.items():
+            provider.add_hooks(hooks)
+        for provider in new_providers:
+            self.add_provider(provider)
+        return created
 
     def add_input_source(self, input_source: AbstractCommandInput):
         """Add an input source.
@@ -120,8 +649,20 @@ class PHFSystem:
 
     def _run_content_provider(self,
                               content_provider: AbstractContentProvider) -> None:
-        """Run content provider's work coroutine."""
-        content_provider.start()
+        """Run content provider's work coroutine.
+
+        If there are shards, the provider is started in one of them.
+        """
+        if not self._shards:
+            content_provider.start()
+            return
+
+        if content_provider in self._provider_shards:
+            shard = self._shards[self._provider_shards[content_provider]]
+        else:
+            shard = self._placement.choose_shard(content_provider, self._shards)
+            self._provider_shards[content_provider] = shard.number
+        shard.run_provider(content_provider)
 
     async def _get_command(self, command_queue):
         """Get command"""
@@ -132,34 +673,217 @@ class PHFSystem:
         """Main framework's work coroutine.
 
         It starts all providers and hooks, then it executes commands from
-        command sources.
+        command sources till stop_async() is called.
+        """
+        await self.start_async()
+        await self._main_task
+        await self._stopped_event.wait()
+
+    async def _command_cycle(self) -> None:
+        """Execute commands from command sources till None command is received.
+
+        Every command is executed in it's own task, so a slow command doesn't block others.
+        When None command is received, all running commands are awaited.
+        """
+        running_commands = set()
+        while True:
+            command, evoker = await self._get_command(self._command_queue)
+            if command is None:
+                break
+            task = asyncio.create_task(self._serve_command(command, evoker))
+            running_commands.add(task)
+            task.add_done_callback(running_commands.discard)
+        if running_commands:
+            await asyncio.gather(*running_commands)
+
+    async def _serve_command(self, command: Command, evoker: AbstractCommandInput) -> None:
+        """Execute the command and send result to it's evoker.
+
+        Commands that change topology are executed one by one. If the command raises an
+        exception, the exception is sent as the result.
+
+        Args:
+            command: command to execute.
+            evoker: input source of the command.
         """
+        command_name = type(command).__name__
+        self._command_counts[command_name] = self._command_counts.get(command_name, 0) + 1
+        try:
+            if command.changes_topology():
+                async with self._topology_lock:
+                    output = await self._execute_command(command)
+            else:
+                output = await self._execute_command(command)
+        except Exception as exception:
+            output = exception
+        await evoker.set_command_result(output)
+
+    async def start_async(self) -> None:
+        """Start work of the framework in the running event loop.
+
+        Unlike start() it isn't blocking: providers, hooks and command sources are started
+        as tasks in the caller's loop, so the system can be embedded into an existing asyncio
+        application without a separate thread. Use stop_async() to stop the system.
+        """
+        if self._running_state:
+            raise RuntimeError("PHFSystem is already running")
+        for number, shard in enumerate(self._shards):
+            try:
+                shard.start()
+            except Exception:
+                for started_shard in self._shards[:number]:
+                    started_shard.stop()
+                raise
+        if self._metrics_server is not None:
+            await self._metrics_server.start()
         self._running_state = True
         self._asyncio_loop = asyncio.get_running_loop()
-        # TODO change it so each inputsource has it's own queues.
         self._command_queue = asyncio.Queue()
-        result_queue = asyncio.Queue()
+        self._topology_lock = asyncio.Lock()
 
         for input_source in self._input_sources:
-            input_source.start(self._command_queue, result_queue)
+            input_source.start(self._command_queue, asyncio.Queue())
 
-        for provider in self._providers:
+        for provider in self._providers.values():
             self._run_content_provider(provider)
 
-        while True:
-            command, evoker = await self._get_command(self._command_queue)
-            output = await self._execute_command(command)
-            await evoker.set_command_result(output)
+        self._stopped_event = asyncio.Event()
+        self._main_task = asyncio.create_task(self._command_cycle())
+        if self._hot_reloader is not None:
+            self._hot_reloader.start()
+        if self._watchdogs:
+            self._start_watchdogs()
+
+    async def stop_async(self, drain: bool = True, timeout: float = None) -> None:
+        """Stop work of the framework.
+
+        Command sources are stopped first, then already received commands are executed.
+        After that providers are stopped, so no new data is produced. If drain is True,
+        every hook processes all the data that is already in it's queue before stopping.
+
+        Args:
+            drain: whether hooks should process their queues before stopping.
+            timeout: max time in seconds to wait for providers and hooks, None is no limit.
+                Providers that are not stopped in time are left stopping in background.
+        """
+        if not self._running_state:
+            return
+
+        for input_source in self._input_sources:
+            input_source.stop()
+        if self._hot_reloader is not None:
+            self._hot_reloader.stop()
+        if self._metrics_server is not None:
+            await self._metrics_server.stop()
+        for watchdog in self._watchdogs.values():
+            watchdog.stop()
+
+        self._command_queue.put_nowait((None, None))
+        await self._main_task
+
+        stops = [asyncio.ensure_future(self._shutdown_provider(provider, drain))
+                 for provider in self._providers.values()]
+        if stops:
+            await asyncio.wait(stops, timeout=timeout)
+
+        for shard in self._shards:
+            shard.stop()
+        if self._tracer is not None and self._tracer.get_path() is not None:
+            # Writing a big trace would block the loop
+            await asyncio.get_running_loop().run_in_executor(None, self._tracer.dump)
+        self._running_state = False
+        self._stopped_event.set()
+
+    async def _shutdown_provider(self,
+                                 content_provider: AbstractContentProvider,
+                                 drain: bool) -> None:
+        """Stop the provider in it's own event loop and wait till it's stopped.
+
+        Args:
+            content_provider: provider to stop.
+            drain: whether hooks should process their queues before stopping.
+        """
+        await self._run_in_provider_loop(content_provider, content_provider.shutdown(drain))
+
+    async def _run_in_provider_loop(self,
+                                    content_provider: AbstractContentProvider,
+                                    coroutine: typing.Awaitable) -> typing.Any:
+        """Await coroutine in provider's event loop, which may run in other thread.
+
+        Args:
+            content_provider: provider, in whose loop to run.
+            coroutine: coroutine to run.
+
+        Returns:
+            Result of the coroutine.
+        """
+        provider_loop = content_provider._asyncio_loop
+        if provider_loop is None or provider_loop is self._asyncio_loop:
+            return await coroutine
+        future = asyncio.run_coroutine_threadsafe(coroutine, provider_loop)
+        return await asyncio.wrap_future(future)
+
+    def stop(self, drain: bool = True, timeout: float = None) -> None:
+        """Stop work of the framework, started with start(), from other thread.
+
+        Blocks till the system is stopped, see stop_async() for details.
+
+        Args:
+            drain: whether hooks should process their queues before stopping.
+            timeout: max time in seconds to wait for providers and hooks, None is no limit.
+        """
+        asyncio.run_coroutine_threadsafe(self.stop_async(drain, timeout),
+                                         self._asyncio_loop).result()
 
-    # TODO overrite to get Command as an argument
     async def _execute_command(self, command: Command):
-        res = command.execute_command(self)
+        res = await command.execute_command_async(self)
         return res
 
     def start(self):
         """Start work of the framework.
 
         It is blocking, so if you want to keep code outside of framework running,
-        you should start it in different thread.
+        you should start it in different thread or use start_async().
+        The event loop is created by the loop factory given to constructor.
         """
-        asyncio.run(self._start_main_coroutine())
+        loop = self._loop_factory()
+        try:
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self._start_main_coroutine())
+        finally:
+            try:
+                _cancel_all_tasks(loop)
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                # Tracer dumps and joins of provider threads run in the default executor
+                if hasattr(loop, "shutdown_default_executor"):
+                    loop.run_until_complete(loop.shutdown_default_executor())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+                for shard in self._shards:
+                    shard.stop()
+
+
+class NameDoublingError(Exception):
+    """Raised when a provider or hook is added with a name, that is already taken."""
+
+
+class BatchReference:
+    """Reference to a provider, created in the same batch of PHFSystem.add_batch.
+
+    Attributes:
+        index: int, position of provider's spec in the batch.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+
+
+def _cancel_all_tasks(loop: asyncio.AbstractEventLoop) -> None:
+    """Cancel all tasks of the loop and wait till they finish, like asyncio.run does."""
+    tasks = asyncio.all_tasks(loop)
+    if not tasks:
+        return
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
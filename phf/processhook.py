@@ -0,0 +1,221 @@
+"""Hooks, that run in their own processes.
+
+A CPU-heavy hook_action blocks it's whole event loop and can't use more than one core.
+ProcessHook creates a hook by it's alias in a child process and sends every data to it.
+Data is encoded by a codec(see codec module) and it's big buffers are sent without pickling
+copies, optionally through shared memory, so multi-MB payloads are cheap to move.
+
+Data is encoded by:
+
+- provider's codec, if the provider has one, then it's encoded once for all hooks;
+- hook's own codec, set by set_codec or codec argument;
+- codec.PickleCodec otherwise.
+
+Results are sent back with the same codec. If hook_action raises an exception, it's sent back
+and returned as the result; exceptions, that can't be encoded, are replaced by
+RemoteHookError with their repr.
+
+Example:
+    hook = ProcessHook("ImageResizeHook", args=[640, 480], hook_paths=["hooks"],
+                       codec=PickleCodec(), shared_memory_threshold=1024 * 1024)
+    provider.add_hook(hook)
+"""
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import typing
+
+from .abstracthook import AbstractHook
+from .codec import Codec, EncodedPayload, PickleCodec, get_codec, recv_payload, \
+    send_payload, stop_payloads
+
+
+class RemoteHookError(Exception):
+    """Exception of a hook in other process, that can't be sent back as is."""
+
+
+def _hook_worker_main(connection,
+                      alias: str,
+                      args: list,
+                      kwargs: dict,
+                      hook_paths: typing.List[str],
+                      shared_memory_threshold: typing.Optional[int]) -> None:
+    """Create the hook and run hook_action on every received payload till stop.
+
+    Args:
+        connection: worker's end of the pipe.
+        alias: name/alias of the hook class.
+        args: positional arguments for hook's constructor.
+        kwargs: keyword arguments for hook's constructor.
+        hook_paths: paths to read hooks from.
+        shared_memory_threshold: results' buffers of at least this size are sent through
+            shared memory.
+    """
+    from .factory import HookAndProviderFactory
+
+    hook = HookAndProviderFactory(hook_paths=hook_paths).create_hook(alias, args, kwargs)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        while True:
+            payload = recv_payload(connection)
+            if payload is None:
+                break
+            codec = get_codec(payload.codec_name)
+            error = False
+            try:
+                result = loop.run_until_complete(hook.hook_action(payload.decode()))
+            except Exception as exception:
+                result, error = exception, True
+            try:
+                encoded = codec.encode(result)
+            except Exception:
+                encoded = PickleCodec().encode(RemoteHookError(repr(result)) if error
+                                               else RemoteHookError(
+                                                   f"Result {result!r} can't be encoded"))
+                error = True
+            del result
+            payload.buffers = None
+            payload.lease.release()
+            send_payload(connection, encoded, error, shared_memory_threshold)
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        loop.close()
+        connection.close()
+
+
+class ProcessHook(AbstractHook):
+    """Hook, that runs hook_action of other hook in a child process.
+
+    The process is started when the hook is started and stopped with it. Data is processed
+    one by one, like by any hook.
+
+    Attributes:
+        _hook_alias: str, name/alias of the hook class to run.
+        _hook_args: list, positional arguments for it's constructor.
+        _hook_kwargs: dict, keyword arguments for it's constructor.
+        _hook_paths: list of str paths to read hooks from in the child process.
+        _shared_memory_threshold: int or None, buffers of at least this size are sent through
+            shared memory.
+        _context: multiprocessing context to create the process.
+        _process: multiprocessing.Process or None if it's not started.
+        _connection: hook's end of the pipe or None.
+    """
+    _accepts_encoded = True
+
+    def __init__(self,
+                 alias: str,
+                 args: list = None,
+                 kwargs: dict = None,
+                 hook_paths: typing.List[str] = None,
+                 codec: Codec = None,
+                 shared_memory_threshold: int = None,
+                 start_method: str = "spawn",
+                 *other_args, **other_kwargs):
+        """Create the hook, the process is started with the hook.
+
+        Args:
+            alias: name/alias of the hook class to run in the process.
+            args: positional arguments for it's constructor.
+            kwargs: keyword arguments for it's constructor.
+            hook_paths: paths to read hooks from in the process.
+            codec: codec to encode data with if provider doesn't encode it.
+            shared_memory_threshold: buffers of at least this size in bytes are sent through
+                shared memory, None to send everything through the pipe.
+            start_method: multiprocessing start method. "fork" is faster, but forking a
+                process with other threads(shards, executors, the monitor thread) can
+                deadlock the child on locks held by those threads.
+        """
+        super().__init__(*other_args, **other_kwargs)
+        self._hook_alias = alias
+        self._hook_args = list(args) if args is not None else []
+        self._hook_kwargs = dict(kwargs) if kwargs is not None else {}
+        self._hook_paths = list(hook_paths) if hook_paths is not None else []
+        self._shared_memory_threshold = shared_memory_threshold
+        self._context = multiprocessing.get_context(start_method)
+        self._process = None
+        self._connection = None
+        self.set_codec(codec)
+
+    def get_pid(self) -> typing.Optional[int]:
+        """Return pid of the hook's process or None if it's not started."""
+        return self._process.pid if self._process is not None else None
+
+    def _start_process(self) -> None:
+        """Start the child process."""
+        hook_connection, worker_connection = self._context.Pipe()
+        self._connection = hook_connection
+        self._process = self._context.Process(target=_hook_worker_main,
+                                              args=(worker_connection,
+                                                    self._hook_alias,
+                                                    self._hook_args,
+                                                    self._hook_kwargs,
+                                                    self._hook_paths,
+                                                    self._shared_memory_threshold),
+                                              name=f"phf-hook-{self._hook_alias}",
+                                              daemon=True)
+        self._process.start()
+        worker_connection.close()
+
+    def _stop_process(self) -> None:
+        """Ask the child process to stop and wait for it, it's killed if it doesn't stop."""
+        process, connection = self._process, self._connection
+        self._process = self._connection = None
+        if process is None:
+            return
+        try:
+            stop_payloads(connection)
+        except (OSError, EOFError):
+            pass
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        connection.close()
+
+    async def cycle_call(self) -> None:
+        """Start the process, process data in it till the hook is stopped, stop the process."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._start_process)
+        try:
+            await super().cycle_call()
+        finally:
+            await loop.run_in_executor(None, self._stop_process)
+
+    def _encode(self, data: typing.Any) -> EncodedPayload:
+        """Encode data with hook's codec, PickleCodec is used if there is none."""
+        if isinstance(data, EncodedPayload):
+            return data
+        codec = self.get_codec()
+        if codec is None:
+            codec = PickleCodec()
+        return codec.encode(data)
+
+    def _round_trip(self, payload: EncodedPayload) -> typing.Any:
+        """Send payload to the process and return decoded result, it's blocking.
+
+        Raises:
+            Exception: raised by hook_action in the process.
+        """
+        send_payload(self._connection, payload,
+                     shared_memory_threshold=self._shared_memory_threshold)
+        received = recv_payload(self._connection)
+        if received is None:
+            raise RemoteHookError("Hook's process stopped")
+        if received.lease.is_empty():
+            result = received.decode()
+        else:
+            # Result mustn't keep shared memory mapped, so it's buffers are copied
+            received.buffers = [memoryview(bytes(buffer)) for buffer in received.buffers]
+            result = received.decode()
+            received.lease.release()
+        if received.error:
+            raise result
+        return result
+
+    async def hook_action(self, data: typing.Any) -> typing.Any:
+        payload = self._encode(data)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._round_trip, payload)
@@ -36,17 +36,127 @@ does the data processing, all needed actions, remote requests etc and result_cal
 result of hook execution
 
 Work with ComplexContentProvider is much a bit different, it will be described later.
+
+By default a provider waits for results of all its hooks before result_callback (or before
+answering to MessageSystem). It can be changed per provider with set_gather_strategy:
+
+- GatherAll - wait for every hook, default behaviour.
+- GatherFirstN(n) - continue as soon as n hooks answered.
+- GatherQuorum() - continue as soon as the majority of hooks answered.
+- GatherFirstSuccessful() - continue as soon as any hook answered without an exception.
+
+Results of hooks that answered too late are thrown away, so every tick gets only results
+of it's own data.
 """
 from __future__ import annotations
 
 import asyncio
+import concurrent.futures
 import copy
 import queue
 import threading
 import typing
 from abc import ABC
 
+from . import tracing
 from .abstracthook import AbstractHook
+from .broadcast import BroadcastChannel, BroadcastReader
+from .codec import Codec
+
+
+class _NoResult:
+    """Type of NO_RESULT."""
+
+    def __repr__(self) -> str:
+        return "NO_RESULT"
+
+
+NO_RESULT = _NoResult()
+
+
+class GatherStrategy:
+    """Basic class for strategies of gathering hook results.
+
+    A strategy decides when a provider has enough hook results to continue. Results that
+    are not needed anymore are thrown away by the provider.
+
+    Results are given to result_callback in the order of provider's hooks(as get_hooks()
+    returns them). With strategies other than GatherAll hooks, that haven't answered in time,
+    get NO_RESULT in their places, so results can be matched to hooks by index.
+
+    To make a strategy, inherit this class and override is_satisfied and, if needed, accepts.
+    """
+
+    def accepts(self, result: typing.Any) -> bool:
+        """Check whether a hook result counts for the strategy.
+
+        Not accepted results are still returned to provider, but don't make the strategy
+        satisfied.
+
+        Args:
+            result: result of a single hook.
+
+        Returns:
+            True by default.
+        """
+        return True
+
+    def is_satisfied(self, accepted_amount: int, hooks_amount: int) -> bool:
+        """Check whether provider can stop waiting for hooks.
+
+        Args:
+            accepted_amount: amount of already received accepted results.
+            hooks_amount: amount of hooks provider waits for.
+
+        Returns:
+            True if no more results are needed.
+        """
+        raise NotImplementedError(f"is_satisfied of {self.__class__} not overridden")
+
+
+class GatherAll(GatherStrategy):
+    """Wait for results of all hooks."""
+
+    def is_satisfied(self, accepted_amount: int, hooks_amount: int) -> bool:
+        return accepted_amount >= hooks_amount
+
+
+class GatherFirstN(GatherStrategy):
+    """Wait for results of first n hooks.
+
+    If the provider has less than n hooks, results of all hooks are waited for.
+
+    Attributes:
+        amount: int, amount of results to wait for.
+    """
+
+    def __init__(self, amount: int):
+        if amount < 1:
+            raise ValueError(f"GatherFirstN needs positive amount of results, got {amount}")
+        self.amount = amount
+
+    def is_satisfied(self, accepted_amount: int, hooks_amount: int) -> bool:
+        return accepted_amount >= min(self.amount, hooks_amount)
+
+
+class GatherQuorum(GatherStrategy):
+    """Wait till the majority of hooks answer."""
+
+    def is_satisfied(self, accepted_amount: int, hooks_amount: int) -> bool:
+        return accepted_amount >= min(hooks_amount // 2 + 1, hooks_amount)
+
+
+class GatherFirstSuccessful(GatherStrategy):
+    """Wait for the first hook result that is not an exception.
+
+    If all hooks fail, all the exceptions are returned.
+    """
+
+    def accepts(self, result: typing.Any) -> bool:
+        return not isinstance(result, Exception)
+
+    def is_satisfied(self, accepted_amount: int, hooks_amount: int) -> bool:
+        return accepted_amount >= min(1, hooks_amount)
 
 
 class AbstractContentProvider:
@@ -57,12 +167,28 @@ class AbstractContentProvider:
     Attributes:
         _asynio_hooks: list of all linked hooks.
         _asyncio_hook_tasks: list of all asyncio.Task for running hooks.
+        _asyncio_hook_tasks_by_hook: dict {hook: asyncio.Task running the hook}.
         _asyncio_straight_queues: list of all asyncio.queues for provider -> hook data .
         _asyncio_callback_queues: list of all asyncio.queues for hook -> provider data transfer.
         _asyncio_task: asyncio.Task for provider rinning.
         _asyncio_running: bool, shows whether the provider is running.
         _asyncio_loop: tracks in what asyncio.Loop provider is running.
         _is_with_callback: tracks whether callbacks should be done.
+        _gather_strategy: GatherStrategy, decides when enough hook results are received.
+        _asyncio_stale_results: dict {callback queue: amount of results in it that came too
+            late and have to be thrown away}.
+        _asyncio_started_hooks: set of hooks, that are already started.
+        _asyncio_drain_hooks: bool, whether hooks process their queues when provider stops.
+        _id: int, id of the provider in PHFSystem, given when provider is added to it.
+        _name: str or None, optional unique name of the provider in PHFSystem.
+        _index_listener: PHFSystem or None, system to notify about added and removed hooks.
+        _tracer: tracing.Tracer or None.
+        _trace_sequence: int, number of the last tick.
+        _trace_tick: tracing.TraceTick of the current tick or None if it isn't traced.
+        _stats: metrics.ProviderStats or None, counters of the provider when metrics are enabled.
+        _codec: codec.Codec or None, if set, data is encoded once before it's sent to hooks.
+        _broadcast: broadcast.BroadcastChannel or None, if set, data is stored once in it and
+            hooks' straight queues are it's readers.
     """
     _alias = []
 
@@ -71,12 +197,26 @@ class AbstractContentProvider:
         obj = object.__new__(cls)
         obj._asynio_hooks = []
         obj._asyncio_hook_tasks = []
+        obj._asyncio_hook_tasks_by_hook = {}
         obj._asyncio_straight_queues = []
         obj._asyncio_callback_queues = []
         obj._asyncio_task = None
         obj._asyncio_running = False
         obj._asyncio_loop = None
         obj._is_with_callback = False
+        obj._gather_strategy = GatherAll()
+        obj._asyncio_stale_results = {}
+        obj._asyncio_started_hooks = set()
+        obj._asyncio_drain_hooks = False
+        obj._id = None
+        obj._name = None
+        obj._index_listener = None
+        obj._tracer = None
+        obj._trace_sequence = 0
+        obj._trace_tick = None
+        obj._stats = None
+        obj._codec = None
+        obj._broadcast = None
 
         # Checking if callbacks are needed.
         return obj
@@ -91,38 +231,175 @@ class AbstractContentProvider:
         """
         raise NotImplementedError(f"Cycle of {self.__class__} not overridden")
 
+    def set_gather_strategy(self, strategy: GatherStrategy) -> None:
+        """Set the way hook results are gathered.
+
+        Args:
+            strategy: GatherStrategy object, for example GatherFirstN(2).
+        """
+        self._gather_strategy = strategy
+
+    def get_gather_strategy(self) -> GatherStrategy:
+        """Return current gather strategy."""
+        return self._gather_strategy
+
+    def set_codec(self, codec: typing.Optional[Codec]) -> None:
+        """Set codec to encode data with once before sending it to hooks, see codec module.
+
+        Hooks in the same process decode data before hook_action, hooks that send it to
+        other processes send the encoded data as is. None turns encoding off.
+        """
+        self._codec = codec
+
+    def get_codec(self) -> typing.Optional[Codec]:
+        """Return codec of the provider."""
+        return self._codec
+
+    def set_broadcast(self, capacity: typing.Optional[int] = 1024) -> None:
+        """Send data to hooks through one broadcast channel instead of a queue per hook.
+
+        Every data is stored once in a ring buffer of capacity items and read by all hooks,
+        when it's full, the provider waits for the slowest hook, see broadcast module.
+        Has to be called before the provider starts.
+
+        Args:
+            capacity: size of the ring buffer, None turns the channel off.
+
+        Raises:
+            ValueError: if capacity is less than 1.
+        """
+        self._broadcast = BroadcastChannel(capacity) if capacity is not None else None
+
+    def get_broadcast(self) -> typing.Optional[BroadcastChannel]:
+        """Return broadcast channel of the provider or None if it doesn't use one."""
+        return self._broadcast
+
+    def set_tracer(self, tracer: typing.Optional[tracing.Tracer]) -> None:
+        """Set tracer to record ticks to, None turns tracing off."""
+        self._tracer = tracer
+        self._trace_tick = None
+
+    def get_tracer(self) -> typing.Optional[tracing.Tracer]:
+        """Return tracer of the provider."""
+        return self._tracer
+
+    def _start_trace_tick(self) -> typing.Optional[tracing.TraceTick]:
+        """Start new tick, return it's TraceTick if it's traced, None otherwise."""
+        self._trace_sequence += 1
+        tick = None
+        if self._tracer is not None:
+            tick = self._tracer.start_tick(self, self._trace_sequence)
+        self._trace_tick = tick
+        return tick
+
+    async def _get_hook_result(self, queue: asyncio.Queue) -> typing.Any:
+        """Get the newest result from hook's callback queue.
+
+        Results that came too late for previous ticks are thrown away first.
+
+        Args:
+            queue: hook's callback queue.
+        """
+        while self._asyncio_stale_results.get(queue, 0):
+            await queue.get()
+            self._asyncio_stale_results[queue] -= 1
+        return await queue.get()
+
+    async def _gather_hook_results(self) -> typing.List:
+        """Gather hook results till gather strategy is satisfied.
+
+        Results are returned in the order of get_hooks(), hooks that haven't answered in
+        time(or aren't started yet) get NO_RESULT. Their results are marked to be thrown
+        away later.
+        """
+        hook_queues = [hook.get_callback_queue() if hook in self._asyncio_started_hooks else None
+                       for hook in self._asynio_hooks]
+        queues = [queue for queue in hook_queues if queue is not None]
+        tasks = [asyncio.ensure_future(self._get_hook_result(queue)) for queue in queues]
+        pending = set(tasks)
+        accepted_amount = 0
+        while pending and not self._gather_strategy.is_satisfied(accepted_amount, len(tasks)):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if self._gather_strategy.accepts(task.result()):
+                    accepted_amount += 1
+
+        results_by_queue = {}
+        for queue, task in zip(queues, tasks):
+            if task in pending:
+                task.cancel()
+                self._asyncio_stale_results[queue] = self._asyncio_stale_results.get(queue, 0) + 1
+            else:
+                results_by_queue[queue] = task.result()
+        return [results_by_queue.get(queue, NO_RESULT) for queue in hook_queues]
+
     async def _run_result_callback(self) -> typing.List:
-        """Gather all results from all queues
+        """Gather results from queues as gather strategy says.
 
 
         If provider is without callback, then just empty the queues."""
         if self._is_with_callback:
-            results = await asyncio.gather(*[queue.get() for queue in self._asyncio_callback_queues])
+            if isinstance(self._gather_strategy, GatherAll):
+                results = await asyncio.gather(*[self._get_hook_result(queue)
+                                                 for queue in self._asyncio_callback_queues])
+            else:
+                results = await self._gather_hook_results()
             return results
         else:
             for queue in self._asyncio_callback_queues:
                 while not queue.empty():
                     await queue.get()
 
-    def _start_hook(self, hook: AbstractHook) -> None:
-        """Start hook and remember it's queues.
+    def _start_hooks(self, hooks: typing.List[AbstractHook]) -> None:
+        """Start hooks and remember their queues.
 
-        Has to be called inside an event loop.
+        If called outside of provider's loop, starting is scheduled in the provider's loop
+        once for all the hooks.
 
         Args:
-            hook: Hook to start(has to be in list of linked hooks)
+            hooks: Hooks to start(have to be in list of linked hooks)
         """
-        if self._asyncio_loop == asyncio.get_event_loop():
-            self._asyncio_straight_queues.append(hook.get_straight_queue())
-            self._asyncio_callback_queues.append(hook.get_callback_queue())
-            self._asyncio_hook_tasks.append(asyncio.create_task(hook.cycle_call()))
+        def _start_in_loop():
+            for hook in hooks:
+                self._start_hook_in_loop(hook)
+
+        if self._asyncio_loop is _get_running_loop():
+            _start_in_loop()
         else:
-            async def _coro():
-                self._asyncio_straight_queues.append(hook.get_straight_queue())
-                self._asyncio_callback_queues.append(hook.get_callback_queue())
-                self._asyncio_hook_tasks.append(asyncio.create_task(hook.cycle_call()))
+            self._asyncio_loop.call_soon_threadsafe(_start_in_loop)
+
+    def _start_hook_in_loop(self, hook: AbstractHook) -> None:
+        """Start hook, has to be called in provider's event loop.
+
+        Hooks, that are already started, are skipped. It may happen if a hook is added from
+        other thread at the same moment the provider starts.
 
-            asyncio.run_coroutine_threadsafe(_coro(), self._asyncio_loop)
+        Args:
+            hook: Hook to start(has to be in list of linked hooks)
+        """
+        if hook in self._asyncio_started_hooks:
+            return
+        self._asyncio_started_hooks.add(hook)
+        if self._broadcast is not None:
+            if isinstance(hook._asyncio_queue, BroadcastReader):
+                hook._asyncio_queue.close()
+            hook._asyncio_queue = self._broadcast.add_reader()
+        self._asyncio_straight_queues.append(hook.get_straight_queue())
+        self._asyncio_callback_queues.append(hook.get_callback_queue())
+        self._create_hook_task(hook)
+
+    def _create_hook_task(self, hook: AbstractHook) -> None:
+        """Run started hook's cycle_call in a task.
+
+        A reader of the broadcast channel is closed when the hook stops, so the channel doesn't
+        wait for it.
+        """
+        task = asyncio.create_task(hook.cycle_call())
+        queue = hook.get_straight_queue()
+        if isinstance(queue, BroadcastReader):
+            task.add_done_callback(lambda _: queue.close())
+        self._asyncio_hook_tasks.append(task)
+        self._asyncio_hook_tasks_by_hook[hook] = task
 
     def get_hooks(self) -> typing.List[AbstractHook]:
         """Return list of all hooks.
@@ -132,15 +409,116 @@ class AbstractContentProvider:
         """
         return self._asynio_hooks
 
+    def get_id(self) -> typing.Optional[int]:
+        """Return id of the provider or None if it's not added to PHFSystem."""
+        return self._id
+
+    def get_name(self) -> typing.Optional[str]:
+        """Return name of the provider or None if it has no name."""
+        return self._name
+
+    def set_name(self, name: str) -> None:
+        """Set name of the provider, it has to be done before provider is added to PHFSystem.
+
+        Args:
+            name: name, unique in PHFSystem.
+        """
+        self._name = name
+
     def add_hook(self, hook: AbstractHook) -> None:
         """Link hook to provider and start it if provider is started.
 
         Args:
             hook: To be added.
         """
+        if self._index_listener is not None:
+            self._index_listener._index_hooks(self, [hook])
+        hook._provider = self
         self._asynio_hooks.append(hook)
         if self._asyncio_running:
-            self._start_hook(hook)
+            self._start_hooks([hook])
+
+    def remove_hook(self, hook: AbstractHook) -> None:
+        """Unlink hook from provider and stop it.
+
+        The hook processes all data, that is already in it's queue, before stopping.
+
+        Args:
+            hook: hook to remove.
+        """
+        self._asynio_hooks.remove(hook)
+        hook._provider = None
+        if self._index_listener is not None:
+            self._index_listener._unindex_hook(hook)
+        if not self._asyncio_running:
+            return
+
+        def _stop_in_loop():
+            if hook not in self._asyncio_started_hooks:
+                return
+            self._asyncio_started_hooks.discard(hook)
+            self._asyncio_hook_tasks_by_hook.pop(hook, None)
+            self._asyncio_straight_queues.remove(hook.get_straight_queue())
+            self._asyncio_callback_queues.remove(hook.get_callback_queue())
+            self._asyncio_stale_results.pop(hook.get_callback_queue(), None)
+            hook.stop(drain=True)
+
+        if self._asyncio_loop is _get_running_loop():
+            _stop_in_loop()
+        else:
+            self._asyncio_loop.call_soon_threadsafe(_stop_in_loop)
+
+    async def replace_hook(self, hook: AbstractHook, new_hook: AbstractHook) -> None:
+        """Replace running hook with a new one without losing data, has to be called in
+        provider's event loop.
+
+        Data, that is waiting in the old hook's straight queue, is moved to the new hook's
+        queue. The old hook finishes data it's processing now and the new one is started
+        after that, callback queue is shared, so the provider gets results in order.
+        new_hook is usually made by hook._copy_with_class when hook's class is reloaded.
+
+        Args:
+            hook: linked hook to replace.
+            new_hook: hook to link instead, it's callback queue has to be the same.
+        """
+        self._asynio_hooks[self._asynio_hooks.index(hook)] = new_hook
+        if self._index_listener is not None:
+            self._index_listener._reindex_hook(self, hook, new_hook)
+        if hook not in self._asyncio_started_hooks:
+            return
+
+        old_queue = hook.get_straight_queue()
+        if isinstance(old_queue, BroadcastReader):
+            new_queue = old_queue.transfer()
+        else:
+            new_queue = asyncio.Queue()
+            while not old_queue.empty():
+                new_queue.put_nowait(old_queue.get_nowait())
+        new_hook._asyncio_queue = new_queue
+        self._asyncio_straight_queues[self._asyncio_straight_queues.index(old_queue)] = new_queue
+        self._asyncio_started_hooks.discard(hook)
+        self._asyncio_started_hooks.add(new_hook)
+
+        old_queue.put_nowait(asyncio.CancelledError())
+        old_task = self._asyncio_hook_tasks_by_hook.pop(hook, None)
+        if old_task is not None:
+            await asyncio.gather(old_task, return_exceptions=True)
+
+        self._create_hook_task(new_hook)
+
+    def add_hooks(self, hooks: typing.List[AbstractHook]) -> None:
+        """Link many hooks to provider and start them together if provider is started.
+
+        Args:
+            hooks: list of hooks to add.
+        """
+        if self._index_listener is not None:
+            self._index_listener._index_hooks(self, hooks)
+        for hook in hooks:
+            hook._provider = self
+        self._asynio_hooks.extend(hooks)
+        if self._asyncio_running:
+            self._start_hooks(hooks)
 
     def _is_running(self) -> bool:
         """Return whether provider is running now"""
@@ -148,9 +526,9 @@ class AbstractContentProvider:
 
     def start(self) -> None:
         """Start the provider."""
+        self._asyncio_loop = asyncio.get_event_loop()
         self._asyncio_running = True
         self._asyncio_task = asyncio.create_task(self.cycle())
-        self._asyncio_loop = asyncio.get_event_loop()
 
     # TODO better stop
     def stop(self):
@@ -158,12 +536,27 @@ class AbstractContentProvider:
         if self._asyncio_task is not None:
             self._asyncio_task.cancel()
 
+    async def shutdown(self, drain: bool = True) -> None:
+        """Stop the provider and wait till it and it's hooks are stopped.
+
+        Has to be called in provider's event loop.
+
+        Args:
+            drain: whether hooks should process all data in their queues before stopping.
+        """
+        if self._asyncio_task is None:
+            return
+        self._asyncio_drain_hooks = drain
+        self.stop()
+        await asyncio.gather(self._asyncio_task, return_exceptions=True)
+        await asyncio.gather(*self._asyncio_hook_tasks, return_exceptions=True)
+
     async def __aenter__(self) -> None:
         """Initialise all in-loop attributes of class."""
         self._asyncio_loop = asyncio.get_event_loop()
         self._asyncio_running = True
-        for hook in self._asynio_hooks:
-            self._start_hook(hook)
+        for hook in self._asynio_hooks[:]:
+            self._start_hook_in_loop(hook)
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """At the end the decorator stops all hooks.
@@ -172,7 +565,7 @@ class AbstractContentProvider:
         self._asyncio_running = False
         if exc_type is asyncio.CancelledError:
             for hook in self._asynio_hooks:
-                hook.stop()
+                hook.stop(self._asyncio_drain_hooks)
             return True
 
     @classmethod
@@ -190,6 +583,13 @@ class AbstractContentProvider:
         Args:
             data: what to send to hooks.
         """
+        if self._codec is not None:
+            data = self._codec.encode(data)
+        if self._trace_tick is not None:
+            data = tracing.TracedItem(data, self._trace_tick)
+        if self._broadcast is not None:
+            await self._broadcast.put(data)
+            return
         for queue in self._asyncio_straight_queues:
             queue.put_nowait(data)
 
@@ -248,12 +648,31 @@ class PeriodicContentProvider(ConsistentDataProvider, ABC):
         Can be stopped by self.stop()"""
         async with self:
             while self._is_running():
-                data = await self.get_content()
-                await self._notify_all_hooks(data)
-                result = await self._run_result_callback()
-                await self.result_callback(result)
+                if self._tracer is None and self._stats is None:
+                    data = await self.get_content()
+                    await self._notify_all_hooks(data)
+                    result = await self._run_result_callback()
+                    await self.result_callback(result)
+                else:
+                    await self._instrumented_tick()
                 await asyncio.sleep(self.period)
 
+    async def _instrumented_tick(self) -> None:
+        """Do one tick of the cycle, counting it and recording it's spans if it's sampled."""
+        stats = self._stats
+        if stats is not None:
+            stats.tick_started()
+        tick = self._start_trace_tick()
+        with tracing.span(tick, "get_content"):
+            data = await self.get_content()
+        await self._notify_all_hooks(data)
+        with tracing.span(tick, "gather"):
+            result = await self._run_result_callback()
+        with tracing.span(tick, "result_callback"):
+            await self.result_callback(result)
+        if stats is not None:
+            stats.tick_finished(self.period)
+
 
 class BlockingContentProvider(ConsistentDataProvider, ABC):
     """Class for providers that are too slow or have unavoidable blocking IO.
@@ -262,9 +681,13 @@ class BlockingContentProvider(ConsistentDataProvider, ABC):
     Hook is still executed in the main thread.
 
     Attributes:
-        _content_queue: queue from provider's thread to PHFSystem's thread.
+        _content_queue: queue of (content, tracing.TraceTick or None) from provider's thread to
+            PHFSystem's thread.
         _thread_loop: asyncio loop, loop in which data is recieved.
         _thread: threading.Thread, in which blocking operation is executed.
+        _thread_stopping: threading.Event, set when the thread has to stop.
+        _thread_pending: concurrent.futures.Future or None, gathering of hook results the
+            thread waits for, it's cancelled on stop.
         """
 
     def __new__(cls, *args, **kwargs):
@@ -272,6 +695,8 @@ class BlockingContentProvider(ConsistentDataProvider, ABC):
         obj._content_queue = asyncio.Queue()
         obj._thread_loop = None
         obj._thread = None
+        obj._thread_stopping = threading.Event()
+        obj._thread_pending = None
         return obj
 
     def __init__(self, *args, **kwargs):
@@ -279,27 +704,86 @@ class BlockingContentProvider(ConsistentDataProvider, ABC):
         self._content_queue = asyncio.Queue()
 
     def _thread_func(self) -> None:
-        """Do all provider's work."""
+        """Do all provider's work.
+
+        The thread finishes after the current get_content or result_callback when the
+        provider is stopped, waiting for hook results is cancelled.
+        """
 
         async def _coro() -> None:
-            while self._asyncio_running:
-                content = await self.get_content()
-                asyncio.run_coroutine_threadsafe(self._content_queue.put(content), self._asyncio_loop)
-                res = asyncio.run_coroutine_threadsafe(self._run_result_callback(), self._asyncio_loop).result()
-                await self.result_callback(res)
+            while self._asyncio_running and not self._thread_stopping.is_set():
+                if self._stats is not None:
+                    self._stats.ticks += 1
+                tick = self._start_trace_tick()
+                with tracing.span(tick, "get_content"):
+                    content = await self.get_content()
+                try:
+                    with tracing.span(tick, "gather"):
+                        res = self._wait_in_provider_loop(content, tick)
+                except (concurrent.futures.CancelledError, RuntimeError):
+                    # The provider is stopped or it's loop is closed
+                    break
+                with tracing.span(tick, "result_callback"):
+                    await self.result_callback(res)
 
         self._thread_loop = asyncio.new_event_loop()
-        self._thread_loop.run_until_complete(_coro())
+        try:
+            self._thread_loop.run_until_complete(_coro())
+        finally:
+            self._thread_loop.close()
+
+    def _wait_in_provider_loop(self, content: object, tick) -> typing.List:
+        """Send content to hooks and wait for their results from provider's thread.
+
+        Raises:
+            concurrent.futures.CancelledError: if the provider is stopped.
+            RuntimeError: if provider's loop is closed.
+        """
+        self._run_in_provider_loop(self._content_queue.put((content, tick)))
+        future = self._run_in_provider_loop(self._run_result_callback())
+        self._thread_pending = future
+        try:
+            if self._thread_stopping.is_set():
+                future.cancel()
+            return future.result()
+        finally:
+            self._thread_pending = None
+
+    def _run_in_provider_loop(self, coroutine: typing.Coroutine) -> concurrent.futures.Future:
+        """Schedule the coroutine in provider's loop from provider's thread.
+
+        Raises:
+            RuntimeError: if provider's loop is closed, the coroutine is closed then.
+        """
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self._asyncio_loop)
+        except RuntimeError:
+            coroutine.close()
+            raise
 
     def stop(self):
-        if self._thread_loop and self._thread_loop.is_running():
-            self._thread_loop.stop()
+        """Stop the provider and tell it's thread to stop, can be called from any thread."""
+        self._thread_stopping.set()
+        pending = self._thread_pending
+        if pending is not None:
+            pending.cancel()
         super().stop()
 
+    async def shutdown(self, drain: bool = True) -> None:
+        """Stop the provider, it's hooks and it's thread and wait till they are stopped.
+
+        The thread is joined in an executor, so a blocking get_content delays only this
+        coroutine.
+        """
+        await super().shutdown(drain)
+        if self._thread is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+
     async def __aenter__(self):
         """Initialise all in-loop attributes of class."""
         kek = await super().__aenter__()
         self._content_queue = asyncio.Queue()
+        self._thread_stopping = threading.Event()
         self._thread = threading.Thread(target=self._thread_func)
         self._thread.start()
         return kek
@@ -311,7 +795,7 @@ class BlockingContentProvider(ConsistentDataProvider, ABC):
         Can be stopped by self.stop()"""
         async with self:
             while self._is_running():
-                string = await self._content_queue.get()
+                string, self._trace_tick = await self._content_queue.get()
                 await self._notify_all_hooks(string)
 
 
@@ -356,6 +840,12 @@ class ComplexContentProvider(AbstractContentProvider):
         await super().__aenter__()
         self._input_queue, self._output_queue = await self._message_system.initialize()
 
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Stop message system's task together with the provider."""
+        if self._message_system._task is not None:
+            self._message_system._task.cancel()
+        return await super().__aexit__(exc_type, exc_val, exc_tb)
+
     def get_message_system(self) -> MessageSystem:
         """Return the message system."""
         return self._message_system
@@ -367,12 +857,34 @@ class ComplexContentProvider(AbstractContentProvider):
         async with self:
             while self._is_running():
                 content, msg_id = await self._input_queue.get()
+                if self._tracer is None and self._stats is None:
+                    content = await self.preprocess_data(content)
+                    await self._notify_all_hooks(content)
+
+                    result = await self._run_result_callback()
+                    result = await self.postprocess_result(result)
+                else:
+                    result = await self._instrumented_message(content, msg_id)
+                await self._output_queue.put((result, msg_id))
+
+    async def _instrumented_message(self, content: object, msg_id: int) -> object:
+        """Process one message, counting it and recording it's spans if it's sampled.
+
+        Returns:
+            Postprocessed result.
+        """
+        if self._stats is not None:
+            self._stats.ticks += 1
+        tick = self._start_trace_tick()
+        with tracing.span(tick, "message", msg_id=msg_id):
+            with tracing.span(tick, "preprocess_data"):
                 content = await self.preprocess_data(content)
-                await self._notify_all_hooks(content)
+            await self._notify_all_hooks(content)
 
+            with tracing.span(tick, "gather"):
                 result = await self._run_result_callback()
-                result = await self.postprocess_result(result)
-                await self._output_queue.put((result, msg_id))
+            with tracing.span(tick, "postprocess_result"):
+                return await self.postprocess_result(result)
 
     async def preprocess_data(self, content: object) -> object:
         """Preprocess data.
@@ -420,6 +932,8 @@ class MessageSystem:
         _result_to_mID_mapping: dict, used to store answers to messages by their id.
         _needed_output_events: dict of threading.Event, stores events for needing answers for
         messages that hasn't been yet.
+        _needed_output_futures: dict of asyncio.Future, same as _needed_output_events, but
+        for answers awaited with retrieve_result_async.
          _lock: threading.Lock for thread safe message sends.
          _task: asyncio.Task for message's system work(cycle() coroutine).
         """
@@ -436,6 +950,7 @@ class MessageSystem:
         self._asyncio_loop = None
         self._result_to_mID_mapping = {}
         self._needed_output_events = {}
+        self._needed_output_futures = {}
         self._lock = threading.Lock()
         self._task = None
 
@@ -460,6 +975,17 @@ class MessageSystem:
     def stop(self):
         self.__init__()
 
+    def get_pending_amount(self) -> int:
+        """Return amount of messages, that aren't taken by the provider yet."""
+        amount = self._tmp_queue.qsize()
+        if self._input_queue is not None:
+            amount += self._input_queue.qsize()
+        return amount
+
+    def get_stored_results_amount(self) -> int:
+        """Return amount of answers kept by the message system, retrieved ones too."""
+        return len(self._result_to_mID_mapping)
+
     def send_to_provider(self, data: object) -> int:
         """Send message from system to provider.
 
@@ -472,13 +998,17 @@ class MessageSystem:
         Returns:
             Message's id.
         """
-        if self._input_queue is None:
-            self._tmp_queue.put_nowait((data, self._message_id))
-        else:
-            asyncio.run_coroutine_threadsafe(self._input_queue.put((data, self._message_id)),
-                                             self._asyncio_loop)
-        self._message_id += 1
-        return self._message_id - 1
+        with self._lock:
+            message_id = self._message_id
+            self._message_id += 1
+            if self._input_queue is None:
+                self._tmp_queue.put_nowait((data, message_id))
+            elif _get_running_loop() is self._asyncio_loop:
+                self._input_queue.put_nowait((data, message_id))
+            else:
+                asyncio.run_coroutine_threadsafe(self._input_queue.put((data, message_id)),
+                                                 self._asyncio_loop)
+        return message_id
 
     async def _serve_provider_results(self) -> None:
         """Serve provider results in endless cycle."""
@@ -488,6 +1018,8 @@ class MessageSystem:
                 self._result_to_mID_mapping[msg_id] = result
                 if msg_id in self._needed_output_events:
                     self._needed_output_events[msg_id].set()
+                if msg_id in self._needed_output_futures:
+                    _set_future_result(self._needed_output_futures[msg_id], result)
 
     def retrieve_result(self, message_id: int) -> object:
         """Get results from ComplexContentProvider.
@@ -510,6 +1042,41 @@ class MessageSystem:
         del self._needed_output_events[message_id]
         return self._result_to_mID_mapping[message_id]
 
+    async def retrieve_result_async(self, message_id: int) -> object:
+        """Get results from ComplexContentProvider without blocking the event loop.
+
+        Can be awaited in any event loop, but when it's awaited in PHFSystem's loop no
+        thread synchronisation is needed at all.
+
+        Args:
+            message_id: Id of message, for which answer is needed.
+
+        Returns:
+            Answer with on message message_id.
+        """
+        with self._lock:
+            if message_id in self._result_to_mID_mapping:
+                return self._result_to_mID_mapping[message_id]
+
+            future = asyncio.get_running_loop().create_future()
+            self._needed_output_futures[message_id] = future
+        try:
+            return await future
+        finally:
+            del self._needed_output_futures[message_id]
+
+    async def send_wait_answer_async(self, data: object) -> object:
+        """Send message to provider and wait till result is sent back without blocking the loop.
+
+        Args:
+            data: data to send.
+
+        Returns:
+            Result from provider.
+        """
+        msg_id = self.send_to_provider(data)
+        return await self.retrieve_result_async(msg_id)
+
     def send_wait_answer(self, data: object) -> object:
         """Send message to provider and wait till result is sent back.
 
@@ -521,3 +1088,25 @@ class MessageSystem:
         """
         msg_id = self.send_to_provider(data)
         return self.retrieve_result(msg_id)
+
+
+def _get_running_loop() -> typing.Optional[asyncio.AbstractEventLoop]:
+    """Return running event loop of current thread or None."""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _set_future_result(future: asyncio.Future, result: object) -> None:
+    """Set future's result from any thread.
+
+    Args:
+        future: future to set result to.
+        result: the result.
+    """
+    if future.get_loop() is _get_running_loop():
+        if not future.done():
+            future.set_result(result)
+    else:
+        future.get_loop().call_soon_threadsafe(_set_future_result, future, result)
@@ -0,0 +1,219 @@
+"""Tools for running providers in several event loops.
+
+By default all providers, hooks and commands of PHFSystem share one event loop, so one busy
+provider slows down all the others. When PHFSystem is created with shards_amount > 0, it
+creates that many shards - event loops running in their own threads. Every provider is placed
+on one of the shards by a placement policy, all provider's hooks run in the provider's shard.
+Commands are still executed in PHFSystem's main loop.
+
+There are 3 placement policies:
+
+- RoundRobinPlacement - providers are placed on shards one by one, default policy.
+- ExplicitPlacement - shard is chosen by provider class name or alias.
+- LeastLoadedPlacement - provider goes to the shard with least providers and hooks.
+
+Shard can also be chosen for concrete provider with PHFSystem.add_provider(provider, shard=n).
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import typing
+
+from .provider import AbstractContentProvider
+
+
+class Shard:
+    """Event loop, that runs in it's own thread.
+
+    Attributes:
+        number: int, number of the shard in PHFSystem.
+        _loop_factory: callable, creates shard's event loop.
+        _loop: asyncio.AbstractEventLoop, shard's event loop.
+        _thread: threading.Thread, in which the loop runs.
+        _ready: threading.Event, set when the loop is running or it's creation failed.
+        _error: exception raised by loop_factory or None.
+        _providers: list of providers placed on the shard while it's running.
+    """
+
+    def __init__(self,
+                 number: int,
+                 loop_factory: typing.Callable[[], asyncio.AbstractEventLoop] = None):
+        """Create the shard, it has to be started with start().
+
+        Args:
+            number: number of the shard.
+            loop_factory: callable that creates shard's event loop.
+        """
+        if loop_factory is None:
+            loop_factory = asyncio.new_event_loop
+
+        self.number = number
+        self._loop_factory = loop_factory
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+        self._providers = []
+
+    def _thread_func(self) -> None:
+        """Run shard's loop till stop() is called."""
+        try:
+            self._loop = self._loop_factory()
+        except Exception as exception:
+            self._error = exception
+            self._ready.set()
+            return
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(self._ready.set)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+            # start() mustn't wait forever if the loop stops before it's running
+            self._ready.set()
+
+    def start(self) -> None:
+        """Start shard's thread and wait till it's loop is running.
+
+        Raises:
+            Exception: raised by loop_factory.
+        """
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._thread_func,
+                                        name=f"phf-shard-{self.number}",
+                                        daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._thread.join()
+            self._thread = None
+            raise self._error
+
+    def stop(self) -> None:
+        """Stop shard's loop, wait till it's thread ends and forget placed providers."""
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+        self._providers = []
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Return shard's event loop."""
+        return self._loop
+
+    def get_providers(self) -> typing.List[AbstractContentProvider]:
+        """Return copy of list of providers placed on the shard."""
+        return self._providers[:]
+
+    def get_load(self) -> int:
+        """Return amount of providers and hooks in the shard."""
+        return sum(1 + len(provider.get_hooks()) for provider in self._providers)
+
+    def run_provider(self, content_provider: AbstractContentProvider) -> None:
+        """Place the provider on the shard and start it in shard's loop.
+
+        Args:
+            content_provider: provider to start.
+        """
+        self._providers.append(content_provider)
+
+        async def _coro():
+            content_provider.start()
+
+        asyncio.run_coroutine_threadsafe(_coro(), self._loop)
+
+    def remove_provider(self, content_provider: AbstractContentProvider) -> None:
+        """Remove the provider from the shard, it has to be stopped separately.
+
+        Args:
+            content_provider: provider to remove.
+        """
+        self._providers.remove(content_provider)
+
+
+class PlacementPolicy:
+    """Basic class for policies, that choose shard for providers."""
+
+    def choose_shard(self,
+                     content_provider: AbstractContentProvider,
+                     shards: typing.List[Shard]) -> Shard:
+        """Choose shard for the provider, not implemented.
+
+        Args:
+            content_provider: provider to place.
+            shards: list of all shards.
+
+        Returns:
+            Chosen shard.
+        """
+        raise NotImplementedError(f"choose_shard of {self.__class__} not overridden")
+
+
+class RoundRobinPlacement(PlacementPolicy):
+    """Place providers on shards one by one.
+
+    Attributes:
+        _next: int, number of shard for the next provider.
+    """
+
+    def __init__(self):
+        self._next = 0
+
+    def choose_shard(self,
+                     content_provider: AbstractContentProvider,
+                     shards: typing.List[Shard]) -> Shard:
+        shard = shards[self._next % len(shards)]
+        self._next += 1
+        return shard
+
+
+class ExplicitPlacement(PlacementPolicy):
+    """Place providers on shards by their class names or aliases.
+
+    Providers, that are not in the mapping, are placed by fallback policy.
+
+    Attributes:
+        _mapping: dict {class name or alias: shard number}.
+        _fallback: PlacementPolicy for providers not in mapping.
+
+    Example:
+        Run all "Crawler" providers in the first shard, "Server" in the second:
+
+            PHFSystem(shards_amount=2,
+                      placement=ExplicitPlacement({"Crawler": 0, "Server": 1}))
+    """
+
+    def __init__(self,
+                 mapping: typing.Dict[str, int],
+                 fallback: PlacementPolicy = None):
+        """Create the policy.
+
+        Args:
+            mapping: dict {class name or alias: shard number}.
+            fallback: policy for providers not in mapping, RoundRobinPlacement by default.
+        """
+        if fallback is None:
+            fallback = RoundRobinPlacement()
+        self._mapping = dict(mapping)
+        self._fallback = fallback
+
+    def choose_shard(self,
+                     content_provider: AbstractContentProvider,
+                     shards: typing.List[Shard]) -> Shard:
+        names = [content_provider.__class__.__name__] + content_provider.get_aliases()
+        for name in names:
+            if name in self._mapping:
+                return shards[self._mapping[name]]
+        return self._fallback.choose_shard(content_provider, shards)
+
+
+class LeastLoadedPlacement(PlacementPolicy):
+    """Place provider on the shard with least amount of providers and hooks."""
+
+    def choose_shard(self,
+                     content_provider: AbstractContentProvider,
+                     shards: typing.List[Shard]) -> Shard:
+        return min(shards, key=lambda shard: shard.get_load())
@@ -0,0 +1,364 @@
+"""Running one logical PHFSystem in several processes.
+
+One PHFSystem works in one process, so it can't use more than one core. PHFSupervisor
+starts worker processes, each of them runs it's own PHFSystem with a part of providers.
+Workers are spawned by default, so the main module has to be guarded by
+if __name__ == "__main__". Providers and hooks are described by aliases of HookAndProviderFactory, so they are
+created inside the workers.
+
+Read-only commands are sent to all workers, the results are gathered into a list, one result
+per worker. Commands, that change topology(see Command.changes_topology), are sent to one
+worker, given by it's number. Ids of providers and hooks in commands(like provider id in
+NewHookCommand) are ids in the worker's PHFSystem.
+
+Crashed workers are restarted with the same providers and hooks: the worker is built from
+it's providers and then topology commands, that succeeded in it, are executed again in the
+same order. Ids in the replayed commands stay right as long as creation of providers and
+hooks gives them the same ids in the new process.
+
+Example:
+    supervisor = PHFSupervisor(workers_amount=4, provider_paths=["providers"],
+                               hook_paths=["hooks"])
+    for _ in range(8):
+        supervisor.add_provider("crawler", kwargs={"period": 1}, hooks=[("saver", [], {})])
+    supervisor.start()
+    print(supervisor.execute_command(ListProvidersCommand()))
+    supervisor.execute_command(NewProviderCommand("crawler", kwargs={"period": 5}), worker=2)
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import multiprocessing
+import pickle
+import threading
+import time
+import typing
+
+from .commandinput import AbstractCommandInput, Command
+from .phfsystem import PHFSystem
+
+
+class ProviderSpec:
+    """Description of a provider and it's hooks to be created in a worker.
+
+    Attributes:
+        alias: str, name/alias of provider class.
+        args: list, positional arguments for provider's constructor.
+        kwargs: dict, keyword arguments for provider's constructor.
+        hooks: list of (alias, args, kwargs) tuples of provider's hooks.
+    """
+
+    def __init__(self,
+                 alias: str,
+                 args: list = None,
+                 kwargs: dict = None,
+                 hooks: typing.List[typing.Tuple[str, list, dict]] = None):
+        self.alias = alias
+        self.args = args if args is not None else []
+        self.kwargs = kwargs if kwargs is not None else {}
+        self.hooks = list(hooks) if hooks is not None else []
+
+    def create(self, phfsys: PHFSystem) -> None:
+        """Create provider with it's hooks and add it to phfsys.
+
+        Args:
+            phfsys: PHFSystem of the worker.
+        """
+        provider = phfsys.create_provider(self.alias, self.args, self.kwargs)
+        for hook_alias, hook_args, hook_kwargs in self.hooks:
+            provider.add_hook(phfsys.create_hook(hook_alias, hook_args, hook_kwargs))
+        phfsys.add_provider(provider)
+
+
+class RemoteError(Exception):
+    """Result of a worker, that can't be unpickled in the supervisor.
+
+    E.g. an object of a class from the worker's plugin modules, the message has it's repr.
+    """
+
+
+class _PipeCommandInput(AbstractCommandInput):
+    """Command input, that receives commands from supervisor through a pipe.
+
+    Commands to replay are executed first, their results aren't sent back. Commands are
+    executed one by one, so the result after a replayed command is always it's result.
+
+    Attributes:
+        _connection: multiprocessing.connection.Connection, worker's end of the pipe.
+        _replay: collections.deque of commands to execute before commands from the pipe.
+        _replaying: bool, whether the last command is a replayed one.
+    """
+
+    def __init__(self, connection, replay: typing.List[Command] = (), *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._connection = connection
+        self._replay = collections.deque(replay)
+        self._replaying = False
+
+    async def retrieve_command_from_source(self) -> Command:
+        if self._replay:
+            self._replaying = True
+            return self._replay.popleft()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._connection.recv)
+
+    def form_command(self, data: Command) -> Command:
+        return data
+
+    async def output_command_result(self, command_result) -> None:
+        """Send back pickled result and it's repr, the repr replaces unpicklable result."""
+        if self._replaying:
+            self._replaying = False
+            return
+        text = repr(command_result)
+        try:
+            data = pickle.dumps(command_result)
+        except Exception:
+            data = pickle.dumps(text)
+        self._connection.send_bytes(pickle.dumps((data, text)))
+
+
+def _worker_main(connection,
+                 specs: typing.List[ProviderSpec],
+                 commands: typing.List[Command],
+                 provider_paths: typing.List[str],
+                 hook_paths: typing.List[str],
+                 phfsystem_kwargs: dict) -> None:
+    """Build PHFSystem of a worker and run it.
+
+    Args:
+        connection: worker's end of command pipe.
+        specs: providers of the worker.
+        commands: topology commands to execute again after a restart.
+        provider_paths: paths to read providers from.
+        hook_paths: paths to read hooks from.
+        phfsystem_kwargs: keyword arguments for PHFSystem constructor.
+    """
+    phfsys = PHFSystem(**phfsystem_kwargs)
+    phfsys.import_provider_sources(*provider_paths)
+    phfsys.import_hook_sources(*hook_paths)
+    for spec in specs:
+        spec.create(phfsys)
+    phfsys.add_input_source(_PipeCommandInput(connection, commands))
+    phfsys.start()
+
+
+class _Worker:
+    """Supervisor's handle of a worker process.
+
+    Attributes:
+        number: int, number of the worker.
+        specs: list of ProviderSpec, providers of the worker.
+        commands: list of topology commands, that succeeded in the worker, in their order.
+        process: multiprocessing.Process or None, current process of the worker.
+        connection: supervisor's end of command pipe.
+        restarts: int, how many times the worker was restarted.
+    """
+
+    def __init__(self, number: int):
+        self.number = number
+        self.specs = []
+        self.commands = []
+        self.process = None
+        self.connection = None
+        self.restarts = 0
+
+
+class PHFSupervisor:
+    """Supervisor, that runs providers in several worker processes.
+
+    Attributes:
+        _workers: list of _Worker.
+        _provider_paths: list of str paths to read providers from in workers.
+        _hook_paths: list of str paths to read hooks from in workers.
+        _phfsystem_kwargs: dict, keyword arguments for workers' PHFSystem.
+        _context: multiprocessing context to create processes.
+        _check_period: float, how often workers are checked for crashes in seconds.
+        _next_worker: int, worker for the next provider without explicit worker.
+        _lock: threading.Lock, guards workers and pipes.
+        _running: bool, whether supervisor is running.
+        _monitor_thread: threading.Thread, restarts crashed workers.
+    """
+
+    def __init__(self,
+                 workers_amount: int = None,
+                 provider_paths: typing.List[str] = None,
+                 hook_paths: typing.List[str] = None,
+                 phfsystem_kwargs: dict = None,
+                 start_method: str = "spawn",
+                 check_period: float = 1):
+        """Create supervisor, workers are created on start().
+
+        Args:
+            workers_amount: amount of worker processes, amount of cores by default.
+            provider_paths: paths to read providers from.
+            hook_paths: paths to read hooks from.
+            phfsystem_kwargs: keyword arguments for workers' PHFSystem constructor.
+            start_method: multiprocessing start method. "fork" is faster, but forking a
+                process with other threads(shards, executors, the monitor thread) can
+                deadlock the child on locks held by those threads.
+            check_period: how often workers are checked for crashes in seconds.
+        """
+        if workers_amount is None:
+            workers_amount = multiprocessing.cpu_count()
+
+        self._workers = [_Worker(number) for number in range(workers_amount)]
+        self._provider_paths = list(provider_paths) if provider_paths is not None else []
+        self._hook_paths = list(hook_paths) if hook_paths is not None else []
+        self._phfsystem_kwargs = phfsystem_kwargs if phfsystem_kwargs is not None else {}
+        self._context = multiprocessing.get_context(start_method)
+        self._check_period = check_period
+        self._next_worker = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self._monitor_thread = None
+
+    def add_provider(self,
+                     alias: str,
+                     args: list = None,
+                     kwargs: dict = None,
+                     hooks: typing.List[typing.Tuple[str, list, dict]] = None,
+                     worker: int = None) -> int:
+        """Add provider with hooks to one of workers.
+
+        Providers have to be added before start().
+
+        Args:
+            alias: name/alias of provider class.
+            args: positional arguments for provider's constructor.
+            kwargs: keyword arguments for provider's constructor.
+            hooks: list of (alias, args, kwargs) tuples of provider's hooks.
+            worker: number of worker for the provider, workers are used one by one
+                if not set.
+
+        Returns:
+            Number of worker where the provider is placed.
+        """
+        if self._running:
+            raise RuntimeError("Providers have to be added before start of PHFSupervisor")
+        if worker is None:
+            worker = self._next_worker % len(self._workers)
+            self._next_worker += 1
+        self._workers[worker].specs.append(ProviderSpec(alias, args, kwargs, hooks))
+        return worker
+
+    def _start_worker(self, worker: _Worker) -> None:
+        """Create worker's process and pipe and start the process."""
+        supervisor_connection, worker_connection = self._context.Pipe()
+        worker.connection = supervisor_connection
+        worker.process = self._context.Process(target=_worker_main,
+                                               args=(worker_connection,
+                                                     worker.specs,
+                                                     list(worker.commands),
+                                                     self._provider_paths,
+                                                     self._hook_paths,
+                                                     self._phfsystem_kwargs),
+                                               name=f"phf-worker-{worker.number}",
+                                               daemon=True)
+        worker.process.start()
+        worker_connection.close()
+
+    def _monitor(self) -> None:
+        """Restart crashed workers while supervisor is running."""
+        while self._running:
+            with self._lock:
+                for worker in self._workers:
+                    if self._running and not worker.process.is_alive():
+                        worker.process.join()
+                        self._start_worker(worker)
+                        worker.restarts += 1
+            time.sleep(self._check_period)
+
+    def start(self) -> None:
+        """Start all workers, it isn't blocking."""
+        with self._lock:
+            self._running = True
+            for worker in self._workers:
+                self._start_worker(worker)
+        self._monitor_thread = threading.Thread(target=self._monitor,
+                                                name="phf-supervisor-monitor",
+                                                daemon=True)
+        self._monitor_thread.start()
+
+    def stop(self) -> None:
+        """Stop all workers."""
+        self._running = False
+        with self._lock:
+            for worker in self._workers:
+                if worker.process is not None:
+                    worker.process.terminate()
+                    worker.process.join()
+                    worker.connection.close()
+
+    def get_worker_pids(self) -> typing.List[typing.Optional[int]]:
+        """Return list of pids of current worker processes, None for not started ones."""
+        with self._lock:
+            return [worker.process.pid if worker.process is not None else None
+                    for worker in self._workers]
+
+    def get_restarts(self) -> typing.List[int]:
+        """Return list of amounts of restarts of every worker."""
+        with self._lock:
+            return [worker.restarts for worker in self._workers]
+
+    def execute_command(self, command: Command, worker: int = None) -> typing.Any:
+        """Execute command in one worker or, if it doesn't change topology, in all workers.
+
+        Results that can't be pickled are replaced by their repr, results that can't be
+        unpickled in the supervisor are replaced by RemoteError. If the command raises an
+        exception in a worker or the worker crashes, the exception is put as it's result.
+        Topology commands, that succeeded, are remembered to be replayed if the worker
+        restarts.
+
+        Args:
+            command: command to execute.
+            worker: number of the worker to execute the command in, it's required for
+                commands that change topology.
+
+        Returns:
+            Result of the command if worker is given, otherwise list of command results,
+            one per worker.
+
+        Raises:
+            ValueError: if the command changes topology and worker isn't given or if there
+                is no such worker.
+            RuntimeError: if supervisor isn't started.
+        """
+        if worker is None and command.changes_topology():
+            raise ValueError(f"{type(command).__name__} changes topology, it has to be "
+                             f"executed in one worker")
+        if worker is not None and worker not in range(len(self._workers)):
+            raise ValueError(f"No worker {worker}, there are {len(self._workers)} workers")
+        if not self._running:
+            raise RuntimeError("PHFSupervisor isn't started")
+
+        with self._lock:
+            workers = self._workers if worker is None else [self._workers[worker]]
+            results = []
+            for current in workers:
+                try:
+                    current.connection.send(command)
+                except (OSError, EOFError) as exception:
+                    results.append(exception)
+                else:
+                    results.append(None)
+
+            for number, current in enumerate(workers):
+                if isinstance(results[number], Exception):
+                    continue
+                try:
+                    data, text = pickle.loads(current.connection.recv_bytes())
+                except (OSError, EOFError) as exception:
+                    results[number] = exception
+                    continue
+                try:
+                    results[number] = pickle.loads(data)
+                except Exception as exception:
+                    results[number] = RemoteError(f"{text} can't be unpickled: {exception!r}")
+
+            if worker is None:
+                return results
+            if command.changes_topology() and not isinstance(results[0], Exception):
+                workers[0].commands.append(command)
+            return results[0]
@@ -0,0 +1,194 @@
+"""Recording of provider and hook timelines in Chrome trace format.
+
+Tracer records spans of sampled ticks of providers: get_content, waiting of data in every
+hook's queue, every hook_action, gathering of results and result_callback, and every message
+of ComplexContentProvider. Spans carry provider, hook and sequence ids. In the trace every
+provider is a process and every hook is a thread of it, so hooks, that block the provider's
+ticks, are seen at once.
+
+The trace is written as JSON, that can be opened in chrome://tracing or ui.perfetto.dev.
+Only the newest max_events spans are kept, and only sample_rate of ticks is recorded, so
+tracing can be left on in a long-running system.
+
+Example:
+    tracer = Tracer("trace.json", sample_rate=0.1)
+    phfsys = PHFSystem(tracer=tracer)
+    ...
+    phfsys.start()  # the trace is written when the system stops
+"""
+from __future__ import annotations
+
+import collections
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+import typing
+
+# Thread of provider's own spans in provider's process of the trace
+PROVIDER_TID = 0
+
+
+class Tracer:
+    """Collector of trace spans.
+
+    Tracer may be shared by providers of different shards, spans are added under a lock.
+
+    Attributes:
+        _path: str or None, where dump() writes the trace by default.
+        _sample_rate: float, part of ticks to record, from 0 to 1.
+        _events: collections.deque of complete("X") events, bounded by max_events.
+        _track_names: dict {(pid, tid): name} for metadata events.
+        _dropped: int, amount of events pushed out of the full buffer.
+        _origin: float, time.perf_counter() of trace's zero time.
+        _lock: threading.Lock, guards events.
+    """
+
+    def __init__(self, path: str = None, max_events: int = 100000, sample_rate: float = 1.0):
+        """Create tracer.
+
+        Args:
+            path: where dump() writes the trace by default.
+            max_events: max amount of kept spans, the oldest ones are thrown away.
+            sample_rate: part of ticks to record, from 0 to 1.
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be from 0 to 1")
+        self._path = path
+        self._sample_rate = sample_rate
+        self._events = collections.deque(maxlen=max_events)
+        self._track_names = {}
+        self._dropped = 0
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def get_path(self) -> typing.Optional[str]:
+        """Return default path of the trace file."""
+        return self._path
+
+    def start_tick(self, provider, sequence: int) -> typing.Optional[TraceTick]:
+        """Decide whether the tick is sampled and return it's TraceTick if it is.
+
+        Args:
+            provider: provider, that starts the tick.
+            sequence: number of the tick in the provider.
+
+        Returns:
+            TraceTick or None if the tick isn't recorded.
+        """
+        if self._sample_rate < 1 and random.random() >= self._sample_rate:
+            return None
+        pid = provider.get_id() if provider.get_id() is not None else id(provider)
+        if (pid, PROVIDER_TID) not in self._track_names:
+            name = provider.get_name() or type(provider).__name__
+            self.name_track(pid, PROVIDER_TID, f"{name} #{provider.get_id()}")
+        return TraceTick(self, pid, sequence)
+
+    def name_track(self, pid: int, tid: int, name: str) -> None:
+        """Set name of a process(tid is PROVIDER_TID) or a thread of the trace."""
+        with self._lock:
+            self._track_names[(pid, tid)] = name
+
+    def add_span(self, name: str, start: float, end: float, pid: int, tid: int,
+                 args: typing.Dict[str, typing.Any] = None) -> None:
+        """Add complete span.
+
+        Args:
+            name: name of the span.
+            start: time.perf_counter() of the start.
+            end: time.perf_counter() of the end.
+            pid: process of the trace, id of the provider.
+            tid: thread of the trace, PROVIDER_TID or id of the hook + 1.
+            args: dict of span's arguments.
+        """
+        event = {"name": name, "ph": "X", "ts": (start - self._origin) * 1e6,
+                 "dur": (end - start) * 1e6, "pid": pid, "tid": tid, "args": args or {}}
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self._dropped += 1
+            self._events.append(event)
+
+    def get_dropped(self) -> int:
+        """Return amount of spans thrown away because the buffer was full."""
+        return self._dropped
+
+    def get_events(self) -> typing.List[dict]:
+        """Return metadata and span events in Chrome trace format."""
+        with self._lock:
+            events = [{"name": "process_name" if tid == PROVIDER_TID else "thread_name",
+                       "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                      for (pid, tid), name in self._track_names.items()]
+            events.extend(self._events)
+        return events
+
+    def dump(self, path: str = None) -> None:
+        """Write the trace to a JSON file.
+
+        Args:
+            path: file to write, the tracer's path if not set.
+        """
+        path = path if path is not None else self._path
+        if path is None:
+            raise ValueError("Path of the trace isn't set")
+        trace = {"traceEvents": self.get_events(), "displayTimeUnit": "ms",
+                 "otherData": {"sample_rate": self._sample_rate,
+                               "dropped_events": self._dropped}}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(trace, file)
+        os.replace(tmp_path, path)
+
+    def clear(self) -> None:
+        """Throw away all recorded spans."""
+        with self._lock:
+            self._events.clear()
+            self._dropped = 0
+
+
+class TraceTick:
+    """Sampled tick of a provider.
+
+    Attributes:
+        tracer: Tracer to record spans to.
+        pid: process of the provider in the trace.
+        sequence: number of the tick in the provider.
+    """
+
+    def __init__(self, tracer: Tracer, pid: int, sequence: int):
+        self.tracer = tracer
+        self.pid = pid
+        self.sequence = sequence
+
+    @contextlib.contextmanager
+    def span(self, name: str, tid: int = PROVIDER_TID, **args):
+        """Record span of the code inside with statement."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            args["sequence"] = self.sequence
+            self.tracer.add_span(name, start, time.perf_counter(), self.pid, tid, args)
+
+
+class TracedItem:
+    """Data of a sampled tick in hook's queue, hooks unwrap it and record their spans.
+
+    Attributes:
+        data: data from provider.
+        tick: TraceTick of the data.
+        enqueued: float, time.perf_counter() when data was put to the queue.
+    """
+
+    def __init__(self, data: typing.Any, tick: TraceTick):
+        self.data = data
+        self.tick = tick
+        self.enqueued = time.perf_counter()
+
+
+def span(tick: typing.Optional[TraceTick], name: str, **args) -> typing.ContextManager:
+    """Return context manager recording span of the tick or doing nothing if tick is None."""
+    if tick is None:
+        return contextlib.nullcontext()
+    return tick.span(name, **args)
@@ -1,50 +1,974 @@
 import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import typing
+import urllib.parse
+import uuid
 from pathlib import Path
 
 import aiofiles
 import aiohttp
 
+from .abstracthook import AbstractHook
 
-async def download_one_file(site, path, session, semaphore):
-    await semaphore.acquire()
-    async with session.get(site) as resp:
-        if resp.status == 200:
-            start_path = path
-            i = 1
-            while Path(path).exists():
-                dot_pos = start_path.rindex(".")
-                path = start_path[:dot_pos] + f"({i})" + start_path[dot_pos:]
-                i += 1
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_RETRIES = 3
+PART_SUFFIX = ".part"
+_RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+_STORE_INDEX_VERSION = 1
+
+# Absolute target paths of running downloads without a store, so simultaneous downloads
+# to the same path get different free paths. Downloads may run in loops of different threads.
+_reserved_paths = set()
+_reserved_paths_lock = threading.Lock()
+
+
+class DownloadMetrics:
+    """Timings and transferred bytes of one download, all attempts included.
+
+    Attributes:
+        bytes: int, amount of body bytes received, resumed parts aren't counted.
+        duration: float, time from the start till the end of the download in seconds.
+        ttfb: float, time to first byte of the last attempt, from sending the request till
+            the answer's headers in seconds, None if there was no answer.
+        wait_time: float, time spent waiting for download slots in seconds.
+        throttle_time: float, time spent waiting for bandwidth limiters in seconds.
+    """
+
+    def __init__(self):
+        self.bytes = 0
+        self.duration = 0.0
+        self.ttfb = None
+        self.wait_time = 0.0
+        self.throttle_time = 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        """Mean speed of the download."""
+        return self.bytes / self.duration if self.duration else 0.0
+
+    def as_dict(self) -> typing.Dict[str, float]:
+        """Return metrics as a dict, e.g. for logging or JSON."""
+        return {"bytes": self.bytes, "duration": self.duration, "ttfb": self.ttfb,
+                "wait_time": self.wait_time, "throttle_time": self.throttle_time,
+                "bytes_per_second": self.bytes_per_second}
+
+    def __repr__(self):
+        return f"DownloadMetrics({self.as_dict()})"
+
+
+class TokenBucket:
+    """Bandwidth limiter, that lets rate bytes per second through with bursts up to burst bytes.
+
+    Bytes are taken after they are received, if there are not enough tokens the consumer
+    sleeps till the debt is paid, so the next chunk isn't read and TCP slows the sender down.
+    Concurrent consumers share the rate, as each of them waits for the whole debt.
+
+    Attributes:
+        rate: float, bytes per second.
+        burst: float, max amount of accumulated tokens.
+        _tokens: float, current amount of tokens, negative is a debt.
+        _last: float, time.monotonic() of the last update.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        """Create full bucket.
+
+        Args:
+            rate: bytes per second.
+            burst: max amount of accumulated tokens, rate if None.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._last = time.monotonic()
+
+    async def consume(self, amount: int) -> None:
+        """Take amount of tokens, wait if there are not enough of them."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= amount
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class DownloadResult:
+    """Result of downloading one file.
+
+    Attributes:
+        url: str, url of the file.
+        path: str, where the file is saved, None if it isn't downloaded.
+        digest: str, hex digest of the file if checksum was asked, None otherwise.
+        size: int, size of the file in bytes.
+        attempts: int, amount of made requests.
+        error: exception of the last attempt, None if the file is downloaded.
+        cached: bool, whether the server answered, that the file in ContentStore isn't
+            modified, so the body wasn't transferred.
+        metrics: DownloadMetrics.
+    """
+
+    def __init__(self, url: str, path: str = None, digest: str = None, size: int = 0,
+                 attempts: int = 0, error: BaseException = None, cached: bool = False,
+                 metrics: DownloadMetrics = None):
+        self.url = url
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.attempts = attempts
+        self.error = error
+        self.cached = cached
+        self.metrics = metrics if metrics is not None else DownloadMetrics()
+
+    @property
+    def ok(self) -> bool:
+        """Whether the file is downloaded."""
+        return self.error is None
+
+    def __repr__(self):
+        return f"DownloadResult(url={self.url!r}, path={self.path!r}, size={self.size}, " \
+               f"attempts={self.attempts}, error={self.error!r})"
+
+
+class ContentStore:
+    """Content-addressed storage of downloaded files.
+
+    Every file is stored once in root/blobs under it's digest, and target paths of downloads
+    become links to it: hardlinks if possible, symlinks otherwise, copies as the last resort.
+    As hardlinks share the content with the blob, target files shouldn't be modified in place.
+    Index maps urls to digests and ETag/Last-Modified of their last answers, so repeated
+    downloads send conditional requests and the body isn't transferred if it isn't modified.
+
+    The index is written to root/index.json by save(), Downloader saves it when it's closed.
+
+    Attributes:
+        algorithm: str, name of hashlib algorithm of digests.
+        _root: str, directory of the store.
+        _index_path: str, path to the index file.
+        _urls: dict {url: {"digest": str, "size": int, "etag": str, "last_modified": str}}.
+        _changed: bool, whether there are changes not saved to the index file.
+    """
+
+    def __init__(self, root: str, algorithm: str = "sha256"):
+        """Create store in root directory and load it's index if it exists.
+
+        Args:
+            root: directory of the store, it's created if it doesn't exist.
+            algorithm: name of hashlib algorithm of digests.
+        """
+        hashlib.new(algorithm)
+        self.algorithm = algorithm
+        self._root = os.path.abspath(root)
+        self._index_path = os.path.join(self._root, "index.json")
+        self._urls = {}
+        self._changed = False
+        os.makedirs(os.path.join(self._root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(self._root, "parts"), exist_ok=True)
+        if os.path.isfile(self._index_path):
+            with open(self._index_path) as file:
+                data = json.load(file)
+            if data.get("version") == _STORE_INDEX_VERSION and \
+                    data.get("algorithm") == algorithm:
+                self._urls = data["urls"]
+
+    def blob_path(self, digest: str) -> str:
+        """Return path of the blob with digest."""
+        return os.path.join(self._root, "blobs", digest[:2], digest)
+
+    def part_path(self, url: str) -> str:
+        """Return new path for an unfinished download of url.
+
+        Every call gives a unique path, so simultaneous downloads of the same url don't write
+        to the same file.
+        """
+        name = f"{hashlib.sha1(url.encode()).hexdigest()}-{uuid.uuid4().hex}"
+        return os.path.join(self._root, "parts", name + PART_SUFFIX)
+
+    def get_entry(self, url: str) -> typing.Optional[dict]:
+        """Return index entry of url or None if url or it's blob isn't stored."""
+        entry = self._urls.get(url)
+        if entry is None or not os.path.isfile(self.blob_path(entry["digest"])):
+            return None
+        return entry
+
+    def conditional_headers(self, url: str) -> typing.Dict[str, str]:
+        """Return If-None-Match/If-Modified-Since headers for a request of url."""
+        entry = self.get_entry(url)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def add(self, url: str, file_path: str, digest: str, size: int,
+            etag: str = None, last_modified: str = None) -> str:
+        """Move downloaded file to it's blob and remember it as the content of url.
+
+        If the blob already exists, the file is just removed.
+
+        Args:
+            url: url of the file.
+            file_path: path to downloaded file.
+            digest: hex digest of the file computed with the store's algorithm.
+            size: size of the file in bytes.
+            etag: ETag header of the answer.
+            last_modified: Last-Modified header of the answer.
+
+        Returns:
+            Path of the blob.
+        """
+        blob_path = self.blob_path(digest)
+        if os.path.isfile(blob_path):
+            os.remove(file_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(file_path, blob_path)
+        self._urls[url] = {"digest": digest, "size": size, "etag": etag,
+                           "last_modified": last_modified}
+        self._changed = True
+        return blob_path
+
+    def link(self, digest: str, path: str) -> None:
+        """Make path a link to the blob with digest, existing file at path is replaced.
+
+        Hardlink is tried first, then symlink, then the blob is copied.
+        """
+        blob_path = self.blob_path(digest)
+        if os.path.isfile(path) and os.path.samefile(path, blob_path):
+            return
+        tmp_path = path + ".link"
+        for make_link in (os.link, os.symlink, shutil.copyfile):
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
             try:
-                f = await aiofiles.open(path, mode='wb')
-            except FileNotFoundError:
-                import os
-                dirs = path.split(os.path.sep)
-                dirs = os.path.sep.join(dirs[:-1])
-                try:
-                    os.makedirs(dirs)
-                except FileNotFoundError:
-                    await asyncio.sleep(0.1)
-                f = await aiofiles.open(path, mode='wb')
-            await f.write(await resp.read())
-            await f.close()
-    semaphore.release()
-    return
-
-
-async def download_files(site_paths, file_paths=None, max_objects_at_once=5):
+                make_link(blob_path, tmp_path)
+                break
+            except OSError:
+                if make_link is shutil.copyfile:
+                    raise
+        os.replace(tmp_path, path)
+
+    def save(self) -> None:
+        """Write index to it's file if there are unsaved changes."""
+        if not self._changed:
+            return
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": _STORE_INDEX_VERSION, "algorithm": self.algorithm,
+                       "urls": self._urls}, file)
+        os.replace(tmp_path, self._index_path)
+        self._changed = False
+
+
+class _RetryableError(Exception):
+    """Error of an attempt, after which the download is tried again."""
+
+
+class _NotModified(Exception):
+    """Server answered 304 to a conditional request."""
+
+
+def _reserve_path(path: str) -> str:
+    """Return path or path with "(1)", "(2)"... added to it's name if it exists.
+
+    The returned path is reserved till _release_path, other downloads of this process don't
+    get it even before it's file is created.
+    """
+    start_path = path
+    i = 1
+    with _reserved_paths_lock:
+        while Path(path).exists() or os.path.abspath(path) in _reserved_paths:
+            dot_pos = start_path.rfind(".")
+            if dot_pos <= start_path.rfind(os.path.sep):
+                dot_pos = len(start_path)
+            path = start_path[:dot_pos] + f"({i})" + start_path[dot_pos:]
+            i += 1
+        _reserved_paths.add(os.path.abspath(path))
+    return path
+
+
+def _release_path(path: str) -> None:
+    """Let other downloads use path, see _reserve_path."""
+    with _reserved_paths_lock:
+        _reserved_paths.discard(os.path.abspath(path))
+
+
+def _part_path(site: str, path: str) -> str:
+    """Return path of the unfinished download of site to path without a store.
+
+    The name has a hash of the url, so a part left by a download of other url isn't resumed.
+    """
+    return f"{path}.{hashlib.sha1(site.encode()).hexdigest()[:16]}{PART_SUFFIX}"
+
+
+def _backoff_delay(attempt: int, backoff: float, max_backoff: float) -> float:
+    """Return exponential delay with full jitter before attempt number attempt + 1."""
+    return random.uniform(0, min(max_backoff, backoff * 2 ** (attempt - 1)))
+
+
+async def _hash_file(path: str, hasher, chunk_size: int) -> None:
+    """Feed content of already downloaded part of the file to hasher."""
+    async with aiofiles.open(path, mode='rb') as f:
+        while True:
+            chunk = await f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+
+
+def _validators(resp: aiohttp.ClientResponse) -> typing.Dict[str, str]:
+    """Return ETag and Last-Modified of the answer as kwargs of ContentStore.add."""
+    return {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+
+
+async def _download_attempt(site, part_path, session, semaphore, chunk_size, checksum,
+                            headers, limiters, metrics):
+    """Make one request and write the body to part_path, resuming it if it exists.
+
+    Received bytes are taken from all limiters, timings are added to metrics.
+
+    Returns:
+        Tuple (size, hex digest or None, validators) of the complete file, see _validators.
+
+    Raises:
+        _RetryableError: the attempt failed and may be repeated.
+        _NotModified: server answered 304 to conditional headers.
+        aiohttp.ClientResponseError: server answered with a not retryable status.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = dict(headers or {})
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    wait_start = time.perf_counter()
+    async with semaphore:
+        request_start = time.perf_counter()
+        metrics.wait_time += request_start - wait_start
+        try:
+            async with session.get(site, headers=headers) as resp:
+                metrics.ttfb = time.perf_counter() - request_start
+                if resp.status == 304:
+                    raise _NotModified()
+                if resp.status == 416 and offset:
+                    # The part may be the whole file, otherwise it's broken
+                    if resp.headers.get("Content-Range") == f"bytes */{offset}":
+                        hasher = hashlib.new(checksum) if checksum is not None else None
+                        if hasher is not None:
+                            await _hash_file(part_path, hasher, chunk_size)
+                        return offset, hasher.hexdigest() if hasher is not None else None, \
+                            _validators(resp)
+                    os.remove(part_path)
+                    raise _RetryableError(f"Range {offset}- isn't satisfiable")
+                if resp.status in _RETRYABLE_STATUSES:
+                    raise _RetryableError(f"Server answered {resp.status} {resp.reason}")
+                resp.raise_for_status()
+                if resp.status == 206 and not resp.headers.get("Content-Range", "")\
+                        .startswith(f"bytes {offset}-"):
+                    os.remove(part_path)
+                    raise _RetryableError("Server sent wrong range")
+                if resp.status != 206:
+                    offset = 0
+
+                hasher = hashlib.new(checksum) if checksum is not None else None
+                if hasher is not None and offset:
+                    await _hash_file(part_path, hasher, chunk_size)
+                size = offset
+                async with aiofiles.open(part_path, mode='ab' if offset else 'wb') as f:
+                    async for chunk in resp.content.iter_chunked(chunk_size):
+                        metrics.bytes += len(chunk)
+                        if limiters:
+                            throttle_start = time.perf_counter()
+                            for limiter in limiters:
+                                await limiter.consume(len(chunk))
+                            metrics.throttle_time += time.perf_counter() - throttle_start
+                        if hasher is not None:
+                            hasher.update(chunk)
+                        await f.write(chunk)
+                        size += len(chunk)
+                validators = _validators(resp)
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError,
+                asyncio.TimeoutError) as e:
+            raise _RetryableError(str(e) or type(e).__name__) from e
+    return size, hasher.hexdigest() if hasher is not None else None, validators
+
+
+async def download_one_file(site, path, session, semaphore,
+                            chunk_size=DEFAULT_CHUNK_SIZE, checksum=None,
+                            retries=DEFAULT_RETRIES, backoff=0.5, max_backoff=30, store=None,
+                            limiters=()):
+    """Download file from site to path, if path exists "(1)", "(2)"... is added to it's name.
+
+    The body is written to disk by chunks to a part file next to path, it's name has a hash of
+    the url, and it's renamed to path when the download is complete. If the part of the same
+    url already exists, e.g. after an interrupted download, only the rest of the file is
+    requested with Range header. Simultaneous downloads to the same path in one process get
+    different paths. Connection errors, timeouts and 408, 429 and 5xx answers are retried
+    after exponentially growing delays with random jitter, every retry continues from already
+    downloaded bytes. Errors don't raise, they are returned in the result.
+
+    With a ContentStore the file is downloaded into the store and path becomes a link to it's
+    blob, existing file at path is replaced. If the url is already stored, the request is
+    conditional and nothing is transferred when the file isn't modified. Every download gets
+    it's own part file in the store, retries resume it, but it's removed if the download
+    fails.
+
+    Args:
+        site: url of the file.
+        path: where to save the file.
+        session: aiohttp.ClientSession to use.
+        semaphore: asyncio.Semaphore or other async context manager, that limits amount of
+            simultaneous downloads, it's held only during requests, not during delays between
+            them.
+        chunk_size: size of chunks in bytes.
+        checksum: name of hashlib algorithm(like "sha256") to compute while downloading.
+        retries: how many times a failed download is repeated.
+        backoff: base delay between attempts in seconds, it doubles after every attempt.
+        max_backoff: max delay between attempts in seconds.
+        store: ContentStore to keep the file in, checksum is the store's algorithm then.
+        limiters: TokenBuckets, that limit bandwidth of the download.
+
+    Returns:
+        DownloadResult with DownloadMetrics.
+    """
+    start = time.perf_counter()
+    result = DownloadResult(site)
+    try:
+        return await _download_one_file(site, path, session, semaphore, chunk_size, checksum,
+                                        retries, backoff, max_backoff, store, limiters, result)
+    finally:
+        result.metrics.duration = time.perf_counter() - start
+
+
+async def _download_one_file(site, path, session, semaphore, chunk_size, checksum, retries,
+                             backoff, max_backoff, store, limiters, result):
+    """Body of download_one_file, that fills result."""
+    if store is None:
+        path = _reserve_path(path)
+        try:
+            return await _download_to_path(site, path, _part_path(site, path), session,
+                                           semaphore, chunk_size, checksum, retries, backoff,
+                                           max_backoff, None, limiters, result)
+        finally:
+            _release_path(path)
+    return await _download_to_path(site, path, store.part_path(site), session, semaphore,
+                                   chunk_size, store.algorithm, retries, backoff, max_backoff,
+                                   store, limiters, result)
+
+
+async def _download_to_path(site, path, part_path, session, semaphore, chunk_size, checksum,
+                            retries, backoff, max_backoff, store, limiters, result):
+    """Download site through part_path to path, that is already chosen, and fill result."""
+    headers = store.conditional_headers(site) if store is not None else None
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    except OSError as e:
+        result.error = e
+        return result
+    while True:
+        result.attempts += 1
+        try:
+            result.size, result.digest, validators = await _download_attempt(
+                site, part_path, session, semaphore, chunk_size, checksum, headers, limiters,
+                result.metrics)
+            if store is None:
+                os.replace(part_path, path)
+            else:
+                store.add(site, part_path, result.digest, result.size, **validators)
+                store.link(result.digest, path)
+        except _NotModified:
+            _remove_store_part(store, part_path)
+            entry = store.get_entry(site) if store is not None else None
+            if entry is None:
+                if headers:
+                    # The entry is evicted after the headers were made, request the whole file
+                    headers = None
+                    continue
+                result.error = aiohttp.ClientError("Server answered 304 to an unconditional "
+                                                   "request")
+                return result
+            result.size, result.digest, result.cached = entry["size"], entry["digest"], True
+            try:
+                store.link(result.digest, path)
+            except OSError as e:
+                result.error = e
+                return result
+        except _RetryableError as e:
+            result.error = e.__cause__ or e
+            if result.attempts > retries:
+                _remove_store_part(store, part_path)
+                return result
+            await asyncio.sleep(_backoff_delay(result.attempts, backoff, max_backoff))
+            continue
+        except (aiohttp.ClientError, OSError) as e:
+            result.error = e
+            _remove_store_part(store, part_path)
+            return result
+        result.path = path
+        result.error = None
+        return result
+
+
+def _remove_store_part(store, part_path: str) -> None:
+    """Remove part file of a failed download into store, no other download can resume it."""
+    if store is not None and os.path.exists(part_path):
+        os.remove(part_path)
+
+
+class _DownloadSlot:
+    """Async context manager, that takes a per-host and then a global slot of Downloader.
+
+    The host slot is taken first, so downloads waiting for a busy host don't hold global slots.
+    """
+
+    def __init__(self, host_semaphore: asyncio.Semaphore, semaphore: asyncio.Semaphore):
+        self._host_semaphore = host_semaphore
+        self._semaphore = semaphore
+
+    async def __aenter__(self):
+        if self._host_semaphore is not None:
+            await self._host_semaphore.acquire()
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            if self._host_semaphore is not None:
+                self._host_semaphore.release()
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+        if self._host_semaphore is not None:
+            self._host_semaphore.release()
+
+
+class Downloader:
+    """Reusable downloader, that owns a long-lived aiohttp session.
+
+    Connections are kept alive and DNS answers are cached between downloads, so hooks, that
+    download files for every piece of data, don't pay for a new session and TLS handshakes
+    every time. One object may be shared by many hooks, but it's bound to the event loop
+    where it's used first, as the session is. Hooks of one provider always share a loop.
+
+    Example:
+        downloader = Downloader(max_downloads=20, max_downloads_per_host=4)
+        hook_one = MyDownloadingHook(downloader)
+        hook_two = MyDownloadingHook(downloader)
+        ...
+        result = await downloader.download("https://example.com/a.png", "downloads/a.png")
+        ...
+        await downloader.close()
+
+    Attributes:
+        _max_downloads: int, max amount of simultaneous downloads.
+        _max_downloads_per_host: int, max amount of simultaneous downloads from one host, 0 is
+            no limit.
+        _connector_kwargs: dict of arguments of aiohttp.TCPConnector.
+        _timeout: aiohttp.ClientTimeout of the session.
+        _chunk_size, _checksum, _retries, _backoff, _max_backoff: defaults for downloads,
+            see download_one_file.
+        _store: ContentStore or None.
+        _session: aiohttp.ClientSession, created on the first download.
+        _loop: event loop of the session.
+        _semaphore: asyncio.Semaphore of all downloads.
+        _host_semaphores: dict {host: asyncio.Semaphore}.
+        _max_bytes_per_second_per_host: float or None, rate of per-host buckets.
+        _bucket: TokenBucket of all downloads or None.
+        _host_buckets: dict {host: TokenBucket}.
+        _totals: dict of summed metrics of finished downloads, see get_metrics.
+        _active: int, amount of running downloads.
+        _busy_time: float, time when at least one download was running, without the current
+            period.
+        _busy_start: float, time.perf_counter() when the current busy period started.
+    """
+
+    def __init__(self, max_downloads: int = 10, max_downloads_per_host: int = 0,
+                 ttl_dns_cache: float = 300, keepalive_timeout: float = 30,
+                 timeout: aiohttp.ClientTimeout = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 checksum: str = None, retries: int = DEFAULT_RETRIES, backoff: float = 0.5,
+                 max_backoff: float = 30, store: ContentStore = None,
+                 max_bytes_per_second: float = None,
+                 max_bytes_per_second_per_host: float = None):
+        """Create downloader, the session is created on the first download.
+
+        Args:
+            max_downloads: max amount of simultaneous downloads and open connections.
+            max_downloads_per_host: max amount of simultaneous downloads and open connections
+                to one host, 0 is no limit.
+            ttl_dns_cache: how long DNS answers are cached in seconds, None is forever.
+            keepalive_timeout: how long idle connections are kept in seconds.
+            timeout: aiohttp.ClientTimeout of requests, aiohttp's default if None.
+            chunk_size: default size of chunks in bytes.
+            checksum: default name of hashlib algorithm to compute checksums with.
+            retries: default amount of retries of failed downloads.
+            backoff: default base delay between attempts in seconds.
+            max_backoff: default max delay between attempts in seconds.
+            store: ContentStore to keep files in, see download_one_file.
+            max_bytes_per_second: bandwidth of all downloads, not limited if None.
+            max_bytes_per_second_per_host: bandwidth of downloads from one host, not limited
+                if None.
+        """
+        self._max_downloads = max_downloads
+        self._max_downloads_per_host = max_downloads_per_host
+        self._connector_kwargs = {"limit": max_downloads,
+                                  "limit_per_host": max_downloads_per_host,
+                                  "ttl_dns_cache": ttl_dns_cache,
+                                  "keepalive_timeout": keepalive_timeout}
+        self._timeout = timeout
+        self._chunk_size = chunk_size
+        self._checksum = checksum
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._store = store
+        self._session = None
+        self._loop = None
+        self._semaphore = None
+        self._host_semaphores = {}
+        self._max_bytes_per_second_per_host = max_bytes_per_second_per_host
+        self._bucket = TokenBucket(max_bytes_per_second) \
+            if max_bytes_per_second is not None else None
+        self._host_buckets = {}
+        self._totals = {"downloads": 0, "failed": 0, "cached": 0, "answered": 0, "bytes": 0,
+                        "duration": 0.0, "ttfb": 0.0, "wait_time": 0.0, "throttle_time": 0.0}
+        self._active = 0
+        self._busy_time = 0.0
+        self._busy_start = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the session, create it in the running loop if there is no session."""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed:
+            kwargs = {} if self._timeout is None else {"timeout": self._timeout}
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(**self._connector_kwargs), **kwargs)
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._max_downloads)
+            self._host_semaphores = {}
+        elif loop is not self._loop:
+            raise RuntimeError("Downloader is used in a different event loop")
+        return self._session
+
+    def _get_slot(self, url: str) -> _DownloadSlot:
+        """Return context manager, that limits downloads from url's host."""
+        host_semaphore = None
+        if self._max_downloads_per_host:
+            host = urllib.parse.urlsplit(url).hostname
+            host_semaphore = self._host_semaphores.get(host)
+            if host_semaphore is None:
+                host_semaphore = asyncio.Semaphore(self._max_downloads_per_host)
+                self._host_semaphores[host] = host_semaphore
+        return _DownloadSlot(host_semaphore, self._semaphore)
+
+    def _get_limiters(self, url: str) -> typing.List[TokenBucket]:
+        """Return bandwidth limiters of url's host."""
+        limiters = [self._bucket] if self._bucket is not None else []
+        if self._max_bytes_per_second_per_host is not None:
+            host = urllib.parse.urlsplit(url).hostname
+            bucket = self._host_buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self._max_bytes_per_second_per_host)
+                self._host_buckets[host] = bucket
+            limiters.append(bucket)
+        return limiters
+
+    def _add_metrics(self, result: DownloadResult) -> None:
+        """Add metrics of finished download to totals."""
+        metrics = result.metrics
+        self._totals["downloads"] += 1
+        self._totals["failed"] += not result.ok
+        self._totals["cached"] += result.cached
+        self._totals["bytes"] += metrics.bytes
+        self._totals["duration"] += metrics.duration
+        if metrics.ttfb is not None:
+            self._totals["answered"] += 1
+            self._totals["ttfb"] += metrics.ttfb
+        self._totals["wait_time"] += metrics.wait_time
+        self._totals["throttle_time"] += metrics.throttle_time
+
+    def get_metrics(self) -> typing.Dict[str, float]:
+        """Return aggregate metrics of finished downloads.
+
+        Returns:
+            Dict with keys:
+            "downloads", "failed", "cached": amounts of downloads;
+            "answered": amount of downloads, that got an answer from the server;
+            "bytes": received bytes;
+            "duration", "wait_time", "throttle_time": sums of downloads' metrics in seconds;
+            "mean_ttfb": mean time to first byte of answered downloads in seconds;
+            "busy_time": time when at least one download was running in seconds;
+            "bytes_per_second": bytes divided by busy_time;
+            "active": amount of running downloads.
+        """
+        busy_time = self._busy_time
+        if self._busy_start is not None:
+            busy_time += time.perf_counter() - self._busy_start
+        metrics = dict(self._totals)
+        metrics["mean_ttfb"] = metrics.pop("ttfb") / metrics["answered"] \
+            if metrics["answered"] else 0.0
+        metrics["busy_time"] = busy_time
+        metrics["bytes_per_second"] = metrics["bytes"] / busy_time if busy_time else 0.0
+        metrics["active"] = self._active
+        return metrics
+
+    async def download(self, url: str, path: str, **kwargs) -> DownloadResult:
+        """Download one file, see download_one_file.
+
+        Args:
+            url: url of the file, "https://" is added if it has no scheme.
+            path: where to save the file.
+            **kwargs: chunk_size, checksum, retries, backoff, max_backoff or store to use
+                instead of the downloader's defaults.
+
+        Returns:
+            DownloadResult.
+        """
+        url = _add_scheme(url)
+        session = self._get_session()
+        options = {"chunk_size": self._chunk_size, "checksum": self._checksum,
+                   "retries": self._retries, "backoff": self._backoff,
+                   "max_backoff": self._max_backoff, "store": self._store}
+        options.update(kwargs)
+        if self._active == 0:
+            self._busy_start = time.perf_counter()
+        self._active += 1
+        try:
+            result = await download_one_file(url, path, session, self._get_slot(url),
+                                             limiters=self._get_limiters(url), **options)
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self._busy_time += time.perf_counter() - self._busy_start
+                self._busy_start = None
+        self._add_metrics(result)
+        return result
+
+    async def download_many(self, urls: typing.Iterable[str], paths: typing.Iterable[str],
+                            **kwargs) -> typing.List[DownloadResult]:
+        """Download files simultaneously, failure of one file doesn't stop others.
+
+        Returns:
+            List of DownloadResult in order of urls.
+        """
+        return await asyncio.gather(*(self.download(url, path, **kwargs)
+                                      for url, path in zip(urls, paths)))
+
+    async def close(self) -> None:
+        """Close the session and all it's connections and save the store's index.
+
+        Next download creates a new session.
+        """
+        if self._store is not None:
+            self._store.save()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# Options of Downloader.download, that can be given to DownloadHook
+_DOWNLOAD_OPTIONS = ("chunk_size", "checksum", "retries", "backoff", "max_backoff", "store")
+
+
+def _add_scheme(url: str) -> str:
+    """Return url with "https://" if it has no scheme."""
+    if not url.startswith(("https://", "http://")):
+        url = "https://" + url
+    return url
+
+
+async def download_files(site_paths, file_paths=None, max_objects_at_once=5,
+                         chunk_size=DEFAULT_CHUNK_SIZE, checksum=None,
+                         retries=DEFAULT_RETRIES, backoff=0.5, max_backoff=30, store=None):
+    """Download files simultaneously, failure of one file doesn't stop others.
+
+    A new session is created for every call, use Downloader to download files repeatedly.
+
+    Args:
+        site_paths: list of urls or list of (url, path) tuples if file_paths is None.
+        file_paths: list of paths to save files to.
+        max_objects_at_once: max amount of simultaneous downloads.
+        chunk_size: size of chunks in bytes, see download_one_file.
+        checksum: name of hashlib algorithm to compute checksums with.
+        retries: how many times a failed download is repeated.
+        backoff: base delay between attempts in seconds.
+        max_backoff: max delay between attempts in seconds.
+        store: ContentStore to keep files in.
+
+    Returns:
+        List of DownloadResult in order of urls.
+    """
     if file_paths is None:
         file_paths = list(map(lambda x: x[1], site_paths))
         site_paths = list(map(lambda x: x[0], site_paths))
-    all_downloads = []
-    semaphore = asyncio.Semaphore(value=max_objects_at_once)
-    async with aiohttp.ClientSession() as session:
-        for site, path in zip(site_paths, file_paths):
-            if site.find(r"https://") == -1 and site.find(r"http://"):
-                site = r"https://" + site
-            cur_coru = download_one_file(site, path, session, semaphore)
-            all_downloads.append(cur_coru)
-        await asyncio.gather(*all_downloads)
+    async with Downloader(max_downloads=max_objects_at_once, chunk_size=chunk_size,
+                          checksum=checksum, retries=retries, backoff=backoff,
+                          max_backoff=max_backoff, store=store) as downloader:
+        return await downloader.download_many(site_paths, file_paths)
+
+
+class DownloadHook(AbstractHook):
+    """Hook, that downloads files sent by any provider.
+
+    Data may be:
+    - url, the file is saved to directory under the last part of url's path;
+    - tuple (url, path) or dict {"url": url, "path": path};
+    - list of the above, files of the list are downloaded simultaneously.
+
+    The result is DownloadResult for one file or list of DownloadResult for a list, errors
+    are in results. Files are downloaded by a Downloader given to the hook or by a Downloader
+    shared by all DownloadHooks without one in the same event loop, so sessions and
+    connections are reused and amount of downloads is limited by the downloader.
+
+    With pipeline_depth > 1 the hook takes next data from the provider while previous files
+    are still downloaded, results are still sent to the provider in order of data. It's
+    useful for providers without result_callback and for gather strategies, that don't wait
+    for all hooks.
+
+    Attributes:
+        _downloader: Downloader given to the hook or None to use the shared one.
+        _directory: str, where files without given paths are saved.
+        _pipeline_depth: int, max amount of data items processed at once.
+        _options: dict of download options like checksum, see Downloader.download.
+        _shared_downloader: Downloader, the shared one while the hook is running.
+    """
+    # {event loop: [Downloader, amount of running hooks using it]}
+    _shared_downloaders = {}
+
+    def __init__(self, directory: str = "downloads", downloader: Downloader = None,
+                 pipeline_depth: int = 1, *args, **kwargs):
+        """Create hook.
+
+        Args:
+            directory: where files without given paths are saved.
+            downloader: Downloader to use, the shared one if None.
+            pipeline_depth: max amount of data items processed at once.
+            **kwargs: download options like checksum or retries, see Downloader.download.
+
+        Raises:
+            TypeError: if kwargs have an unknown download option.
+            ValueError: if pipeline_depth is less than 1.
+        """
+        super().__init__(*args)
+        unknown = sorted(set(kwargs) - set(_DOWNLOAD_OPTIONS))
+        if unknown:
+            raise TypeError(f"Unknown download options {unknown}, "
+                            f"expected some of {list(_DOWNLOAD_OPTIONS)}")
+        if pipeline_depth < 1:
+            raise ValueError("pipeline_depth must be at least 1")
+        self._directory = directory
+        self._downloader = downloader
+        self._pipeline_depth = pipeline_depth
+        self._options = kwargs
+        self._shared_downloader = None
+
+    def get_downloader(self) -> typing.Optional[Downloader]:
+        """Return downloader of the hook, the shared one is returned only while it's running."""
+        return self._downloader if self._downloader is not None else self._shared_downloader
+
+    def _acquire_shared_downloader(self) -> None:
+        """Take the shared downloader of the running loop, create it if there is none."""
+        if self._downloader is not None:
+            return
+        loop = asyncio.get_running_loop()
+        entry = self._shared_downloaders.setdefault(loop, [Downloader(), 0])
+        entry[1] += 1
+        self._shared_downloader = entry[0]
+
+    async def _release_shared_downloader(self) -> None:
+        """Stop using the shared downloader, the last hook closes it."""
+        if self._shared_downloader is None:
+            return
+        loop = asyncio.get_running_loop()
+        entry = self._shared_downloaders[loop]
+        entry[1] -= 1
+        self._shared_downloader = None
+        if entry[1] == 0:
+            del self._shared_downloaders[loop]
+            await entry[0].close()
+
+    def _parse_item(self, item: typing.Any) -> typing.Tuple[str, str]:
+        """Return (url, path) of one data item."""
+        if isinstance(item, str):
+            url = item
+            name = os.path.basename(urllib.parse.urlsplit(_add_scheme(url)).path) or "index"
+            return url, os.path.join(self._directory, name)
+        if isinstance(item, dict):
+            return item["url"], item["path"]
+        if isinstance(item, tuple) and len(item) == 2:
+            return item
+        raise TypeError(f"Can't download {item!r}, url, (url, path) or dict is expected")
+
+    async def hook_action(self, data: typing.Any) -> typing.Any:
+        """Download file or list of files.
+
+        Returns:
+            DownloadResult or list of DownloadResult if data is a list.
+        """
+        downloader = self.get_downloader()
+        if isinstance(data, list):
+            items = [self._parse_item(item) for item in data]
+            return await downloader.download_many([url for url, path in items],
+                                                  [path for url, path in items],
+                                                  **self._options)
+        url, path = self._parse_item(data)
+        return await downloader.download(url, path, **self._options)
+
+    async def cycle_call(self) -> None:
+        """Make hook start doing its work, see AbstractHook.cycle_call.
+
+        Up to pipeline_depth data items are processed at once, results are sent in order.
+        After stop data that is already taken is processed.
+        """
+        self._running = True
+        self._acquire_shared_downloader()
+        slots = asyncio.Semaphore(self._pipeline_depth)
+        ordered = asyncio.Queue()
+        sender = asyncio.ensure_future(self._send_results(ordered, slots))
+        try:
+            while self._is_running():
+                target = await self.get_straight_queue().get()
+                if isinstance(target, asyncio.CancelledError):
+                    break
+                await slots.acquire()
+                ordered.put_nowait(asyncio.ensure_future(self._call_hook_action(target)))
+            ordered.put_nowait(None)
+            await sender
+        except BaseException:
+            sender.cancel()
+            while not ordered.empty():
+                task = ordered.get_nowait()
+                if task is not None:
+                    task.cancel()
+            raise
+        finally:
+            self._running = False
+            await self._release_shared_downloader()
+
+    async def _send_results(self, ordered: asyncio.Queue, slots: asyncio.Semaphore) -> None:
+        """Send results of tasks to provider in order of the tasks, till None is got."""
+        while True:
+            task = await ordered.get()
+            if task is None:
+                return
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            self.get_callback_queue().put_nowait(result)
+            slots.release()
 
 
 if __name__ == "__main__":
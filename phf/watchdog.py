@@ -0,0 +1,274 @@
+"""Detection of blocking code in hooks and providers.
+
+All hooks and providers of a loop share one thread, so a hook_action or get_content, that does
+blocking work, stalls everything in the loop. LoopWatchdog measures lag of the loop: a task in
+the loop wakes up every interval seconds and a watching thread checks that it did. When the loop
+doesn't wake up for longer than threshold seconds, the thread takes a stack sample of the loop's
+thread and finds the hook or provider, whose code is running, so a slow step is reported as
+a SlowStepEvent like "DivisionCheckHook #3 blocked the loop for 0.8s" instead of just
+"the system is slow".
+
+PHFSystem watches it's main loop and all shards with enable_watchdog().
+
+Example:
+    phfsys.enable_watchdog(threshold=0.1)
+    ...
+    for event in phfsys.get_slow_steps():
+        print(event.owner_class, event.duration)
+        print("".join(event.stack))
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+import typing
+
+from .abstracthook import AbstractHook
+from .provider import AbstractContentProvider
+
+logger = logging.getLogger(__name__)
+
+
+class SlowStepEvent:
+    """A single step of loop's code, that ran longer than threshold.
+
+    Attributes:
+        owner_kind: str, "hook", "provider" or "unknown" if no hook or provider code was running.
+        owner_class: str or None, class name of the hook or provider.
+        owner_id: int or None, id of the hook or provider.
+        loop_name: str, name of the watched loop, "main" or "shard-n" in PHFSystem.
+        started: float, time.time() when the step started.
+        duration: float, how long the loop was blocked in seconds, grows till the step ends.
+        finished: bool, whether the step has already ended.
+        stack: list of str, formatted stack of the loop's thread taken during the step.
+        _monotonic_start: float, time.monotonic() when the step started.
+    """
+
+    def __init__(self,
+                 owner: typing.Any,
+                 loop_name: str,
+                 started: float,
+                 duration: float,
+                 stack: typing.List[str]):
+        if isinstance(owner, AbstractHook):
+            self.owner_kind = "hook"
+        elif isinstance(owner, AbstractContentProvider):
+            self.owner_kind = "provider"
+        else:
+            self.owner_kind = "unknown"
+        self.owner_class = type(owner).__name__ if owner is not None else None
+        self.owner_id = owner.get_id() if owner is not None else None
+        self.loop_name = loop_name
+        self.started = started
+        self.duration = duration
+        self.finished = False
+        self.stack = stack
+        self._monotonic_start = time.monotonic() - duration
+
+    def __repr__(self):
+        return f"SlowStepEvent({self.owner_kind} {self.owner_class} #{self.owner_id}, " \
+               f"loop={self.loop_name}, duration={self.duration:.3f})"
+
+
+class LoopWatchdog:
+    """Measures lag of an event loop and reports steps, that block it.
+
+    Attributes:
+        threshold: float, steps longer than it in seconds are reported.
+        interval: float, how often the loop is checked in seconds.
+        loop_name: str, name of the loop in events.
+        _loop: asyncio.AbstractEventLoop, watched loop.
+        _loop_thread_id: int, ident of the loop's thread.
+        _last_beat: float, time.monotonic() of the last wake up of the loop.
+        _lag: float, lag of the last wake up in seconds.
+        _max_lag: float, max lag since start in seconds.
+        _current_event: SlowStepEvent of the step, that blocks the loop now, or None.
+        _events: collections.deque of the newest SlowStepEvents.
+        _task: asyncio.Task of heartbeat in the watched loop.
+        _thread: threading.Thread, that checks the heartbeat.
+        _stopped: threading.Event, set when watching is stopped.
+        _lock: threading.Lock for events.
+    """
+
+    def __init__(self,
+                 threshold: float = 0.1,
+                 interval: float = None,
+                 max_events: int = 1000,
+                 loop_name: str = "main"):
+        """Create watchdog, it has to be started with start().
+
+        Args:
+            threshold: steps longer than it in seconds are reported.
+            interval: how often the loop is checked, threshold / 2 by default.
+            max_events: only the newest max_events events are kept.
+            loop_name: name of the loop in events.
+        """
+        if threshold <= 0:
+            raise ValueError(f"Threshold has to be positive, got {threshold}")
+        self.threshold = threshold
+        self.interval = interval if interval is not None else threshold / 2
+        self.loop_name = loop_name
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = None
+        self._lag = 0.0
+        self._max_lag = 0.0
+        self._current_event = None
+        self._events = collections.deque(maxlen=max_events)
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start watching the loop, has to be called in the loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped = threading.Event()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch,
+                                        args=[self._stopped],
+                                        name=f"phf-watchdog-{self.loop_name}",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching, can be called from any thread."""
+        self._stopped.set()
+        task, self._task = self._task, None
+        if task is None or self._loop.is_closed():
+            return
+        if self._loop is _get_running_loop():
+            task.cancel()
+        else:
+            self._loop.call_soon_threadsafe(task.cancel)
+
+    def get_lag(self) -> float:
+        """Return lag of the last wake up of the loop in seconds."""
+        return self._lag
+
+    def get_max_lag(self) -> float:
+        """Return max lag of the loop since start in seconds."""
+        return self._max_lag
+
+    def get_events(self) -> typing.List[SlowStepEvent]:
+        """Return copy of the list of kept events, the oldest first."""
+        with self._lock:
+            return list(self._events)
+
+    def clear_events(self) -> None:
+        """Throw away kept events."""
+        with self._lock:
+            self._events.clear()
+
+    async def _heartbeat(self) -> None:
+        """Wake up every interval and measure how late it happened."""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat(now, max(0.0, now - expected))
+
+    def _beat(self, now: float, lag: float) -> None:
+        """Remember wake up of the loop and finish the current event if there is one."""
+        with self._lock:
+            self._last_beat = now
+            self._lag = lag
+            self._max_lag = max(self._max_lag, lag)
+            event, self._current_event = self._current_event, None
+            if event is not None:
+                event.duration = now - event._monotonic_start
+                event.finished = True
+
+    def _watch(self, stopped: threading.Event) -> None:
+        """Check heartbeat in the watching thread till stop() is called.
+
+        While the loop is blocked, it's stack is sampled every interval. If other hook or
+        provider blocks the loop than in the previous sample, the current event is finished
+        and a new one is started.
+
+        Args:
+            stopped: event, that is set by stop().
+        """
+        while not stopped.wait(self.interval):
+            with self._lock:
+                blocked = time.monotonic() - self._last_beat - self.interval
+            if blocked < self.threshold:
+                continue
+            event = self._sample(blocked)
+            if event is None:
+                continue
+            with self._lock:
+                now = time.monotonic()
+                if now - self._last_beat - self.interval < self.threshold:
+                    continue
+                current = self._current_event
+                if current is not None:
+                    current.duration = now - current._monotonic_start
+                    if (current.owner_kind, current.owner_id) == \
+                            (event.owner_kind, event.owner_id):
+                        continue
+                    current.finished = True
+                    event.started, event._monotonic_start = time.time(), now
+                    event.duration = 0.0
+                self._current_event = event
+                self._events.append(event)
+            logger.warning("%s blocks loop %s for %.3fs", event.owner_class or "Unknown code",
+                           self.loop_name, blocked)
+
+    def _sample(self, blocked: float) -> typing.Optional[SlowStepEvent]:
+        """Take stack sample of the loop's thread and make event of it.
+
+        Args:
+            blocked: how long the loop is blocked already.
+
+        Returns:
+            The event or None if the thread has already finished.
+        """
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = traceback.format_stack(frame)
+        owner = _find_owner(frame)
+        if owner is None:
+            owner = _find_task_owner(self._loop)
+        return SlowStepEvent(owner, self.loop_name, time.time() - blocked, blocked, stack)
+
+
+def _find_owner(frame) -> typing.Optional[typing.Union[AbstractHook, AbstractContentProvider]]:
+    """Return the innermost hook or provider, whose method is in the stack of frame."""
+    while frame is not None:
+        owner = frame.f_locals.get("self")
+        if isinstance(owner, (AbstractHook, AbstractContentProvider)):
+            return owner
+        frame = frame.f_back
+    return None
+
+
+def _find_task_owner(loop: asyncio.AbstractEventLoop
+                     ) -> typing.Optional[typing.Union[AbstractHook, AbstractContentProvider]]:
+    """Return the hook or provider, whose coroutine is the loop's current task."""
+    task = asyncio.current_task(loop)
+    if task is None:
+        return None
+    coroutine = task.get_coro()
+    frame = getattr(coroutine, "cr_frame", None)
+    if frame is None:
+        return None
+    return _find_owner(frame)
+
+
+def _get_running_loop() -> typing.Optional[asyncio.AbstractEventLoop]:
+    """Return running event loop of current thread or None."""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
@@ -5,6 +5,7 @@ setuptools.setup(
     version='1.0.1',
     packages=['phf'],
     install_requires=["aioconsole", "aiofiles", "aiohttp"],
+    extras_require={"uvloop": ["uvloop"]},
     package_dir={'phf': 'phf'},
     url='https://github.com/framaz/phf',
     license='MIT License',
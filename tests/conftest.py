@@ -325,7 +325,28 @@ class FakeCommandTranslator:
 @pytest.fixture
 async def started_phfsys() -> (PHFSystem, FakeCommandTranslator):
     """Fixture to get a running PHFSystem and command input source."""
-    phfsys = PHFSystem()
+    phfsys, fake_command_translator = await _start_phfsys(PHFSystem())
+    yield phfsys, fake_command_translator
+    await _stop_phfsys(phfsys)
+
+
+@pytest.fixture
+async def started_sharded_phfsys() -> (PHFSystem, FakeCommandTranslator):
+    """Fixture to get a running PHFSystem with 2 shards and command input source."""
+    phfsys, fake_command_translator = await _start_phfsys(PHFSystem(shards_amount=2))
+    yield phfsys, fake_command_translator
+    await _stop_phfsys(phfsys)
+
+
+async def _stop_phfsys(phfsys: PHFSystem) -> None:
+    """Stop phfsys, running in a different thread, without blocking current loop."""
+    future = asyncio.run_coroutine_threadsafe(phfsys.stop_async(drain=False, timeout=1),
+                                              phfsys._asyncio_loop)
+    await asyncio.wrap_future(future)
+
+
+async def _start_phfsys(phfsys: PHFSystem) -> (PHFSystem, FakeCommandTranslator):
+    """Start phfsys in a different thread and create command input source for it."""
     fake_command_translator = FakeCommandTranslator()
 
     def _start_sys():
@@ -0,0 +1,13 @@
+from phf.provider import PeriodicContentProvider
+
+
+class CountingProvider(PeriodicContentProvider):
+    _alias = ["counting"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(period=0.01, *args, **kwargs)
+        self.ticks = 0
+
+    async def get_content(self) -> object:
+        self.ticks += 1
+        return self.ticks
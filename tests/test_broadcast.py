@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from phf.broadcast import BroadcastChannel
+from phf.phfsystem import PHFSystem
+from phf.provider import PeriodicContentProvider
+from conftest import DebugLogging
+
+
+class CountingProvider(PeriodicContentProvider):
+    def __init__(self, *args, **kwargs):
+        super().__init__(period=0, *args, **kwargs)
+        self.number = 0
+        self.results = []
+
+    async def get_content(self):
+        self.number += 1
+        return self.number
+
+    async def result_callback(self, results):
+        self.results.append(results)
+
+
+class SlowHook(DebugLogging):
+    async def hook_action(self, data):
+        await asyncio.sleep(0.01)
+        return await super().hook_action(data)
+
+
+@pytest.mark.asyncio
+async def test_channel():
+    channel = BroadcastChannel(capacity=2)
+    channel.put_nowait("lost")
+    first, second = channel.add_reader(), channel.add_reader()
+    channel.put_nowait(1)
+    channel.put_nowait(2)
+    assert channel.full() and channel.qsize() == 2
+    with pytest.raises(asyncio.QueueFull):
+        channel.put_nowait(3)
+
+    put = asyncio.ensure_future(channel.put(3))
+    assert first.get_nowait() == 1 and first.get_nowait() == 2
+    await asyncio.sleep(0)
+    assert not put.done()
+    second.put_nowait("private")
+    assert second.qsize() == 3
+    assert await second.get() == 1
+    await asyncio.wait_for(put, 1)
+    assert await first.get() == 3
+    assert [second.get_nowait() for _ in range(3)] == [2, "private", 3]
+    assert channel.qsize() == 0 and channel._ring == [None, None]
+
+    get = asyncio.ensure_future(first.get())
+    await asyncio.sleep(0)
+    channel.put_nowait(4)
+    assert await asyncio.wait_for(get, 1) == 4
+    second.close()
+    assert channel.get_readers_amount() == 1 and channel.qsize() == 0
+    moved = first.transfer()
+    first.put_nowait("stop")
+    assert first.get_nowait() == "stop"
+    with pytest.raises(asyncio.QueueEmpty):
+        first.get_nowait()
+    channel.put_nowait(5)
+    assert moved.get_nowait() == 5 and channel.get_readers_amount() == 1
+    with pytest.raises(ValueError):
+        BroadcastChannel(capacity=0)
+
+
+@pytest.mark.asyncio
+async def test_provider_with_broadcast():
+    phfsys = PHFSystem()
+    provider = CountingProvider()
+    provider.set_broadcast(4)
+    fast, slow = DebugLogging(), SlowHook()
+    provider.add_hooks([fast, slow])
+    phfsys.add_provider(provider)
+    await phfsys.start_async()
+    await asyncio.sleep(0.2)
+    channel = provider.get_broadcast()
+    assert channel.get_readers_amount() == 2 and channel.qsize() <= 4
+    assert len(fast.logs) - len(slow.logs) <= 4
+
+    provider.remove_hook(slow)
+    await asyncio.sleep(0.05)
+    assert channel.get_readers_amount() == 1
+    logged = len(fast.logs)
+    await asyncio.sleep(0.05)
+    assert len(fast.logs) > logged + 10
+
+    await phfsys.stop_async()
+    assert fast.logs == list(range(1, len(fast.logs) + 1))
+    assert all(len(set(result)) == 1 for result in provider.results)
+    assert len(provider.results[-1]) == 1
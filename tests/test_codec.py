@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+import pickle
+import threading
+
+import pytest
+
+from phf.codec import EncodedPayload, MsgpackCodec, PickleCodec, RawCodec, get_codec, \
+    recv_payload, send_payload, stop_payloads
+from phf.processhook import ProcessHook
+from phf.provider import AbstractContentProvider
+from conftest import DebugLogging
+
+
+class Blob:
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        return Blob, (pickle.PickleBuffer(self.data),)
+
+
+def test_pickle_codec():
+    big = bytearray(b"a" * 100000)
+    payload = PickleCodec(min_buffer_size=1000).encode({"big": big, "small": b"b",
+                                                        "blob": Blob(bytearray(5000))})
+    assert len(payload.buffers) == 2 and len(payload.header) < 1000
+    big[0] = ord("c")
+    data = payload.decode()
+    assert data["big"][0] == ord("c") and data["big"].readonly
+    assert data["small"] == b"b" and len(data["blob"].data) == 5000
+    assert payload.get_size() > 105000
+    with pytest.raises(TypeError):
+        PickleCodec().encode(lambda: None)
+
+
+def test_other_codecs():
+    payload = RawCodec().encode(b"abc")
+    assert bytes(payload.decode()) == b"abc" and payload.header == b""
+    with pytest.raises(TypeError):
+        RawCodec().encode("abc")
+    pytest.importorskip("msgpack")
+    assert MsgpackCodec().encode({"a": [1, b"2"]}).decode() == {"a": [1, b"2"]}
+    assert isinstance(get_codec("msgpack"), MsgpackCodec)
+    with pytest.raises(KeyError):
+        get_codec("nothing")
+
+
+@pytest.mark.parametrize("threshold", [None, 1000])
+def test_transport(threshold):
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    data = [bytearray(b"x" * 200000), bytes(10)]
+    payload = PickleCodec(min_buffer_size=100).encode(data)
+
+    def _send():
+        send_payload(sender, payload, error=True, shared_memory_threshold=threshold)
+        stop_payloads(sender)
+
+    thread = threading.Thread(target=_send)
+    thread.start()
+    received = recv_payload(receiver)
+    assert received.error and received.lease.is_empty() == (threshold is None)
+    decoded = received.decode()
+    assert bytes(decoded[0]) == bytes(data[0]) and bytes(decoded[1]) == data[1]
+    del decoded
+    received.buffers = None
+    received.lease.release()
+    assert recv_payload(receiver) is None
+    thread.join()
+
+
+@pytest.mark.asyncio
+async def test_provider_encodes_once():
+    provider = AbstractContentProvider()
+    provider.set_codec(PickleCodec(min_buffer_size=100))
+    hooks = [DebugLogging(), DebugLogging()]
+    provider.add_hooks(hooks)
+    for hook in hooks:
+        provider._start_hook_in_loop(hook)
+    data = bytearray(1000)
+    await provider._notify_all_hooks({"data": data})
+    await asyncio.sleep(0.05)
+    first, second = hooks[0].logs[0]["data"], hooks[1].logs[0]["data"]
+    data[0] = 1
+    assert first[0] == second[0] == 1
+    assert hooks[0].get_codec() is provider.get_codec()
+    for hook in hooks:
+        hook.stop()
+    await asyncio.gather(*provider._asyncio_hook_tasks, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(20)
+async def test_process_hook():
+    hook = ProcessHook("hook", args=[1], hook_paths=["factory_obj"],
+                       shared_memory_threshold=1000)
+    task = asyncio.create_task(hook.cycle_call())
+    await asyncio.sleep(0.1)
+    assert hook.get_pid() is not None
+    result = await hook.hook_action(bytearray(b"y" * 100000))
+    assert bytes(result) == b"y" * 100000
+    assert await hook.hook_action(EncodedPayload(RawCodec(), b"", [memoryview(b"z")])) == b"z"
+    hook.stop()
+    await asyncio.wait_for(task, 10)
+    assert hook.get_pid() is None
@@ -3,6 +3,7 @@ import asyncio
 import pytest
 
 from phf import commandinput
+from phf.phfsystem import BatchReference, NameDoublingError
 
 
 @pytest.fixture
@@ -72,6 +73,22 @@ class TestCommands:
         assert res == "a"
         assert command._executed
 
+    @pytest.mark.asyncio
+    async def test_Command_execute_async(self, fake_started_phfsys, monkeypatch):
+        async def _apply(phfsys):
+            return "a"
+
+        command = commandinput.Command()
+        monkeypatch.setattr(command, "_apply", _apply)
+        assert await command.execute_command_async(fake_started_phfsys) == "a"
+        assert command._executed
+
+    def test_changes_topology(self):
+        assert not commandinput.ListProvidersCommand.changes_topology()
+        assert not commandinput.ListHooksCommand.changes_topology()
+        assert commandinput.NewProviderCommand.changes_topology()
+        assert commandinput.NewHookCommand.changes_topology()
+
     @pytest.mark.asyncio
     async def test_ListProvidersCommand(self,
                                         fake_started_phfsys,
@@ -140,6 +157,28 @@ class TestCommands:
         assert res.a == 0
         assert res.b == 1
 
+    @pytest.mark.asyncio
+    async def test_commands_by_names(self, non_started_phfsys):
+        command = commandinput.NewProviderCommand("Provider1", args=[0], name="first")
+        provider = command.execute_command(non_started_phfsys)
+        assert non_started_phfsys.get_provider("first") is provider
+
+        command = commandinput.NewHookCommand("hook", "first", args=[0], name="hook")
+        hook = command.execute_command(non_started_phfsys)
+        assert commandinput.ListHooksCommand("first").execute_command(non_started_phfsys) == [hook]
+
+        command = commandinput.RemoveHookCommand("hook")
+        assert command.changes_topology()
+        assert command.execute_command(non_started_phfsys) is hook
+        assert provider.get_hooks() == []
+
+        command = commandinput.RemoveProviderCommand(provider.get_id())
+        assert command.changes_topology()
+        assert command.execute_command(non_started_phfsys) is provider
+        assert non_started_phfsys.get_providers() == []
+        with pytest.raises(KeyError):
+            command.execute_command(non_started_phfsys)
+
     @pytest.mark.asyncio
     async def test_NewHookCommand(self, fake_started_phfsys):
         command = commandinput.NewHookCommand("hook",
@@ -170,3 +209,60 @@ class TestCommands:
         assert providers[0].get_hooks() == []
         assert providers[2].get_hooks() == []
         assert providers[1].get_hooks() == [res]
+
+    @pytest.mark.asyncio
+    async def test_BatchCommand(self, fake_started_phfsys):
+        provider_command = commandinput.NewProviderCommand("Provider1", args=[0])
+        existing_provider = provider_command.execute_command(fake_started_phfsys)
+
+        command = commandinput.BatchCommand([("Provider1", [1], None, None),
+                                             ("hook", [2], {"b": 3}, BatchReference(0)),
+                                             ("hook", [4], None, 0),
+                                             ("hook", [5], None, BatchReference(0))])
+        assert command.changes_topology()
+        res = command.execute_command(fake_started_phfsys)
+        await asyncio.sleep(0.01)
+
+        new_provider, hook1, hook2, hook3 = res
+        assert command._created == res
+        assert fake_started_phfsys.get_providers() == [existing_provider, new_provider]
+        assert new_provider.a == 1
+        assert new_provider._asyncio_running
+        assert new_provider.get_hooks() == [hook1, hook3]
+        assert existing_provider.get_hooks() == [hook2]
+        assert (hook1.a, hook1.b, hook2.a, hook3.a) == (2, 3, 4, 5)
+        assert hook1._running and hook2._running and hook3._running
+
+    @pytest.mark.parametrize("specs, error", [
+        ([("Provider1", [1], None, None), ("azaza", [], None, BatchReference(0))], KeyError),
+        ([("Provider1", [1], None, None), ("hook", [0], None, 3)], KeyError),
+        ([("Provider1", [1], None, None), ("hook", [0], None, "azaza")], KeyError),
+        ([("hook", [0], None, BatchReference(-1)), ("Provider1", [1], None, None)], ValueError),
+        ([("Provider1", [1], None, None), ("hook", [0], None, BatchReference(2))], ValueError),
+    ])
+    def test_BatchCommand_nothing_created_on_error(self, non_started_phfsys, specs, error):
+        command = commandinput.BatchCommand(specs)
+        with pytest.raises(error):
+            command.execute_command(non_started_phfsys)
+        assert non_started_phfsys.get_providers() == []
+
+    def test_BatchCommand_nothing_added_on_name_doubling(self, non_started_phfsys, monkeypatch):
+        existing_provider = non_started_phfsys.create_provider("Provider1", [0], {})
+        non_started_phfsys.add_provider(existing_provider)
+        factory = non_started_phfsys._providers_and_hooks_factory
+        create_hooks = factory.create_hooks
+
+        def _create_named_hooks(specs):
+            hooks = create_hooks(specs)
+            for hook in hooks:
+                hook.set_name("same")
+            return hooks
+
+        monkeypatch.setattr(factory, "create_hooks", _create_named_hooks)
+        command = commandinput.BatchCommand([("Provider1", [1], None, None),
+                                             ("hook", [2], None, BatchReference(0)),
+                                             ("hook", [3], None, existing_provider.get_id())])
+        with pytest.raises(NameDoublingError):
+            command.execute_command(non_started_phfsys)
+        assert non_started_phfsys.get_providers() == [existing_provider]
+        assert existing_provider.get_hooks() == []
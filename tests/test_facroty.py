@@ -1,9 +1,12 @@
+import concurrent.futures
+import os
+import sys
 from collections import Counter
 
 import pytest
 
 from factory_obj.file1 import Hook1, Provider1
-from phf import factory
+from phf import discovery, factory
 
 hook_names = ["hook", "Hook1", "Hook2", "AbstractHook"]
 provider_names = ["Provider1", "BlockingContentProvider", ]
@@ -20,6 +23,22 @@ def test_add_class_to_dict():
     assert list(analyser.get_hooks().keys()) == ["kek", "waw"]
 
 
+def test_classes_view():
+    analyser = factory._HookAnalyser()
+    analyser._add_class_to_dict("kek", object)
+
+    view = analyser.get_classes_view()
+    assert view is analyser.get_classes_view()
+    with pytest.raises(TypeError):
+        view["waw"] = int
+
+    hooks = analyser.get_hooks()
+    hooks["waw"] = int
+    analyser._add_class_to_dict("lol", int)
+    assert dict(view) == {"kek": object, "lol": int}
+    assert hooks == {"kek": object, "waw": int}
+
+
 class TestHookAnalyser:
     """Tests for _HookAnalyser class."""
     def test_hook_class_checker(self, hook):
@@ -121,6 +140,17 @@ class TestFactory:
             assert hook.a == 0
             assert hook.b == 0
 
+        def test_hooks_batch_creation(self, hook_provider_factory):
+            hooks = hook_provider_factory.create_hooks([("hook", [0], None),
+                                                        ("Hook1", None, {"a": 1, "b": 2})])
+
+            assert [type(hook) for hook in hooks] == [Hook1, Hook1]
+            assert [(hook.a, hook.b) for hook in hooks] == [(0, 3), (1, 2)]
+
+        def test_nonexistent_hooks_batch_creation(self, hook_provider_factory):
+            with pytest.raises(KeyError):
+                hook_provider_factory.create_hooks([("hook", [0], None), ("azaza", [], {})])
+
     class TestProviderCreation:
         """Tests for provider creation."""
         def test_nonexistent_provider_creation(self, hook_provider_factory):
@@ -150,3 +180,173 @@ class TestFactory:
             assert isinstance(hook, Provider1)
             assert hook.a == 0
             assert hook.b == 0
+
+        def test_providers_batch_creation(self, hook_provider_factory):
+            providers = hook_provider_factory.create_providers([("Provider1", [0], None),
+                                                                ("Provider1", [1], {"b": 0})])
+
+            assert [type(provider) for provider in providers] == [Provider1, Provider1]
+            assert [(provider.a, provider.b) for provider in providers] == [(0, 3), (1, 0)]
+
+
+@pytest.fixture
+def static_plugins(tmp_path, monkeypatch):
+    """Create "static_plugins" directory with hooks in a temporary current directory."""
+    plugins = tmp_path / "static_plugins"
+    plugins.mkdir()
+    (plugins / "base.py").write_text("from phf import abstracthook\n"
+                                     "\n"
+                                     "\n"
+                                     "class Base(abstracthook.AbstractHook):\n"
+                                     "    pass\n")
+    (plugins / "heavy.py").write_text("from .base import Base\n"
+                                      "\n"
+                                      "\n"
+                                      "class Heavy(Base):\n"
+                                      "    _alias = ['heavy', 'light']\n"
+                                      "\n"
+                                      "\n"
+                                      "class NotHook:\n"
+                                      "    _alias = ['not_hook']\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield plugins
+    for module_name in list(sys.modules):
+        if module_name.startswith("static_plugins"):
+            del sys.modules[module_name]
+
+
+class TestStaticDiscovery:
+    """Tests for finding classes without importing modules."""
+    @pytest.mark.parametrize("paths", [["factory_obj"],
+                                       ["factory_obj", "factory_obj/hooks_package/hook3.py"]])
+    def test_same_as_import(self, paths):
+        imported = factory.HookAndProviderFactory(paths, paths)
+        static = factory.HookAndProviderFactory(paths, paths, discovery="static")
+
+        assert dict(static.get_hooks_view()) == dict(imported.get_hooks_view())
+        assert dict(static.get_providers_view()) == dict(imported.get_providers_view())
+
+    def test_same_alias(self):
+        analyser = factory._HookAnalyser(discovery.DiscoveryManifest())
+        analyser.analyse("factory_obj")
+
+        with pytest.raises(factory.AliasDoublingError):
+            analyser.analyse("factory_obj/hooks_package/hook2.py")
+
+    def test_lazy_import(self, static_plugins):
+        fact = factory.HookAndProviderFactory(hook_paths=["static_plugins"], discovery="static")
+        hooks = fact.get_hooks_view()
+
+        assert Counter(hooks.keys()) == Counter(["Base", "Heavy", "heavy", "light"])
+        assert isinstance(hooks["heavy"], discovery.ClassReference)
+        assert "static_plugins.heavy" not in sys.modules
+
+        hook = fact.create_hook("light")
+        assert "static_plugins.heavy" in sys.modules
+        assert hook.__class__ is sys.modules["static_plugins.heavy"].Heavy
+        assert hooks["heavy"] is hooks["Heavy"] is hook.__class__
+
+    def test_not_literal_aliases(self, static_plugins):
+        (static_plugins / "dynamic.py").write_text("from .base import Base\n"
+                                                   "\n"
+                                                   "\n"
+                                                   "class Dynamic(Base):\n"
+                                                   "    _alias = ['dyn' + 'amic']\n")
+        fact = factory.HookAndProviderFactory(hook_paths=["static_plugins/dynamic.py"],
+                                              discovery="static")
+
+        assert "static_plugins.dynamic" in sys.modules
+        assert fact.get_hooks_view()["dynamic"] is sys.modules["static_plugins.dynamic"].Dynamic
+
+    def test_manifest(self, static_plugins, monkeypatch):
+        fact = factory.HookAndProviderFactory(hook_paths=["static_plugins"],
+                                              discovery="static",
+                                              manifest_path="manifest.json")
+        expected = dict(fact.get_hooks_view())
+        assert os.path.isfile("manifest.json")
+
+        parsed = []
+        parse_facts = discovery.parse_facts
+
+        def _counting_parse_facts(source, file_path):
+            parsed.append(os.path.basename(file_path))
+            return parse_facts(source, file_path)
+
+        monkeypatch.setattr(discovery, "parse_facts", _counting_parse_facts)
+        heavy = static_plugins / "heavy.py"
+        os.utime(heavy, (0, 0))
+        fact = factory.HookAndProviderFactory(hook_paths=["static_plugins"],
+                                              discovery="static",
+                                              manifest_path="manifest.json")
+        assert dict(fact.get_hooks_view()) == expected
+        assert parsed == []
+
+        heavy.write_text(heavy.read_text().replace("'light'", "'lighter'"))
+        fact = factory.HookAndProviderFactory(hook_paths=["static_plugins"],
+                                              discovery="static",
+                                              manifest_path="manifest.json")
+        assert "lighter" in fact.get_hooks_view()
+        assert parsed == ["heavy.py"]
+
+
+class TestParallelScan:
+    """Tests for reading sources with scan workers."""
+    def test_walk_order(self):
+        paths = ["factory_obj", "factory_obj/hooks_package/hook3.py"]
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            parallel = factory._walk(paths, executor.map)
+
+        assert parallel == factory._walk(paths, map)
+        assert os.path.join("factory_obj", "file1.py") in parallel
+        assert os.path.join("factory_obj", "hooks_package") in parallel
+        assert parallel[-1] == "factory_obj/hooks_package/hook3.py"
+
+    @pytest.mark.parametrize("discovery_mode", ["import", "static"])
+    def test_same_as_sequential(self, discovery_mode):
+        paths = ["factory_obj", "factory_obj/hooks_package/hook3.py"]
+        sequential = factory.HookAndProviderFactory(paths, paths, discovery=discovery_mode)
+        parallel = factory.HookAndProviderFactory(paths, paths, discovery=discovery_mode,
+                                                  scan_workers=4)
+
+        assert list(parallel.get_hooks_view()) == list(sequential.get_hooks_view())
+        assert list(parallel.get_providers_view()) == list(sequential.get_providers_view())
+
+    @pytest.mark.parametrize("discovery_mode", ["import", "static"])
+    def test_same_conflict(self, discovery_mode):
+        paths = ["factory_obj", "factory_obj/hooks_package/hook2.py"]
+        errors = []
+        for scan_workers in [0, 4]:
+            with pytest.raises(factory.AliasDoublingError) as error:
+                factory.HookAndProviderFactory(hook_paths=paths, discovery=discovery_mode,
+                                               scan_workers=scan_workers)
+            errors.append((str(error.value), error.value.first_class, error.value.second_class))
+
+        assert errors[0] == errors[1]
+
+    def test_import_error_raised_once(self, tmp_path, monkeypatch):
+        plugins = tmp_path / "broken_plugins"
+        plugins.mkdir()
+        (plugins / "__init__.py").write_text("")
+        (plugins / "broken.py").write_text("import builtins\n"
+                                           "builtins.broken_imports += 1\n"
+                                           "raise ValueError('broken')\n")
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        monkeypatch.setattr("builtins.broken_imports", 0, raising=False)
+
+        with pytest.raises(ValueError, match="broken"):
+            factory.HookAndProviderFactory(hook_paths=["broken_plugins/broken.py"],
+                                           scan_workers=2)
+        import builtins
+        assert builtins.broken_imports == 1
+
+    def test_timings(self):
+        fact = factory.HookAndProviderFactory(["factory_obj"], ["factory_obj"], scan_workers=2)
+        timings = fact.get_scan_timings()
+
+        assert set(timings) == {"hooks", "providers"}
+        for phases in timings.values():
+            assert set(phases) == {"walk", "load", "register", "total"}
+            assert phases["total"] == pytest.approx(phases["walk"] + phases["load"]
+                                                    + phases["register"])
@@ -57,3 +57,20 @@ class TestHooks:
         results.append(await out_queue.get())
         results.append(await out_queue.get())
         assert results == [0, 1, 2]
+
+    @pytest.mark.asyncio
+    async def test_hook_action_exception_is_result(self, hook_factory, monkeypatch):
+        hook = await hook_factory.get_started_hook()
+
+        async def _hook_action(data):
+            if data is None:
+                raise ValueError("no data")
+            return data
+
+        monkeypatch.setattr(hook, "hook_action", _hook_action)
+        hook.get_straight_queue().put_nowait(None)
+        hook.get_straight_queue().put_nowait(1)
+        result = await hook.get_callback_queue().get()
+        assert isinstance(result, ValueError) and str(result) == "no data"
+        assert await hook.get_callback_queue().get() == 1
+        assert hook._is_running()
@@ -0,0 +1,177 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+from phf.phfsystem import PHFSystem
+
+PLUGIN_SOURCE = """from phf.abstracthook import AbstractHook
+from phf.provider import ComplexContentProvider
+
+VERSION = {version}
+
+
+class VersionHook(AbstractHook):
+    _alias = ["version_hook"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    async def hook_action(self, data):
+        self.calls += 1
+        return VERSION, data, self.calls
+
+
+class VersionProvider(ComplexContentProvider):
+    async def postprocess_result(self, results):
+        return VERSION, results
+"""
+
+
+@pytest.fixture
+def write_plugin(tmp_path, monkeypatch):
+    """Create "reload_plugins" directory in a temporary current directory.
+
+    Yields function, that writes plugin module of given version."""
+    plugins = tmp_path / "reload_plugins"
+    plugins.mkdir()
+    plugin = plugins / "plugin.py"
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    def _write_plugin(version):
+        mtime = plugin.stat().st_mtime if plugin.exists() else 0
+        plugin.write_text(PLUGIN_SOURCE.format(version=version))
+        os.utime(plugin, (mtime + 10, mtime + 10))
+
+    yield _write_plugin
+    for module_name in list(sys.modules):
+        if module_name.startswith("reload_plugins"):
+            del sys.modules[module_name]
+
+
+@pytest.fixture
+async def reloading_phfsys(write_plugin):
+    """Running PHFSystem with hot reload and VersionProvider with VersionHook."""
+    write_plugin(1)
+    phfsys = PHFSystem()
+    phfsys.import_hook_sources("reload_plugins")
+    phfsys.import_provider_sources("reload_plugins")
+    content_provider = phfsys.create_provider("VersionProvider", [], {})
+    content_provider.add_hook(phfsys.create_hook("version_hook", [], {}))
+    phfsys.add_provider(content_provider)
+    phfsys.enable_hot_reload(0.01)
+    await phfsys.start_async()
+    yield phfsys, content_provider
+    await phfsys.stop_async()
+
+
+@pytest.mark.asyncio
+async def test_reload(reloading_phfsys, write_plugin):
+    phfsys, content_provider = reloading_phfsys
+    message_system = content_provider.get_message_system()
+    hook = content_provider.get_hooks()[0]
+    assert await message_system.send_wait_answer_async("a") == (1, [(1, "a", 1)])
+
+    write_plugin(2)
+    await asyncio.sleep(0.2)
+
+    assert await message_system.send_wait_answer_async("b") == (2, [(2, "b", 2)])
+    new_hook = content_provider.get_hooks()[0]
+    assert new_hook is not hook
+    assert phfsys.get_hook(hook.get_id()) is new_hook
+    assert phfsys.get_providers() == [content_provider]
+    assert isinstance(phfsys.create_hook("version_hook", [], {}), type(new_hook))
+
+
+@pytest.mark.asyncio
+async def test_broken_module_keeps_old_code(reloading_phfsys, write_plugin):
+    phfsys, content_provider = reloading_phfsys
+    message_system = content_provider.get_message_system()
+
+    write_plugin("(")
+    await asyncio.sleep(0.2)
+
+    assert await message_system.send_wait_answer_async("a") == (1, [(1, "a", 1)])
+    assert "version_hook" in phfsys._providers_and_hooks_factory.get_hooks_view()
+
+
+@pytest.mark.asyncio
+async def test_disable(reloading_phfsys, write_plugin):
+    phfsys, content_provider = reloading_phfsys
+    phfsys.disable_hot_reload()
+    await asyncio.sleep(0.01)
+
+    write_plugin(2)
+    await asyncio.sleep(0.1)
+
+    message_system = content_provider.get_message_system()
+    assert await message_system.send_wait_answer_async("a") == (1, [(1, "a", 1)])
+
+
+@pytest.mark.asyncio
+async def test_reload_in_shard(write_plugin, monkeypatch):
+    write_plugin(1)
+    phfsys = PHFSystem(shards_amount=1)
+    phfsys.import_hook_sources("reload_plugins")
+    phfsys.import_provider_sources("reload_plugins")
+    content_provider = phfsys.create_provider("VersionProvider", [], {})
+    hook = phfsys.create_hook("version_hook", [], {})
+    hook.set_name("version")
+    content_provider.add_hook(hook)
+    phfsys.add_provider(content_provider)
+    phfsys.enable_hot_reload(0.01)
+    await phfsys.start_async()
+
+    index_threads = []
+    index_hooks = phfsys._index_hooks
+
+    def _index_hooks(*args):
+        index_threads.append(threading.get_ident())
+        index_hooks(*args)
+
+    monkeypatch.setattr(phfsys, "_index_hooks", _index_hooks)
+    write_plugin(2)
+    await asyncio.sleep(0.2)
+
+    message_system = content_provider.get_message_system()
+    assert await message_system.send_wait_answer_async("b") == (2, [(2, "b", 1)])
+    assert index_threads == [threading.get_ident()]
+    new_hook = content_provider.get_hooks()[0]
+    assert phfsys.get_hook("version") is new_hook is phfsys.get_hook(hook.get_id())
+    await phfsys.stop_async()
+
+
+@pytest.mark.asyncio
+async def test_error_keeps_watching(reloading_phfsys, write_plugin, monkeypatch, caplog):
+    phfsys, content_provider = reloading_phfsys
+    replace_classes = phfsys.replace_classes
+
+    async def _failing_replace(new_classes):
+        monkeypatch.setattr(phfsys, "replace_classes", replace_classes)
+        raise TypeError("Layout differs")
+
+    monkeypatch.setattr(phfsys, "replace_classes", _failing_replace)
+    write_plugin(2)
+    await asyncio.sleep(0.2)
+    assert "Layout differs" in caplog.text
+
+    write_plugin(3)
+    await asyncio.sleep(0.2)
+    message_system = content_provider.get_message_system()
+    assert await message_system.send_wait_answer_async("a") == (3, [(3, "a", 1)])
+
+
+@pytest.mark.asyncio
+async def test_reload_waits_topology(reloading_phfsys, write_plugin):
+    phfsys, content_provider = reloading_phfsys
+    hook = content_provider.get_hooks()[0]
+    async with phfsys._topology_lock:
+        write_plugin(2)
+        await asyncio.sleep(0.2)
+        assert content_provider.get_hooks() == [hook]
+    await asyncio.sleep(0.1)
+    assert content_provider.get_hooks()[0] is not hook
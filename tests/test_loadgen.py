@@ -0,0 +1,88 @@
+import asyncio
+import random
+
+import pytest
+
+from phf.abstracthook import AbstractHook
+from phf.loadgen import LoadGeneratorProvider, LoadItem, make_size_sampler, percentile, \
+    run_soak
+from phf.phfsystem import PHFSystem
+
+
+class SizeHook(AbstractHook):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sizes = []
+
+    async def hook_action(self, data):
+        self.sizes.append(len(data.payload))
+        return data.sequence
+
+
+class SlowHook(AbstractHook):
+    async def hook_action(self, data):
+        await asyncio.sleep(0.02)
+        raise ValueError(data.sequence)
+
+
+@pytest.mark.asyncio
+async def test_load_generator():
+    phfsys = PHFSystem()
+    load_generator = LoadGeneratorProvider(rate=200, payload_size=("choice", [10, 20]),
+                                           burst=5, duration=0.3, seed=1)
+    hook = SizeHook()
+    load_generator.add_hook(hook)
+    phfsys.add_provider(load_generator)
+    await phfsys.start_async()
+    await asyncio.wait_for(load_generator.wait_finished(), 2)
+
+    sent = load_generator.get_sent_amount()
+    assert 50 <= sent <= 70 and sent % 5 == 0
+    assert load_generator.get_completed_amount() == sent
+    assert len(hook.sizes) == sent and set(hook.sizes) == {10, 20}
+    latencies = load_generator.pop_latencies()
+    assert len(latencies) == sent and all(latency >= 0 for latency in latencies)
+    assert load_generator.pop_latencies() == []
+    await phfsys.stop_async(drain=False)
+
+
+@pytest.mark.asyncio
+async def test_soak_report():
+    report = await run_soak([("hook", [1], {})], hook_paths=["factory_obj"], duration=0.5,
+                            rate=100, payload_size=128, sample_interval=0.1)
+    summary = report.get_summary()
+    assert 40 <= summary["sent"] <= 60
+    assert summary["completed"] == summary["sent"] and summary["errors"] == 0
+    assert summary["latency_p50"] <= summary["latency_p99"] <= summary["latency_max"]
+    assert len(report.samples) >= 4
+    assert report.samples[-1].completed == summary["completed"]
+    assert all(sample.rss for sample in report.samples)
+    assert report.to_dict()["config"]["hooks"] == [["hook", [1], {}]]
+
+
+@pytest.mark.asyncio
+async def test_queue_growth_and_errors(monkeypatch):
+    phfsys = PHFSystem()
+    load_generator = LoadGeneratorProvider(rate=500, payload_size=0, duration=0.2)
+    hook = SlowHook()
+    load_generator.add_hook(hook)
+    phfsys.add_provider(load_generator)
+    await phfsys.start_async()
+    await asyncio.sleep(0.2)
+    assert hook.get_straight_queue().qsize() > 50
+    await phfsys.stop_async(drain=False)
+    assert load_generator.get_errors_amount() == load_generator.get_completed_amount() > 0
+
+
+def test_sizes():
+    rng = random.Random(0)
+    assert make_size_sampler(7, rng)() == 7
+    assert 1 <= make_size_sampler(("uniform", 1, 3), rng)() <= 3
+    sizes = [make_size_sampler(("lognormal", 1000, 0.5), rng)() for _ in range(1000)]
+    assert 800 < sorted(sizes)[500] < 1200
+    with pytest.raises(ValueError):
+        make_size_sampler(("normal", 1), rng)
+    with pytest.raises(ValueError):
+        LoadGeneratorProvider(rate=0)
+    assert percentile([1, 2, 3, 4], 0.5) == 2 and percentile([], 0.5) is None
+    assert LoadItem(0, 0, b"").payload == b""
@@ -0,0 +1,152 @@
+import asyncio
+import re
+
+import pytest
+
+from phf import commandinput
+from phf.abstracthook import AbstractHook
+from phf.metrics import Histogram
+from phf.phfsystem import PHFSystem
+from phf.provider import ComplexContentProvider, PeriodicContentProvider
+
+
+class SleepHook(AbstractHook):
+    def __init__(self, delay, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+
+    async def hook_action(self, data):
+        await asyncio.sleep(self.delay)
+        return data
+
+
+class FailingHook(AbstractHook):
+    async def hook_action(self, data):
+        raise ValueError(data)
+
+
+class CountingProvider(PeriodicContentProvider):
+    def __init__(self, *args, **kwargs):
+        super().__init__(period=0.01, *args, **kwargs)
+
+    async def get_content(self):
+        return 1
+
+
+def _value(text, name, **labels):
+    """Return value of the sample with all given labels."""
+    for line in text.splitlines():
+        match = re.fullmatch(rf"{name}(?:{{(.*)}})? (\S+)", line)
+        if match is None:
+            continue
+        sample_labels = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(1) or ""))
+        if all(sample_labels.get(key) == str(value) for key, value in labels.items()):
+            return float(match.group(2))
+    raise KeyError(f"{name} {labels}")
+
+
+async def _scrape(port, path="/metrics"):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    response = await reader.read()
+    writer.close()
+    head, body = response.decode().split("\r\n\r\n", 1)
+    return head.split("\r\n"), body
+
+
+@pytest.mark.asyncio
+async def test_endpoint():
+    phfsys = PHFSystem()
+    content_provider = CountingProvider()
+    slow_hook, failing_hook = SleepHook(0.002), FailingHook()
+    content_provider.add_hooks([slow_hook, failing_hook])
+    failing_hook.set_name('bad "one"')
+    provider_id = phfsys.add_provider(content_provider, name="counter")
+    phfsys.enable_metrics(port=0)
+    await phfsys.start_async()
+    await asyncio.sleep(0.2)
+
+    head, body = await _scrape(phfsys.get_metrics_port())
+    assert head[0] == "HTTP/1.1 200 OK"
+    assert "Content-Type: text/plain; version=0.0.4; charset=utf-8" in head
+    assert "# TYPE phf_hook_action_seconds histogram" in body
+    assert _value(body, "phf_providers") == 1
+    assert _value(body, "phf_hooks") == 2
+
+    ticks = _value(body, "phf_provider_ticks_total", provider=provider_id,
+                   provider_name="counter", **{"class": "CountingProvider"})
+    assert ticks >= 5
+    assert 0 <= _value(body, "phf_provider_tick_lag_seconds", provider=provider_id) < 0.1
+
+    slow_items = _value(body, "phf_hook_items_total", hook=slow_hook.get_id())
+    assert slow_items >= ticks - 1
+    assert _value(body, "phf_hook_errors_total", hook=slow_hook.get_id()) == 0
+    assert _value(body, "phf_hook_errors_total", hook_name='bad \\"one\\"') >= ticks - 1
+    assert _value(body, "phf_hook_action_seconds_count", hook=slow_hook.get_id()) == slow_items
+    assert _value(body, "phf_hook_action_seconds_bucket", hook=slow_hook.get_id(),
+                  le="0.001") == 0
+    assert _value(body, "phf_hook_action_seconds_bucket", hook=slow_hook.get_id(),
+                  le="+Inf") == slow_items
+    assert _value(body, "phf_hook_queue_depth", hook=slow_hook.get_id()) <= 1
+
+    head, _ = await _scrape(phfsys.get_metrics_port(), "/other")
+    assert head[0] == "HTTP/1.1 404 Not Found"
+    port = phfsys.get_metrics_port()
+    await phfsys.stop_async()
+    with pytest.raises(OSError):
+        await asyncio.open_connection("127.0.0.1", port)
+
+
+@pytest.mark.asyncio
+async def test_taken_port_is_logged(caplog):
+    taken = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+    port = taken.sockets[0].getsockname()[1]
+    phfsys = PHFSystem()
+    await phfsys.start_async()
+    phfsys.enable_metrics(port=port)
+    await asyncio.sleep(0.05)
+    assert f"Metrics server can't listen on 127.0.0.1:{port}" in caplog.text
+    await phfsys.stop_async()
+    taken.close()
+    await taken.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_commands_and_message_system(started_phfsys):
+    phfsys, controller = started_phfsys
+    phfsys.enable_metrics(port=None)
+    assert phfsys.get_metrics_port() is None
+
+    content_provider = ComplexContentProvider()
+    hook = SleepHook(0)
+    content_provider.add_hook(hook)
+    message_system = content_provider.get_message_system()
+    message_ids = [message_system.send_to_provider(i) for i in range(3)]
+    assert message_system.get_pending_amount() == 3
+    provider_id = phfsys.add_provider(content_provider)
+    assert hook._stats is not None
+
+    for _ in range(2):
+        controller.send_command_to_phfsys(commandinput.ListProvidersCommand())
+    await message_system.retrieve_result_async(message_ids[0])
+    await asyncio.sleep(0.01)
+
+    text = phfsys.get_metrics()
+    assert _value(text, "phf_commands_total", command="ListProvidersCommand") == 2
+    assert _value(text, "phf_command_queue_depth") == 0
+    assert _value(text, "phf_message_system_pending", provider=provider_id) == 0
+    assert _value(text, "phf_message_system_stored_results", provider=provider_id) == 3
+    assert _value(text, "phf_provider_ticks_total", provider=provider_id) == 3
+    assert _value(text, "phf_hook_items_total", hook=hook.get_id()) == 3
+
+    phfsys.disable_metrics()
+    assert hook._stats is None and content_provider._stats is None
+    assert "phf_hook_items_total{" not in phfsys.get_metrics()
+
+
+def test_histogram():
+    histogram = Histogram([1, 2])
+    for value in [0.5, 1, 1.5, 3]:
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4 and histogram.sum == 6
@@ -1,10 +1,13 @@
 import asyncio
 import os
+import threading
 
 import pytest
 
+import conftest
 from factory_obj.file1 import Provider1, Hook1
-from phf import commandinput
+from phf import commandinput, phfsystem, sharding
+from phf import provider as providers
 from phf.phfsystem import PHFSystem
 
 
@@ -97,3 +100,459 @@ class TestPHFSystem:
         provider = controller.logs[0]
         assert provider.a == 2
         assert provider._asyncio_running
+
+
+class TestIndexes:
+    """Tests for ids and names of providers and hooks."""
+
+    def test_provider_ids_and_names(self, periodic_provider_factory):
+        phfsys = PHFSystem()
+        provider1 = periodic_provider_factory.get_provider()
+        provider2 = periodic_provider_factory.get_provider()
+        provider3 = periodic_provider_factory.get_provider()
+
+        assert phfsys.add_provider(provider1) == 0
+        assert phfsys.add_provider(provider2, name="second") == 1
+        assert phfsys.get_provider(1) is provider2
+        assert phfsys.get_provider("second") is provider2
+        assert provider2.get_name() == "second"
+
+        assert phfsys.remove_provider("second") is provider2
+        assert phfsys.add_provider(provider3) == 2
+        assert phfsys.get_providers() == [provider1, provider3]
+        assert phfsys.get_provider(2) is provider3
+        for key in [1, "second"]:
+            with pytest.raises(KeyError):
+                phfsys.get_provider(key)
+
+    def test_name_doubling(self, periodic_provider_factory):
+        phfsys = PHFSystem()
+        phfsys.add_provider(periodic_provider_factory.get_provider(), name="a")
+        with pytest.raises(phfsystem.NameDoublingError):
+            phfsys.add_provider(periodic_provider_factory.get_provider(), name="a")
+
+        provider = periodic_provider_factory.get_provider()
+        phfsys.add_provider(provider)
+        hook = Hook1(0)
+        hook.set_name("hook")
+        provider.add_hook(hook)
+        other_hook = Hook1(0)
+        other_hook.set_name("hook")
+        with pytest.raises(phfsystem.NameDoublingError):
+            provider.add_hook(other_hook)
+        assert provider.get_hooks() == [hook]
+        assert len(phfsys.get_providers()) == 2
+
+    def test_hook_index(self, periodic_provider_factory):
+        phfsys = PHFSystem()
+        provider = periodic_provider_factory.get_provider()
+        hook1 = Hook1(0)
+        hook1.set_name("early")
+        provider.add_hook(hook1)
+        phfsys.add_provider(provider)
+        hook2 = Hook1(0)
+        provider.add_hook(hook2)
+
+        assert hook1.get_id() != hook2.get_id()
+        assert phfsys.get_hook("early") is hook1
+        assert phfsys.get_hook(hook2.get_id()) is hook2
+        assert phfsys.get_hook_provider(hook2.get_id()) is provider
+
+        phfsys.remove_provider(provider.get_id())
+        with pytest.raises(KeyError):
+            phfsys.get_hook("early")
+        with pytest.raises(KeyError):
+            phfsys.get_hook(hook2.get_id())
+
+    @pytest.mark.asyncio
+    async def test_remove_running(self, periodic_provider_factory, hook_factory):
+        phfsys = PHFSystem()
+        provider = periodic_provider_factory.get_provider()
+        hook1 = await hook_factory.get_hook()
+        hook2 = await hook_factory.get_hook()
+        provider.add_hooks([hook1, hook2])
+        phfsys.add_provider(provider, name="provider")
+
+        await phfsys.start_async()
+        await asyncio.sleep(0.01)
+        phfsys.remove_hook(hook1.get_id())
+        await asyncio.sleep(0.01)
+        assert provider.get_hooks() == [hook2]
+        assert not hook1._running
+        assert hook2._running
+        with pytest.raises(KeyError):
+            phfsys.get_hook(hook1.get_id())
+
+        phfsys.remove_provider("provider")
+        await asyncio.sleep(0.01)
+        assert provider._asyncio_task.done()
+        assert not hook2._running
+        assert phfsys.get_providers() == []
+        await phfsys.stop_async()
+
+
+class TestEventLoops:
+    """Tests for choosing PHFSystem's event loop."""
+
+    def test_loop_factory(self):
+        loops = []
+
+        def _loop_factory():
+            loops.append(asyncio.new_event_loop())
+            return loops[-1]
+
+        phfsys = PHFSystem(loop_factory=_loop_factory)
+        threading.Thread(target=phfsys.start, daemon=True).start()
+        for _ in range(100):
+            if phfsys._asyncio_loop is not None:
+                break
+            threading.Event().wait(0.01)
+
+        assert phfsys._asyncio_loop is loops[0]
+
+    def test_loop_policy(self):
+        policy = asyncio.DefaultEventLoopPolicy()
+        phfsys = PHFSystem(loop_factory=policy)
+        assert phfsys._loop_factory == policy.new_event_loop
+
+    def test_no_uvloop_fallback(self, monkeypatch):
+        monkeypatch.setattr(phfsystem, "uvloop", None)
+        assert PHFSystem()._loop_factory is asyncio.new_event_loop
+
+    def test_uvloop_disabled(self):
+        assert PHFSystem(use_uvloop=False)._loop_factory is asyncio.new_event_loop
+
+    @pytest.mark.skipif(phfsystem.uvloop is None, reason="uvloop is not installed")
+    def test_uvloop_by_default(self):
+        assert PHFSystem()._loop_factory is phfsystem.uvloop.new_event_loop
+
+
+class TestSharding:
+    """Tests for running providers in several event loop threads."""
+
+    @pytest.mark.asyncio
+    async def test_round_robin(self, started_sharded_phfsys, periodic_provider_factory):
+        phfsys, _ = started_sharded_phfsys
+        shard_loops = [shard.get_loop() for shard in phfsys.get_shards()]
+
+        providers = [periodic_provider_factory.get_provider() for _ in range(3)]
+        for provider in providers:
+            phfsys.add_provider(provider)
+        await asyncio.sleep(0.05)
+
+        assert [phfsys.get_provider_shard(provider) for provider in providers] == [0, 1, 0]
+        for provider in providers:
+            assert provider._asyncio_running
+            assert provider._asyncio_loop is shard_loops[phfsys.get_provider_shard(provider)]
+            assert provider._asyncio_loop is not phfsys._asyncio_loop
+
+    @pytest.mark.asyncio
+    async def test_explicit_shard(self, started_sharded_phfsys, periodic_provider_factory):
+        phfsys, _ = started_sharded_phfsys
+
+        provider = periodic_provider_factory.get_provider()
+        phfsys.add_provider(provider, shard=1)
+        await asyncio.sleep(0.05)
+
+        assert phfsys.get_provider_shard(provider) == 1
+        assert provider._asyncio_loop is phfsys.get_shards()[1].get_loop()
+
+    def test_wrong_shard(self, periodic_provider_factory):
+        phfsys = PHFSystem(shards_amount=2)
+        provider = periodic_provider_factory.get_provider()
+        for shard in [2, -1]:
+            with pytest.raises(ValueError):
+                phfsys.add_provider(provider, shard=shard)
+        assert phfsys.get_providers() == [] and provider.get_id() is None
+        with pytest.raises(ValueError):
+            PHFSystem().add_provider(provider, shard=0)
+
+    @pytest.mark.asyncio
+    async def test_new_hook_command(self, started_sharded_phfsys):
+        phfsys, controller = started_sharded_phfsys
+
+        controller.send_command_to_phfsys(commandinput.NewProviderCommand("Provider1", [2]))
+        controller.send_command_to_phfsys(commandinput.NewProviderCommand("Provider1", [2]))
+        await asyncio.sleep(0.05)
+        controller.send_command_to_phfsys(commandinput.NewHookCommand("hook", 1, [0]))
+        await asyncio.sleep(0.05)
+
+        provider = phfsys.get_providers()[1]
+        hook = controller.logs[-1]
+        assert provider.get_hooks() == [hook]
+        assert hook._running
+        assert provider._asyncio_hook_tasks[0].get_loop() is phfsys.get_shards()[1].get_loop()
+
+
+    def test_loop_factory_error(self):
+        def _loop_factory():
+            raise OSError("No loop")
+
+        shard = sharding.Shard(0, _loop_factory)
+        with pytest.raises(OSError):
+            shard.start()
+        assert shard._thread is None
+
+    @pytest.mark.asyncio
+    async def test_restart(self, periodic_provider_factory):
+        phfsys = PHFSystem(shards_amount=2, placement=sharding.LeastLoadedPlacement())
+        providers_list = [periodic_provider_factory.get_provider() for _ in range(2)]
+        for provider in providers_list:
+            phfsys.add_provider(provider)
+
+        for _ in range(2):
+            await phfsys.start_async()
+            await asyncio.sleep(0.05)
+            assert [shard.get_load() for shard in phfsys.get_shards()] == [1, 1]
+            assert all(provider._asyncio_running for provider in providers_list)
+            await phfsys.stop_async()
+
+
+class TestPlacementPolicies:
+    """Tests for choosing shards for providers."""
+
+    @staticmethod
+    def _get_shards(loads):
+        shards = []
+        for number, load in enumerate(loads):
+            shard = sharding.Shard(number)
+            for _ in range(load):
+                shard._providers.append(Provider1(0))
+            shards.append(shard)
+        return shards
+
+    def test_round_robin(self):
+        shards = self._get_shards([0, 0, 0])
+        policy = sharding.RoundRobinPlacement()
+        chosen = [policy.choose_shard(Provider1(0), shards).number for _ in range(4)]
+        assert chosen == [0, 1, 2, 0]
+
+    def test_least_loaded(self):
+        shards = self._get_shards([2, 0, 1])
+        shards[1]._providers.append(Provider1(0))
+        shards[1]._providers[0].add_hook(Hook1(0))
+        shards[1]._providers[0].add_hook(Hook1(0))
+        policy = sharding.LeastLoadedPlacement()
+        assert policy.choose_shard(Provider1(0), shards) is shards[2]
+
+    def test_explicit(self):
+        shards = self._get_shards([0, 0])
+        policy = sharding.ExplicitPlacement({"Provider1": 1})
+        assert policy.choose_shard(Provider1(0), shards) is shards[1]
+        assert policy.choose_shard(conftest.NothingPeriodicProvider(), shards) is shards[0]
+        assert policy.choose_shard(conftest.NothingPeriodicProvider(), shards) is shards[1]
+
+
+class TestAsyncStart:
+    """Tests for running PHFSystem in an already running event loop."""
+
+    @pytest.mark.asyncio
+    async def test_start_stop(self, periodic_provider_factory):
+        phfsys = PHFSystem()
+        provider = periodic_provider_factory.get_provider()
+        phfsys.add_provider(provider)
+
+        await phfsys.start_async()
+        await asyncio.sleep(0.01)
+        assert phfsys._asyncio_loop is asyncio.get_running_loop()
+        assert provider._asyncio_running
+        with pytest.raises(RuntimeError):
+            await phfsys.start_async()
+
+        await phfsys.stop_async()
+        assert provider._asyncio_task.done()
+        assert phfsys._main_task.done()
+        assert not phfsys._running_state
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("drain, expected", [(True, [1, 2, 3]), (False, [1])])
+    async def test_stop_drain(self, hook_factory, monkeypatch, drain, expected):
+        phfsys = PHFSystem()
+        provider = providers.ComplexContentProvider()
+        hook = await hook_factory.get_hook()
+
+        async def _slow_hook_action(data):
+            await asyncio.sleep(0.05)
+            hook.logs.append(data)
+            return data
+
+        monkeypatch.setattr(hook, "hook_action", _slow_hook_action)
+        provider.add_hook(hook)
+        phfsys.add_provider(provider)
+
+        await phfsys.start_async()
+        await asyncio.sleep(0.01)
+        for i in range(3):
+            await provider._notify_all_hooks(i + 1)
+        await asyncio.sleep(0.01)
+
+        await phfsys.stop_async(drain=drain)
+        assert hook.logs == expected
+        assert not hook._running
+
+    @pytest.mark.asyncio
+    async def test_command_and_message_system(self, hook_factory):
+        phfsys = PHFSystem()
+        phfsys.import_provider_sources("factory_obj")
+        provider = providers.ComplexContentProvider()
+        provider.add_hook(await hook_factory.get_hook())
+        phfsys.add_provider(provider)
+        controller = conftest.FakeCommandTranslator()
+
+        await phfsys.start_async()
+        controller.initialize(phfsys._asyncio_loop, phfsys._command_queue)
+        controller.send_command_to_phfsys(commandinput.ListProvidersCommand())
+
+        message_system = provider.get_message_system()
+        assert await message_system.send_wait_answer_async("hello") == ["hello"]
+        msg_id = message_system.send_to_provider("world")
+        assert await message_system.retrieve_result_async(msg_id) == ["world"]
+
+        await phfsys.stop_async()
+        assert controller.logs == [[provider]]
+
+    @pytest.mark.asyncio
+    async def test_stop_sharded(self, periodic_provider_factory):
+        phfsys = PHFSystem(shards_amount=2)
+        providers_list = [periodic_provider_factory.get_provider() for _ in range(2)]
+        for provider in providers_list:
+            phfsys.add_provider(provider)
+
+        await phfsys.start_async()
+        await asyncio.sleep(0.05)
+        await phfsys.stop_async()
+
+        for provider in providers_list:
+            assert provider._asyncio_task.done()
+        for shard in phfsys.get_shards():
+            assert shard._thread is None and shard.get_providers() == []
+            assert shard.get_loop().is_closed()
+
+    def test_stop_from_other_thread(self):
+        phfsys = PHFSystem()
+        thread = threading.Thread(target=phfsys.start)
+        thread.start()
+        for _ in range(100):
+            if phfsys._main_task is not None:
+                break
+            threading.Event().wait(0.01)
+
+        phfsys.stop()
+        thread.join(timeout=1)
+        assert not thread.is_alive()
+
+    def test_executor_finished_on_stop(self):
+        phfsys = PHFSystem()
+        thread = threading.Thread(target=phfsys.start)
+        thread.start()
+        for _ in range(100):
+            if phfsys._main_task is not None:
+                break
+            threading.Event().wait(0.01)
+
+        finished = threading.Event()
+
+        def _slow_job():
+            threading.Event().wait(0.2)
+            finished.set()
+
+        loop = phfsys._asyncio_loop
+        loop.call_soon_threadsafe(loop.run_in_executor, None, _slow_job)
+        phfsys.stop()
+        thread.join(timeout=5)
+        assert finished.is_set()
+
+
+class QueueCommandInput(commandinput.AbstractCommandInput):
+    """Command input, that takes ready commands from a queue and logs results."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commands = asyncio.Queue()
+        self.logs = []
+
+    async def retrieve_command_from_source(self):
+        return await self.commands.get()
+
+    def form_command(self, data):
+        return data
+
+    async def output_command_result(self, command_result):
+        self.logs.append(command_result)
+
+
+class SleepCommand(commandinput.Command):
+    """Command that sleeps and returns it's name, logs the time it was running."""
+
+    def __init__(self, name, delay, log, source=None):
+        super().__init__(source)
+        self._name = name
+        self._delay = delay
+        self._log = log
+
+    async def _apply(self, phfsys):
+        self._log.append(("start", self._name))
+        await asyncio.sleep(self._delay)
+        self._log.append(("end", self._name))
+        return self._name
+
+
+class SleepTopologyCommand(SleepCommand):
+    _changes_topology = True
+
+
+class TestCommandExecution:
+    """Tests for command routing and concurrent command execution."""
+
+    @pytest.mark.asyncio
+    async def test_results_per_input_source(self):
+        phfsys = PHFSystem()
+        inputs = [QueueCommandInput(), QueueCommandInput()]
+        for input_source in inputs:
+            phfsys.add_input_source(input_source)
+        log = []
+
+        await phfsys.start_async()
+        inputs[0].commands.put_nowait(SleepCommand("slow", 0.2, log))
+        await asyncio.sleep(0.01)
+        inputs[1].commands.put_nowait(SleepCommand("fast", 0, log))
+        await asyncio.sleep(0.05)
+
+        assert inputs[0].logs == []
+        assert inputs[1].logs == ["fast"]
+        await asyncio.sleep(0.2)
+        assert inputs[0].logs == ["slow"]
+        await phfsys.stop_async()
+
+    @pytest.mark.asyncio
+    async def test_topology_commands_serialized(self):
+        phfsys = PHFSystem()
+        inputs = [QueueCommandInput() for _ in range(3)]
+        for input_source in inputs:
+            phfsys.add_input_source(input_source)
+        log = []
+
+        await phfsys.start_async()
+        inputs[0].commands.put_nowait(SleepTopologyCommand("first", 0.05, log))
+        inputs[1].commands.put_nowait(SleepTopologyCommand("second", 0.05, log))
+        inputs[2].commands.put_nowait(SleepCommand("reader", 0.01, log))
+        await asyncio.sleep(0.2)
+
+        assert log == [("start", "first"), ("start", "reader"), ("end", "reader"),
+                       ("end", "first"), ("start", "second"), ("end", "second")]
+        await phfsys.stop_async()
+
+    @pytest.mark.asyncio
+    async def test_command_exception(self):
+        phfsys = PHFSystem()
+        input_source = QueueCommandInput()
+        phfsys.add_input_source(input_source)
+
+        await phfsys.start_async()
+        input_source.commands.put_nowait(commandinput.ListHooksCommand(5))
+        input_source.commands.put_nowait(commandinput.ListProvidersCommand())
+        await asyncio.sleep(0.05)
+
+        assert isinstance(input_source.logs[0], KeyError)
+        assert input_source.logs[1] == []
+        await phfsys.stop_async()
@@ -1,8 +1,13 @@
 import asyncio
+import gc
+import warnings
 
 import pytest
 
 import conftest
+from phf import provider as providers
+from phf.abstracthook import AbstractHook
+from phf.phfsystem import PHFSystem
 from phf.provider import BlockingContentProvider
 
 
@@ -77,6 +82,39 @@ async def test_stop_blocking_provider(hook_factory):
     provider._thread.join(timeout=5)
 
 
+class SlowAnsweringHook(AbstractHook):
+    async def hook_action(self, data):
+        await asyncio.sleep(0.3)
+
+
+@pytest.mark.asyncio
+@pytest.mark.timeout(10)
+async def test_blocking_provider_thread_stops_without_drain():
+    phfsys = PHFSystem()
+    provider = conftest.NothingBlockingProvider()
+    provider.add_hook(SlowAnsweringHook())
+    phfsys.add_provider(provider)
+    await phfsys.start_async()
+    await asyncio.sleep(0.05)
+    assert provider._thread_pending is not None
+
+    await phfsys.stop_async(drain=False)
+    assert not provider._thread.is_alive()
+    assert provider._thread_loop.is_closed()
+
+
+def test_blocking_provider_closed_loop():
+    provider = conftest.NothingBlockingProvider()
+    provider._asyncio_loop = asyncio.new_event_loop()
+    provider._asyncio_loop.close()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        with pytest.raises(RuntimeError):
+            provider._wait_in_provider_loop("content", 0)
+        gc.collect()
+    assert not [warning for warning in caught if "never awaited" in str(warning.message)]
+
+
 amount_of_hooks = [0, 1, 2]
 
 
@@ -155,6 +193,131 @@ class TestConsistentProviders:
         assert any_nonabstract_consistent_provider.logs == expected_res
 
 
+class TestGatherStrategies:
+    """Tests for gathering only part of hook results."""
+
+    @staticmethod
+    async def _get_hooks(hook_factory, monkeypatch, delays):
+        """Create hooks, each answers data + its number after its delay.
+
+        Hooks with None delay raise an exception."""
+        hooks = []
+        for i, delay in enumerate(delays):
+            hook = await hook_factory.get_hook()
+
+            async def _hook_action(data, i=i, delay=delay):
+                if delay is None:
+                    raise ValueError(data)
+                await asyncio.sleep(delay)
+                return data + i
+
+            monkeypatch.setattr(hook, "hook_action", _hook_action)
+            hooks.append(hook)
+        return hooks
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("strategy, expected", [
+        (providers.GatherAll(), [10, 11, 12]),
+        (providers.GatherFirstN(1), [providers.NO_RESULT, 11, providers.NO_RESULT]),
+        (providers.GatherFirstN(2), [10, 11, providers.NO_RESULT]),
+        (providers.GatherFirstN(5), [10, 11, 12]),
+        (providers.GatherQuorum(), [10, 11, providers.NO_RESULT]),
+    ])
+    async def test_strategies(self, hook_factory, monkeypatch, strategy, expected):
+        provider = conftest.NothingPeriodicProvider(period=0)
+        provider.set_gather_strategy(strategy)
+        for hook in await self._get_hooks(hook_factory, monkeypatch, [0.05, 0, 0.5]):
+            provider.add_hook(hook)
+
+        async with provider:
+            await provider._notify_all_hooks(10)
+            assert await provider._run_result_callback() == expected
+
+    @pytest.mark.asyncio
+    async def test_first_successful(self, hook_factory, monkeypatch):
+        provider = conftest.NothingPeriodicProvider(period=0)
+        provider.set_gather_strategy(providers.GatherFirstSuccessful())
+        for hook in await self._get_hooks(hook_factory, monkeypatch, [None, 0.05, 0.5]):
+            provider.add_hook(hook)
+
+        async with provider:
+            await provider._notify_all_hooks(10)
+            results = await provider._run_result_callback()
+        assert isinstance(results[0], ValueError)
+        assert results[1:] == [11, providers.NO_RESULT]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("strategy", [providers.GatherAll(), providers.GatherFirstN(2)])
+    async def test_exception_is_result(self, hook_factory, monkeypatch, strategy):
+        provider = conftest.NothingPeriodicProvider(period=0)
+        provider.set_gather_strategy(strategy)
+        hooks = await self._get_hooks(hook_factory, monkeypatch, [None, 0])
+        provider.add_hooks(hooks)
+
+        async with provider:
+            for data in [10, 20]:
+                await provider._notify_all_hooks(data)
+                results = await provider._run_result_callback()
+                assert isinstance(results[0], ValueError) and results[0].args == (data,)
+                assert results[1] == data + 1
+            assert all(hook._is_running() for hook in hooks)
+
+    @pytest.mark.asyncio
+    async def test_late_results_thrown_away(self, hook_factory, monkeypatch):
+        provider = conftest.NothingPeriodicProvider(period=0)
+        provider.set_gather_strategy(providers.GatherFirstN(1))
+        for hook in await self._get_hooks(hook_factory, monkeypatch, [0, 0.1]):
+            provider.add_hook(hook)
+
+        async with provider:
+            await provider._notify_all_hooks(10)
+            assert await provider._run_result_callback() == [10, providers.NO_RESULT]
+            await asyncio.sleep(0.2)
+
+            provider.set_gather_strategy(providers.GatherAll())
+            await provider._notify_all_hooks(20)
+            assert await provider._run_result_callback() == [20, 21]
+
+    def test_wrong_first_n(self):
+        with pytest.raises(ValueError):
+            providers.GatherFirstN(0)
+
+
+class OldVersionHook(AbstractHook):
+    async def hook_action(self, data):
+        await asyncio.sleep(0.02)
+        return "old", data
+
+
+class NewVersionHook(AbstractHook):
+    async def hook_action(self, data):
+        return "new", data
+
+
+@pytest.mark.asyncio
+async def test_replace_hook():
+    content_provider = providers.ComplexContentProvider()
+    hook = OldVersionHook()
+    hook.set_name("versioned")
+    content_provider.add_hook(hook)
+    content_provider.start()
+    await asyncio.sleep(0.01)
+
+    for i in range(4):
+        hook.get_straight_queue().put_nowait(i)
+    await asyncio.sleep(0.01)
+    new_hook = hook._copy_with_class(NewVersionHook)
+    await content_provider.replace_hook(hook, new_hook)
+
+    results = [await new_hook.get_callback_queue().get() for _ in range(4)]
+    assert results == [("old", 0), ("new", 1), ("new", 2), ("new", 3)]
+    assert content_provider.get_hooks() == [new_hook]
+    assert new_hook.get_callback_queue() is hook.get_callback_queue()
+    assert (new_hook.get_id(), new_hook.get_name()) == (hook.get_id(), "versioned")
+    assert not hook._running and new_hook._running
+    await content_provider.shutdown(drain=False)
+
+
 class TestComplexContentProvider:
     """Tests for ComplexContentProvider.
 
@@ -0,0 +1,129 @@
+import os
+import signal
+import sys
+import time
+import types
+
+import pytest
+
+from phf import commandinput
+from phf.supervisor import PHFSupervisor, RemoteError
+
+
+class CountHooksCommand(commandinput.Command):
+    """Command that returns amounts of hooks of all providers."""
+
+    def _apply(self, phfsys):
+        return [len(provider.get_hooks()) for provider in phfsys.get_providers()]
+
+
+class WorkerClassCommand(commandinput.Command):
+    """Command that returns object of a class, which exists only in the worker."""
+
+    def _apply(self, phfsys):
+        module = sys.modules.setdefault("worker_only", types.ModuleType("worker_only"))
+
+        class Result:
+            __module__ = "worker_only"
+            __qualname__ = "Result"
+
+            def __repr__(self):
+                return "WorkerResult"
+
+        module.Result = Result
+        return Result()
+
+
+@pytest.fixture
+def supervisor():
+    supervisor = PHFSupervisor(workers_amount=2,
+                               provider_paths=["supervisor_obj"],
+                               hook_paths=["factory_obj"],
+                               check_period=0.05)
+    yield supervisor
+    supervisor.stop()
+
+
+def test_provider_placement(supervisor):
+    assert supervisor.add_provider("counting", hooks=[("hook", [0], {})]) == 0
+    assert supervisor.add_provider("counting") == 1
+    assert supervisor.add_provider("counting", hooks=[("hook", [0], {})] * 2, worker=1) == 1
+    supervisor.start()
+
+    assert supervisor.execute_command(CountHooksCommand()) == [[1], [0, 2]]
+
+
+def test_unpicklable_result(supervisor):
+    supervisor.add_provider("counting")
+    supervisor.start()
+
+    result = supervisor.execute_command(commandinput.NewHookCommand("hook", 0, [1]), worker=0)
+    assert "Hook1" in result
+    result = supervisor.execute_command(commandinput.NewHookCommand("hook", 0, [1]), worker=1)
+    assert isinstance(result, KeyError)
+    assert supervisor.execute_command(CountHooksCommand()) == [[1], []]
+    assert supervisor.execute_command(CountHooksCommand(), worker=1) == []
+
+
+def test_result_of_worker_class(supervisor):
+    supervisor.add_provider("counting")
+    supervisor.start()
+
+    result = supervisor.execute_command(WorkerClassCommand(), worker=0)
+    assert isinstance(result, RemoteError)
+    assert "WorkerResult" in str(result)
+    assert supervisor.execute_command(CountHooksCommand(), worker=0) == [0]
+
+
+def test_command_routing(supervisor):
+    assert supervisor.get_worker_pids() == [None, None]
+    assert supervisor.get_restarts() == [0, 0]
+    with pytest.raises(RuntimeError):
+        supervisor.execute_command(CountHooksCommand())
+    supervisor.add_provider("counting")
+    supervisor.start()
+
+    with pytest.raises(ValueError):
+        supervisor.execute_command(commandinput.NewHookCommand("hook", 0, [1]))
+    with pytest.raises(ValueError):
+        supervisor.execute_command(CountHooksCommand(), worker=2)
+    assert all(pid is not None for pid in supervisor.get_worker_pids())
+
+
+def test_crashed_worker_restart(supervisor):
+    supervisor.add_provider("counting", hooks=[("hook", [0], {})])
+    supervisor.add_provider("counting")
+    supervisor.start()
+    old_pids = supervisor.get_worker_pids()
+
+    os.kill(old_pids[0], signal.SIGKILL)
+    for _ in range(100):
+        if supervisor.get_restarts()[0]:
+            break
+        time.sleep(0.05)
+
+    new_pids = supervisor.get_worker_pids()
+    assert supervisor.get_restarts() == [1, 0]
+    assert new_pids[0] != old_pids[0]
+    assert new_pids[1] == old_pids[1]
+    assert supervisor.execute_command(CountHooksCommand()) == [[1], [0]]
+
+
+def test_restart_replays_topology_commands(supervisor):
+    supervisor.add_provider("counting")
+    supervisor.add_provider("counting")
+    supervisor.start()
+    supervisor.execute_command(commandinput.NewHookCommand("hook", 0, [1]), worker=0)
+    supervisor.execute_command(commandinput.NewHookCommand("hook", 5, [1]), worker=0)
+    supervisor.execute_command(commandinput.NewHookCommand("hook", 0, [1]), worker=1)
+    assert supervisor.execute_command(CountHooksCommand()) == [[1], [1]]
+
+    os.kill(supervisor.get_worker_pids()[0], signal.SIGKILL)
+    for _ in range(100):
+        if supervisor.get_restarts()[0]:
+            break
+        time.sleep(0.05)
+
+    assert supervisor.execute_command(CountHooksCommand()) == [[1], [1]]
+    supervisor.execute_command(commandinput.NewHookCommand("hook", 0, [1]), worker=0)
+    assert supervisor.execute_command(CountHooksCommand()) == [[2], [1]]
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from phf.abstracthook import AbstractHook
+from phf.phfsystem import PHFSystem
+from phf.provider import ComplexContentProvider, PeriodicContentProvider
+from phf.tracing import PROVIDER_TID, Tracer
+
+
+class ThreadTracer(Tracer):
+    def dump(self, path=None):
+        self.dump_thread = threading.get_ident()
+        super().dump(path)
+
+
+class SleepHook(AbstractHook):
+    def __init__(self, delay, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+
+    async def hook_action(self, data):
+        await asyncio.sleep(self.delay)
+        return data
+
+
+class CountingProvider(PeriodicContentProvider):
+    def __init__(self, *args, **kwargs):
+        super().__init__(period=0.01, *args, **kwargs)
+        self.ticks = 0
+
+    async def get_content(self):
+        self.ticks += 1
+        return self.ticks
+
+    async def result_callback(self, results):
+        pass
+
+
+async def _run(phfsys, duration=0.2):
+    await phfsys.start_async()
+    await asyncio.sleep(duration)
+    await phfsys.stop_async()
+
+
+@pytest.mark.asyncio
+async def test_periodic_trace(tmp_path):
+    path = tmp_path / "trace.json"
+    phfsys = PHFSystem(tracer=Tracer(str(path)))
+    content_provider = CountingProvider()
+    fast_hook, slow_hook = SleepHook(0), SleepHook(0.02)
+    content_provider.add_hooks([fast_hook, slow_hook])
+    provider_id = phfsys.add_provider(content_provider, name="counter")
+    await _run(phfsys)
+
+    events = json.loads(path.read_text())["traceEvents"]
+    names = {(event["pid"], event["tid"]): event["args"]["name"]
+             for event in events if event["ph"] == "M"}
+    assert names[(provider_id, PROVIDER_TID)] == f"counter #{provider_id}"
+    assert names[(provider_id, slow_hook.get_id() + 1)] == f"SleepHook #{slow_hook.get_id()}"
+
+    spans = [event for event in events if event["ph"] == "X"]
+    assert {event["pid"] for event in spans} == {provider_id}
+    provider_spans = {event["name"] for event in spans if event["tid"] == PROVIDER_TID}
+    assert provider_spans == {"get_content", "gather", "result_callback"}
+
+    slow_actions = [event for event in spans if event["name"] == "hook_action"
+                    and event["tid"] == slow_hook.get_id() + 1]
+    assert slow_actions
+    assert all(event["args"]["hook"] == slow_hook.get_id() for event in slow_actions)
+    assert all(event["dur"] >= 20000 for event in slow_actions)
+    assert any(event["name"] == "queued" and event["tid"] == fast_hook.get_id() + 1
+               for event in spans)
+
+    sequences = [event["args"]["sequence"] for event in spans if event["name"] == "gather"]
+    assert sequences == sorted(sequences)
+    gather = next(event for event in spans if event["name"] == "gather")
+    assert gather["dur"] >= 20000
+
+
+@pytest.mark.asyncio
+async def test_dump_out_of_loop(tmp_path):
+    path = tmp_path / "trace.json"
+    tracer = ThreadTracer(str(path))
+    phfsys = PHFSystem(tracer=tracer)
+    content_provider = CountingProvider()
+    content_provider.add_hook(SleepHook(0))
+    phfsys.add_provider(content_provider)
+    await _run(phfsys, 0.05)
+    assert path.exists()
+    assert tracer.dump_thread != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_message_trace():
+    tracer = Tracer()
+    phfsys = PHFSystem()
+    content_provider = ComplexContentProvider()
+    content_provider.add_hook(SleepHook(0))
+    phfsys.add_provider(content_provider)
+    phfsys.set_tracer(tracer)
+    assert content_provider.get_tracer() is tracer
+    await phfsys.start_async()
+    message_system = content_provider.get_message_system()
+    assert await message_system.send_wait_answer_async("a") == ["a"]
+    assert await message_system.send_wait_answer_async("b") == ["b"]
+    await phfsys.stop_async()
+
+    messages = [event for event in tracer.get_events() if event["name"] == "message"]
+    assert [event["args"]["sequence"] for event in messages] == [1, 2]
+    assert len({event["args"]["msg_id"] for event in messages}) == 2
+    names = {event["name"] for event in tracer.get_events()}
+    assert {"preprocess_data", "postprocess_result", "hook_action"} <= names
+
+
+@pytest.mark.asyncio
+async def test_sampling_and_buffer():
+    not_sampled = Tracer(sample_rate=0)
+    bounded = Tracer(max_events=5)
+    phfsys = PHFSystem()
+    for tracer in [not_sampled, bounded]:
+        content_provider = CountingProvider()
+        content_provider.add_hook(SleepHook(0))
+        content_provider.set_tracer(tracer)
+        phfsys.add_provider(content_provider)
+    await _run(phfsys, 0.1)
+
+    assert not_sampled.get_events() == []
+    spans = [event for event in bounded.get_events() if event["ph"] == "X"]
+    assert len(spans) == 5
+    assert bounded.get_dropped() > 0
+    bounded.clear()
+    assert [event for event in bounded.get_events() if event["ph"] == "X"] == []
+
+    with pytest.raises(ValueError):
+        Tracer(sample_rate=2)
+    with pytest.raises(ValueError):
+        Tracer().dump()
@@ -0,0 +1,534 @@
+import asyncio
+import hashlib
+import os
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from phf import utils
+from phf.phfsystem import PHFSystem
+from phf.provider import ComplexContentProvider
+
+BODY = bytes(range(256)) * 1000
+
+
+class FileServer:
+    """aiohttp test server, that serves BODY with Range support.
+
+    Attributes:
+        server: TestServer.
+        failures: int, amount of next requests answered with 503.
+        drop_after: int, if set, connection of the next request is closed after that many bytes.
+        ranges: list of Range headers of all requests.
+        delay: float, how long every answer is delayed.
+        active: int, amount of requests being answered.
+        max_active: int, max amount of simultaneous requests.
+        peers: set of client addresses.
+        etag: str, ETag of BODY, requests with the same If-None-Match are answered with 304.
+        not_modified: int, amount of 304 answers.
+        always_not_modified: bool, whether all requests are answered with 304.
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.drop_after = None
+        self.ranges = []
+        self.delay = 0
+        self.active = 0
+        self.max_active = 0
+        self.peers = set()
+        self.etag = '"v1"'
+        self.not_modified = 0
+        self.always_not_modified = False
+        app = web.Application()
+        app.router.add_get("/file.bin", self.handler)
+        app.router.add_get("/missing.bin", self.missing_handler)
+        self.server = TestServer(app)
+
+    def url(self, path="/file.bin"):
+        return str(self.server.make_url(path))
+
+    async def missing_handler(self, request):
+        return web.Response(status=404)
+
+    async def handler(self, request):
+        self.ranges.append(request.headers.get("Range"))
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            return await self._answer(request)
+        finally:
+            self.active -= 1
+
+    async def _answer(self, request):
+        if self.failures:
+            self.failures -= 1
+            return web.Response(status=503)
+        if self.always_not_modified or request.headers.get("If-None-Match") == self.etag:
+            self.not_modified += 1
+            return web.Response(status=304)
+        start = 0
+        status = 200
+        headers = {"ETag": self.etag}
+        if "Range" in request.headers:
+            start = int(request.headers["Range"][len("bytes="):].rstrip("-"))
+            if start >= len(BODY):
+                return web.Response(status=416,
+                                    headers={"Content-Range": f"bytes */{len(BODY)}"})
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{len(BODY) - 1}/{len(BODY)}"
+        body = BODY[start:]
+        headers["Content-Length"] = str(len(body))
+        resp = web.StreamResponse(status=status, headers=headers)
+        await resp.prepare(request)
+        if self.drop_after is not None:
+            await resp.write(body[:self.drop_after])
+            self.drop_after = None
+            # Let the client read the part before the connection is lost
+            await asyncio.sleep(0.1)
+            request.transport.close()
+            return resp
+        await resp.write(body)
+        await resp.write_eof()
+        return resp
+
+
+@pytest_asyncio.fixture
+async def server():
+    """Yield running FileServer."""
+    file_server = FileServer()
+    await file_server.server.start_server()
+    yield file_server
+    await file_server.server.close()
+
+
+async def _download(server, path, semaphore=None, url="/file.bin", **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    async with aiohttp.ClientSession() as session:
+        return await utils.download_one_file(server.url(url), str(path), session,
+                                             semaphore or asyncio.Semaphore(1), **kwargs)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [1000, utils.DEFAULT_CHUNK_SIZE, len(BODY) * 2])
+async def test_chunked_download(server, tmp_path, chunk_size):
+    path = tmp_path / "dir" / "file.bin"
+    result = await _download(server, path, chunk_size=chunk_size, checksum="sha256")
+    assert result.ok
+    assert result.path == str(path)
+    assert result.size == len(BODY)
+    assert path.read_bytes() == BODY
+    assert result.digest == hashlib.sha256(BODY).hexdigest()
+    assert os.listdir(tmp_path / "dir") == ["file.bin"]
+
+
+@pytest.mark.asyncio
+async def test_download_files(server, tmp_path):
+    (tmp_path / "a.bin").write_bytes(b"old")
+    paths = [str(tmp_path / "a.bin"), str(tmp_path / "b.bin")]
+    results = await utils.download_files([server.url(), server.url()], paths, checksum="md5")
+    assert [result.digest for result in results] == [hashlib.md5(BODY).hexdigest()] * 2
+    assert (tmp_path / "a.bin").read_bytes() == b"old"
+    assert (tmp_path / "a(1).bin").read_bytes() == BODY
+    assert (tmp_path / "b.bin").read_bytes() == BODY
+
+
+@pytest.mark.asyncio
+async def test_retry(server, tmp_path):
+    server.failures = 2
+    result = await _download(server, tmp_path / "file.bin")
+    assert result.ok
+    assert result.attempts == 3
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+
+
+@pytest.mark.asyncio
+async def test_retries_exhausted(server, tmp_path):
+    server.failures = 10
+    semaphore = asyncio.Semaphore(1)
+    result = await _download(server, tmp_path / "file.bin", semaphore, retries=2)
+    assert not result.ok
+    assert result.attempts == 3
+    assert result.path is None
+    assert "503" in str(result.error)
+    assert not semaphore.locked()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("checksum", [None, "sha1"])
+async def test_resume_after_drop(server, tmp_path, checksum):
+    server.drop_after = len(BODY) // 3
+    result = await _download(server, tmp_path / "file.bin", checksum=checksum)
+    assert result.ok
+    assert result.attempts == 2
+    assert server.ranges[0] is None
+    assert server.ranges[1].startswith("bytes=") and server.ranges[1] != "bytes=0-"
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+    if checksum is not None:
+        assert result.digest == hashlib.sha1(BODY).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_resume_existing_part(server, tmp_path):
+    path = str(tmp_path / "file.bin")
+    with open(utils._part_path(server.url(), path), "wb") as f:
+        f.write(BODY[:1000])
+    result = await _download(server, tmp_path / "file.bin", checksum="md5")
+    assert result.ok
+    assert server.ranges == ["bytes=1000-"]
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+    assert result.digest == hashlib.md5(BODY).hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_complete_part(server, tmp_path):
+    path = str(tmp_path / "file.bin")
+    with open(utils._part_path(server.url(), path), "wb") as f:
+        f.write(BODY)
+    result = await _download(server, tmp_path / "file.bin")
+    assert result.ok
+    assert result.size == len(BODY)
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+
+
+@pytest.mark.asyncio
+async def test_part_of_other_url(server, tmp_path):
+    path = str(tmp_path / "file.bin")
+    with open(utils._part_path(server.url("/other.bin"), path), "wb") as f:
+        f.write(b"other")
+    result = await _download(server, path)
+    assert result.ok
+    assert server.ranges == [None]
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+
+
+@pytest.mark.asyncio
+async def test_same_path_at_once(server, tmp_path):
+    server.delay = 0.05
+    results = await asyncio.gather(*[_download(server, tmp_path / "file.bin")
+                                     for _ in range(3)])
+    assert all(result.ok for result in results)
+    assert sorted(result.path for result in results) == [
+        str(tmp_path / name) for name in ("file(1).bin", "file(2).bin", "file.bin")]
+    assert all((tmp_path / name).read_bytes() == BODY for name in os.listdir(tmp_path))
+    assert server.ranges == [None] * 3
+    assert not utils._reserved_paths
+
+
+@pytest.mark.asyncio
+async def test_errors_are_per_file(server, tmp_path):
+    semaphore = asyncio.Semaphore(1)
+    not_found = await _download(server, tmp_path / "missing.bin", semaphore, url="/missing.bin")
+    assert isinstance(not_found.error, aiohttp.ClientResponseError)
+    assert not_found.attempts == 1
+    assert not semaphore.locked()
+
+    results = await utils.download_files([server.url("/missing.bin"), server.url()],
+                                         [str(tmp_path / "x.bin"), str(tmp_path / "y.bin")],
+                                         backoff=0.01)
+    assert [result.ok for result in results] == [False, True]
+    assert (tmp_path / "y.bin").read_bytes() == BODY
+
+
+@pytest.mark.asyncio
+async def test_downloader_reuses_connections(server, tmp_path):
+    async with utils.Downloader(max_downloads=1) as downloader:
+        for i in range(5):
+            result = await downloader.download(server.url(), str(tmp_path / f"{i}.bin"))
+            assert result.ok
+        session = downloader._get_session()
+        results = await downloader.download_many([server.url()] * 2,
+                                                 [str(tmp_path / "x.bin"), str(tmp_path / "y.bin")])
+        assert [result.ok for result in results] == [True, True]
+        assert downloader._get_session() is session
+    assert len(server.peers) == 1
+    assert session.closed
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_downloads, max_downloads_per_host, expected", [
+    (10, 2, 4),
+    (3, 2, 3),
+    (10, 0, 8),
+])
+async def test_downloader_limits(server, tmp_path, max_downloads, max_downloads_per_host,
+                                 expected):
+    server.delay = 0.05
+    port = server.server.port
+    urls = [f"http://127.0.0.1:{port}/file.bin", f"http://localhost:{port}/file.bin"] * 4
+    paths = [str(tmp_path / f"{i}.bin") for i in range(len(urls))]
+    async with utils.Downloader(max_downloads=max_downloads,
+                                max_downloads_per_host=max_downloads_per_host) as downloader:
+        results = await downloader.download_many(urls, paths)
+        assert all(result.ok for result in results)
+        assert not downloader._semaphore.locked()
+    assert server.max_active == expected
+
+
+@pytest.mark.asyncio
+async def test_downloader_other_loop(server, tmp_path):
+    downloader = utils.Downloader()
+    await downloader.download(server.url(), str(tmp_path / "a.bin"))
+
+    def _download_in_other_loop():
+        return asyncio.run(downloader.download(server.url(), str(tmp_path / "b.bin")))
+
+    with pytest.raises(RuntimeError):
+        await asyncio.get_running_loop().run_in_executor(None, _download_in_other_loop)
+    await downloader.close()
+
+
+@pytest.mark.asyncio
+async def test_store(server, tmp_path):
+    store = utils.ContentStore(str(tmp_path / "store"))
+    port = server.server.port
+    async with utils.Downloader(store=store) as downloader:
+        first = await downloader.download(server.url(), str(tmp_path / "a.bin"))
+        assert first.ok and not first.cached
+        assert first.digest == hashlib.sha256(BODY).hexdigest()
+        blob_path = store.blob_path(first.digest)
+        assert os.path.samefile(tmp_path / "a.bin", blob_path)
+
+        # The same url is requested conditionally, the same path is replaced
+        second = await downloader.download(server.url(), str(tmp_path / "a.bin"))
+        third = await downloader.download(server.url(), str(tmp_path / "b.bin"))
+        assert second.cached and third.cached
+        assert second.path == str(tmp_path / "a.bin")
+        assert server.not_modified == 2
+        assert os.path.samefile(tmp_path / "b.bin", blob_path)
+        assert not (tmp_path / "a(1).bin").exists()
+
+        # Other url with the same content shares the blob
+        other = await downloader.download(f"http://localhost:{port}/file.bin",
+                                          str(tmp_path / "c.bin"))
+        assert not other.cached
+        assert os.path.samefile(tmp_path / "c.bin", blob_path)
+
+        server.etag = '"v2"'
+        changed = await downloader.download(server.url(), str(tmp_path / "a.bin"))
+        assert changed.ok and not changed.cached
+    assert (tmp_path / "a.bin").read_bytes() == BODY
+    assert os.listdir(tmp_path / "store" / "blobs" / first.digest[:2]) == [first.digest]
+    assert os.listdir(tmp_path / "store" / "parts") == []
+
+    loaded = utils.ContentStore(str(tmp_path / "store"))
+    assert loaded.get_entry(server.url())["etag"] == '"v2"'
+    assert loaded.conditional_headers(server.url()) == {"If-None-Match": '"v2"'}
+
+
+@pytest.mark.asyncio
+async def test_store_same_url_at_once(server, tmp_path):
+    store = utils.ContentStore(str(tmp_path / "store"))
+    assert store.part_path(server.url()) != store.part_path(server.url())
+    server.delay = 0.05
+    async with utils.Downloader(store=store) as downloader:
+        results = await asyncio.gather(*[
+            downloader.download(server.url(), str(tmp_path / f"{number}.bin"))
+            for number in range(4)])
+    assert all(result.ok for result in results)
+    assert all((tmp_path / f"{number}.bin").read_bytes() == BODY for number in range(4))
+    assert os.listdir(tmp_path / "store" / "parts") == []
+
+
+@pytest.mark.asyncio
+async def test_unexpected_not_modified(server, tmp_path):
+    server.always_not_modified = True
+    result = await _download(server, tmp_path / "a.bin")
+    assert isinstance(result.error, aiohttp.ClientError)
+    assert not (tmp_path / "a.bin").exists()
+
+    store = utils.ContentStore(str(tmp_path / "store"))
+    result = await _download(server, tmp_path / "b.bin", store=store)
+    assert isinstance(result.error, aiohttp.ClientError)
+    assert os.listdir(tmp_path / "store" / "parts") == []
+
+
+@pytest.mark.asyncio
+async def test_store_entry_evicted(server, tmp_path, monkeypatch):
+    store = utils.ContentStore(str(tmp_path / "store"))
+    # Headers made before the entry was evicted
+    monkeypatch.setattr(store, "conditional_headers", lambda url: {"If-None-Match": server.etag})
+    result = await _download(server, tmp_path / "a.bin", store=store)
+    assert result.ok and not result.cached
+    assert server.not_modified == 1 and result.attempts == 2
+    assert (tmp_path / "a.bin").read_bytes() == BODY
+
+
+@pytest.mark.parametrize("failing, linked", [
+    ([], "hardlink"),
+    (["link"], "symlink"),
+    (["link", "symlink"], "copy"),
+])
+def test_store_link_fallback(tmp_path, monkeypatch, failing, linked):
+    store = utils.ContentStore(str(tmp_path / "store"))
+    (tmp_path / "file").write_bytes(BODY)
+    digest = hashlib.sha256(BODY).hexdigest()
+    store.add("http://example.com/file", str(tmp_path / "file"), digest, len(BODY))
+
+    def _fail(*args):
+        raise OSError("not supported")
+
+    for name in failing:
+        monkeypatch.setattr(os, name, _fail)
+    target = tmp_path / "target"
+    target.write_bytes(b"old")
+    store.link(digest, str(target))
+    assert target.read_bytes() == BODY
+    assert target.is_symlink() == (linked == "symlink")
+    assert os.path.samefile(target, store.blob_path(digest)) == (linked != "copy")
+    assert not (tmp_path / "target.link").exists()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket():
+    bucket = utils.TokenBucket(rate=100000, burst=10000)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await bucket.consume(10000)
+    assert loop.time() - start < 0.05
+    await asyncio.gather(bucket.consume(5000), bucket.consume(5000))
+    assert loop.time() - start >= 0.09
+    with pytest.raises(ValueError):
+        utils.TokenBucket(0)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kwargs", [
+    {"max_bytes_per_second": len(BODY) * 2},
+    {"max_bytes_per_second_per_host": len(BODY) * 2},
+])
+async def test_downloader_bandwidth(server, tmp_path, kwargs):
+    paths = [str(tmp_path / f"{i}.bin") for i in range(3)]
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    async with utils.Downloader(chunk_size=10000, **kwargs) as downloader:
+        results = await downloader.download_many([server.url()] * 3, paths)
+    # The burst covers 2 files, the third one takes half a second
+    assert loop.time() - start >= 0.45
+    assert max(result.metrics.throttle_time for result in results) >= 0.4
+    assert all((tmp_path / f"{i}.bin").read_bytes() == BODY for i in range(3))
+
+
+@pytest.mark.asyncio
+async def test_metrics(server, tmp_path):
+    server.delay = 0.05
+    async with utils.Downloader(max_downloads=1, backoff=0.01) as downloader:
+        results = await downloader.download_many([server.url()] * 2 + [server.url("/missing.bin")],
+                                                 [str(tmp_path / f"{i}.bin") for i in range(3)])
+        metrics = results[1].metrics
+        assert metrics.bytes == len(BODY)
+        assert metrics.ttfb >= 0.05
+        assert metrics.wait_time >= 0.05
+        assert metrics.duration >= metrics.ttfb + metrics.wait_time
+        assert metrics.bytes_per_second == pytest.approx(len(BODY) / metrics.duration)
+        assert set(metrics.as_dict()) == {"bytes", "duration", "ttfb", "wait_time",
+                                          "throttle_time", "bytes_per_second"}
+
+        totals = downloader.get_metrics()
+    assert totals["downloads"] == 3
+    assert totals["failed"] == 1
+    assert totals["answered"] == 3
+    assert totals["bytes"] == 2 * len(BODY)
+    assert totals["active"] == 0
+    assert totals["wait_time"] == pytest.approx(sum(r.metrics.wait_time for r in results))
+    assert totals["mean_ttfb"] == pytest.approx(sum(r.metrics.ttfb for r in results) / 3)
+    assert totals["busy_time"] <= totals["duration"]
+    assert totals["bytes_per_second"] == pytest.approx(totals["bytes"] / totals["busy_time"])
+
+
+async def _start_hook(hook):
+    """Start hook's cycle and return it's task."""
+    task = asyncio.ensure_future(hook.cycle_call())
+    await asyncio.sleep(0)
+    return task
+
+
+@pytest.mark.asyncio
+async def test_download_hook(server, tmp_path):
+    async with utils.Downloader() as downloader:
+        hook = utils.DownloadHook(str(tmp_path), downloader, checksum="md5")
+        task = await _start_hook(hook)
+        in_queue, out_queue = hook.get_straight_queue(), hook.get_callback_queue()
+
+        in_queue.put_nowait(server.url())
+        result = await out_queue.get()
+        assert isinstance(result, utils.DownloadResult)
+        assert result.path == str(tmp_path / "file.bin")
+        assert result.digest == hashlib.md5(BODY).hexdigest()
+
+        in_queue.put_nowait([(server.url(), str(tmp_path / "a.bin")),
+                             {"url": server.url(), "path": str(tmp_path / "b.bin")}])
+        results = await out_queue.get()
+        assert [result.path for result in results] == [str(tmp_path / "a.bin"),
+                                                       str(tmp_path / "b.bin")]
+        assert all(result.ok for result in results)
+
+        in_queue.put_nowait(42)
+        assert isinstance(await out_queue.get(), TypeError)
+
+        hook.stop()
+        await asyncio.wait_for(task, 5)
+        assert downloader.get_metrics()["downloads"] == 3
+
+
+def test_download_hook_options():
+    with pytest.raises(TypeError):
+        utils.DownloadHook(checksum="md5", chunk=1024)
+    with pytest.raises(ValueError):
+        utils.DownloadHook(pipeline_depth=0)
+
+
+@pytest.mark.asyncio
+async def test_download_hook_pipeline(server, tmp_path):
+    server.delay = 0.1
+    hook = utils.DownloadHook(str(tmp_path), pipeline_depth=3)
+    task = await _start_hook(hook)
+    paths = [str(tmp_path / f"{i}.bin") for i in range(6)]
+    for path in paths:
+        hook.get_straight_queue().put_nowait((server.url(), path))
+    hook.stop(drain=True)
+    await asyncio.wait_for(task, 5)
+    results = [hook.get_callback_queue().get_nowait() for _ in paths]
+    assert [result.path for result in results] == paths
+    assert server.max_active == 3
+
+
+@pytest.mark.asyncio
+async def test_download_hook_shared_downloader(server, tmp_path):
+    hooks = [utils.DownloadHook(str(tmp_path)) for _ in range(2)]
+    tasks = [await _start_hook(hook) for hook in hooks]
+    downloader = hooks[0].get_downloader()
+    assert downloader is hooks[1].get_downloader()
+    hooks[0].get_straight_queue().put_nowait((server.url(), str(tmp_path / "a.bin")))
+    hooks[1].get_straight_queue().put_nowait((server.url(), str(tmp_path / "b.bin")))
+    assert (await hooks[0].get_callback_queue().get()).ok
+    assert (await hooks[1].get_callback_queue().get()).ok
+
+    hooks[0].stop()
+    await tasks[0]
+    assert not downloader._session.closed
+    hooks[1].stop()
+    await tasks[1]
+    assert downloader._session is None
+    assert asyncio.get_running_loop() not in utils.DownloadHook._shared_downloaders
+
+
+@pytest.mark.asyncio
+async def test_download_hook_in_system(server, tmp_path):
+    phfsys = PHFSystem()
+    content_provider = ComplexContentProvider()
+    content_provider.add_hook(utils.DownloadHook(str(tmp_path)))
+    phfsys.add_provider(content_provider)
+    await phfsys.start_async()
+    try:
+        results = await content_provider.get_message_system().send_wait_answer_async(
+            [server.url(), (server.url(), str(tmp_path / "copy.bin"))])
+    finally:
+        await phfsys.stop_async()
+    assert [result.path for result in results[0]] == [str(tmp_path / "file.bin"),
+                                                      str(tmp_path / "copy.bin")]
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from phf.abstracthook import AbstractHook
+from phf.phfsystem import PHFSystem
+from phf.provider import PeriodicContentProvider
+from phf.watchdog import LoopWatchdog
+
+
+class BlockingHook(AbstractHook):
+    async def hook_action(self, data):
+        time.sleep(0.3)
+        return data
+
+
+class BlockingProvider(PeriodicContentProvider):
+    def __init__(self, *args, **kwargs):
+        super().__init__(period=0.05, *args, **kwargs)
+        self.ticks = 0
+
+    async def get_content(self):
+        self.ticks += 1
+        if self.ticks == 2:
+            time.sleep(0.3)
+        return self.ticks
+
+
+class FastHook(AbstractHook):
+    async def hook_action(self, data):
+        return data
+
+
+@pytest.mark.asyncio
+async def test_names_blocking_hook():
+    phfsys = PHFSystem()
+    content_provider = BlockingProvider()
+    hook = BlockingHook()
+    content_provider.add_hooks([FastHook(), hook])
+    phfsys.add_provider(content_provider)
+    phfsys.enable_watchdog(threshold=0.1)
+    await phfsys.start_async()
+    await asyncio.sleep(0.8)
+    await phfsys.stop_async(drain=False)
+
+    events = phfsys.get_slow_steps()
+    hook_events = [event for event in events if event.owner_kind == "hook"]
+    assert hook_events
+    assert {event.owner_class for event in hook_events} == {"BlockingHook"}
+    assert hook_events[0].owner_id == hook.get_id()
+    assert hook_events[0].loop_name == "main"
+    assert hook_events[0].finished
+    assert 0.2 <= hook_events[0].duration < 1
+    assert any("time.sleep(0.3)" in line for line in hook_events[0].stack)
+
+    provider_events = [event for event in events if event.owner_kind == "provider"]
+    assert [event.owner_class for event in provider_events] == ["BlockingProvider"]
+    assert "get_content" in "".join(provider_events[0].stack)
+    assert "phf_loop_lag_seconds{loop=\"main\"}" in phfsys.get_metrics()
+
+
+@pytest.mark.asyncio
+async def test_shards():
+    phfsys = PHFSystem(shards_amount=2)
+    content_provider = BlockingProvider()
+    phfsys.add_provider(content_provider, shard=1)
+    phfsys.enable_watchdog(threshold=0.1)
+    await phfsys.start_async()
+    await asyncio.sleep(0.5)
+    assert set(phfsys.get_loop_lags()) == {"main", "shard-0", "shard-1"}
+    await phfsys.stop_async(drain=False)
+
+    events = phfsys.get_slow_steps()
+    assert [(event.loop_name, event.owner_class) for event in events] == \
+           [("shard-1", "BlockingProvider")]
+    phfsys.disable_watchdog()
+    assert phfsys.get_slow_steps() == [] and phfsys.get_loop_lags() == {}
+
+
+@pytest.mark.asyncio
+async def test_lag_without_owner():
+    watchdog = LoopWatchdog(threshold=0.05)
+    watchdog.start()
+    await asyncio.sleep(0.1)
+    assert not watchdog.get_events()
+    time.sleep(0.2)
+    await asyncio.sleep(0.1)
+    watchdog.stop()
+
+    events = watchdog.get_events()
+    assert len(events) == 1 and events[0].owner_kind == "unknown"
+    assert events[0].owner_class is None
+    assert watchdog.get_max_lag() >= 0.15
+    watchdog.clear_events()
+    assert watchdog.get_events() == []
+    with pytest.raises(ValueError):
+        LoopWatchdog(threshold=0)